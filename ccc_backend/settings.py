@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -87,6 +88,42 @@ DATABASES = {
     }
 }
 
+# Profil SQLite de production (DJANGO_DB_PROFILE=production) :
+# PRAGMAs WAL & co. appliqués par core.db.apply_sqlite_pragmas, connexions
+# persistantes, et lectures routées vers une connexion en lecture seule.
+# Mesure : python manage.py benchmark_sqlite
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'default')
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',       # lecteurs et écrivain ne se bloquent plus
+    'synchronous': 'NORMAL',     # sûr en WAL, évite un fsync par transaction
+    'busy_timeout': 5000,        # attendre le verrou d'écriture (ms) au lieu d'échouer
+    'cache_size': -65536,        # 64 Mo de cache de pages (valeur négative = Kio)
+    'mmap_size': 268435456,      # 256 Mo lus via mmap
+    'temp_store': 'MEMORY',
+}
+SQLITE_PRAGMAS = {}
+DATABASE_READ_ALIASES = ()
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # BEGIN IMMEDIATE : le verrou d'écriture est pris au début de la
+        # transaction, busy_timeout s'applique au lieu d'un "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 5},
+    })
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'uri': True, 'timeout': 5},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_READ_ALIASES = ('replica',)
+    DATABASE_ROUTERS = ['core.db.ReadReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,10 +167,25 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
 MIDDLEWARE.insert(0, 'corsheaders.middleware.CorsMiddleware')
+# En tête de chaîne : la latence mesurée couvre tous les middlewares
+MIDDLEWARE.insert(0, 'core.metrics.RequestMetricsMiddleware')
+
+# Instrumentation (core.metrics) : en-tête Server-Timing, seuil du journal
+# des requêtes lentes (logger core.slow_requests, None pour le couper) et
+# jeton du scraper Prometheus pour /metrics (sinon réservé au staff)
+SERVER_TIMING_HEADER = True
+SLOW_REQUEST_THRESHOLD_MS = 500
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication avec utilisateur et rôles en cache (core.authentication)
+        'core.authentication.CachedJWTAuthentication',
+    ),
+    # Rendu JSON par orjson s'il est installé (core.renderers)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,  # Nombre d’éléments par page
@@ -149,5 +201,59 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),                 # format d’en-tête attendu
 }
 
+# Sous ASGI (uvicorn ccc_backend.asgi:application) : lectures fréquentes servies
+# par les vues asynchrones de core.async_views
+ASYNC_HOT_PATHS = os.environ.get('DJANGO_ASYNC_HOT_PATHS') == '1'
+
+# Diffusion des événements temps réel (core.events) : LocalBackend pour un
+# seul processus ASGI, UnixSocketBackend pour plusieurs workers sur la machine
+EVENTS_BACKEND = os.environ.get('DJANGO_EVENTS_BACKEND', 'core.events.LocalBackend')
+EVENTS_SOCKET_DIR = BASE_DIR / 'var' / 'events'
+
+# Cache en mémoire des utilisateurs authentifiés (core.authentication)
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 300
+
+# Processus de hachage des mots de passe pour l'import en masse (None : nombre de CPU)
+PROVISIONING_WORKERS = None
+# Import par l'API (POST /api/users/import/) : un pool par processus web,
+# réutilisé d'une requête à l'autre et limité à ce nombre de processus
+PROVISIONING_API_WORKERS = 2
+
+# Cache des réponses news (core.caching). Avec LocMemCache (propre au
+# processus), la génération du cache est lue en base à chaque réponse pour
+# que les invalidations des autres processus (workers, planificateur,
+# outbox) soient vues ; avec un backend partagé (Redis, Memcached), elle
+# reste dans le cache. NEWS_CACHE_GENERATION_STORE force 'database' ou 'cache'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+NEWS_CACHE_TIMEOUT = 300
+NEWS_CACHE_GENERATION_STORE = None
+
+# Vues de news en écriture différée (core.viewbuffer) : nécessite la commande
+# `flush_view_buffer` en tâche de fond ; le buffer (segments et vues en attente)
+# est dans VIEW_BUFFER_DIR, commun à tous les processus de l'hôte. Lus à l'appel.
+NEWS_VIEW_WRITE_BEHIND = False
+VIEW_BUFFER_DIR = BASE_DIR / 'var' / 'view_buffer'
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Téléchargement des pièces jointes délégué au serveur web :
+# 'X-Accel-Redirect' (nginx, location interne ATTACHMENT_ACCEL_PREFIX -> MEDIA_ROOT)
+# ou 'X-Sendfile' (Apache mod_xsendfile). None : Django envoie le fichier par morceaux.
+ATTACHMENT_SENDFILE_HEADER = os.environ.get('ATTACHMENT_SENDFILE_HEADER') or None
+ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
+# Miniatures / aperçus PDF générés en arrière-plan (Pillow, poppler-utils pour les PDF)
+ATTACHMENT_DERIVATIVES = True
+DERIVATIVE_WORKERS = 2
+
+# OneSignal : URL de l'API (un serveur factice pour les tests de charge),
+# nombre de batches envoyés en parallèle et nouvelles tentatives sur 429
+ONESIGNAL_API_URL = os.environ.get('ONESIGNAL_API_URL', 'https://api.onesignal.com/notifications')
+ONESIGNAL_MAX_CONCURRENCY = 8
+ONESIGNAL_MAX_RETRIES = 3
@@ -0,0 +1,259 @@
+"""
+Versions asynchrones (ASGI) des endpoints de lecture les plus appelés.
+
+Activées par ASYNC_HOT_PATHS (voir core.urls) quand le projet tourne sous
+un serveur ASGI (uvicorn, daphne) : une requête en attente de la base ou
+du cache ne bloque plus un thread. Les réponses sont identiques à celles
+des vues DRF ; les cas rares (recherche, pagination par numéro de page,
+écritures sur /news/) sont délégués aux vues synchrones.
+"""
+import asyncio
+import json
+import posixpath
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+from .authentication import (
+    STREAM_TOKEN_COOKIE, STREAM_TOKEN_LIFETIME, CachedJWTAuthentication, StreamToken, StreamTokenAuthentication,
+)
+from .caching import acached_news_response
+from .events import EVENTS_KEEPALIVE, EVENTS_RETRY_MS, get_broker, program_topic
+from .fastserializers import NewsRowSerializer, get_sparse_fields
+from .filters import filter_news_queryset
+from .models import News, Subscription
+from .pagination import KeysetPagination
+from .renderers import ORJSONRenderer
+from .serializers import NewsSerializer, RoleSerializer
+from .viewbuffer import get_unread_count_with_pending, store_news_view, unread_news_with_pending
+from .views import NewsViewSet, unread_news
+
+authenticator = CachedJWTAuthentication()
+stream_authenticator = StreamTokenAuthentication()
+
+sync_news_list = NewsViewSet.as_view({'get': 'list', 'post': 'create'})
+sync_news_detail = NewsViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+})
+
+
+def api_response(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(ORJSONRenderer().render(data), status=status_code, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def api_error(exc):
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers['WWW-Authenticate'] = authenticator.authenticate_header(None)
+        exc.status_code = status.HTTP_401_UNAUTHORIZED
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return api_response(detail, exc.status_code, headers)
+
+
+def async_api_view(methods, authenticated=True, fallback=None, authentication=authenticator):
+    """
+    Équivalent asynchrone de @api_view + @permission_classes.
+
+    - authentification JWT via le cache de core.authentication
+      (`authentication` : autre classe, ex. token du flux SSE)
+    - `authenticated` : IsAuthenticated (sinon AllowAny)
+    - `fallback` : vue synchrone appelée pour les autres méthodes HTTP
+
+    La vue reçoit une Request DRF (query_params, data, user).
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                if fallback is not None:
+                    return await sync_to_async(fallback)(request, *args, **kwargs)
+                return api_error(exceptions.MethodNotAllowed(request.method))
+
+            drf_request = Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()])
+            try:
+                result = await authentication.aauthenticate(request)
+            except exceptions.APIException as exc:
+                return api_error(exc)
+            if result is None and authenticated:
+                return api_error(exceptions.NotAuthenticated())
+            if result is not None:
+                drf_request.user, drf_request.auth = result
+            return await view(drf_request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def serializer_context(request):
+    return {'request': request, 'format': None, 'view': None}
+
+
+@async_api_view(['GET'], authenticated=False, fallback=sync_news_list)
+@acached_news_response
+async def news_list_async(request):
+    paginator = KeysetPagination()
+    if paginator.uses_fallback(request):
+        # ?search=, ?page= ou tri hors keyset : vue DRF (FTS5, PageNumberPagination)
+        return await sync_to_async(sync_news_list)(request._request)
+
+    try:
+        serializer = NewsRowSerializer(get_sparse_fields(request), serializer_context(request))
+    except exceptions.ValidationError as exc:
+        return api_error(exc)
+    queryset = filter_news_queryset(News.objects.all(), request.query_params)
+    page = await paginator.apaginate_queryset(serializer.values(queryset, *paginator.keyset_fields), request)
+    return {
+        'next': paginator.get_next_link(),
+        'results': await sync_to_async(serializer.serialize)(page),
+    }
+
+
+@async_api_view(['GET'], authenticated=False, fallback=sync_news_detail)
+@acached_news_response
+async def news_detail_async(request, pk):
+    queryset = filter_news_queryset(
+        News.objects.select_related('program', 'author').prefetch_related('attachments'),
+        request.query_params,
+    )
+    news = await queryset.filter(pk=pk).afirst()
+    if news is None:
+        return api_response({'detail': 'No News matches the given query.'}, status.HTTP_404_NOT_FOUND)
+    return NewsSerializer(news, context=serializer_context(request)).data
+
+
+@async_api_view(['GET'])
+async def current_user_async(request):
+    user = request.user
+    return api_response({
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "roles": RoleSerializer(user.cached_roles, many=True).data,
+    })
+
+
+@async_api_view(['GET'])
+async def unread_news_async(request):
+    paginator = KeysetPagination()
+    if paginator.uses_fallback(request):
+        return await sync_to_async(unread_news)(request._request)
+
+    try:
+        serializer = NewsRowSerializer(get_sparse_fields(request))
+    except exceptions.ValidationError as exc:
+        return api_error(exc)
+    user = request.user
+    unread = serializer.values(unread_news_with_pending(user), *paginator.keyset_fields)
+    page = await paginator.apaginate_queryset(unread, request)
+    return api_response({
+        'next': paginator.get_next_link(),
+        'results': await sync_to_async(serializer.serialize)(page),
+        'unread_count': await sync_to_async(get_unread_count_with_pending)(user),
+    })
+
+
+@async_api_view(['POST'])
+async def mark_news_viewed_async(request, news_id):
+    news = await News.objects.filter(id=news_id).afirst()
+    if news is None:
+        return api_response({'error': 'News not found'}, status.HTTP_404_NOT_FOUND)
+    # Écriture (transaction, signaux) dans le thread de la base
+    created = await sync_to_async(store_news_view)(request.user, news)
+    return api_response({'viewed': True, 'created': created})
+
+
+def format_sse(event_type, data, event_id=None):
+    lines = [f"event: {event_type}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+async def stream_news_events(user, program_ids):
+    """
+    Flux SSE d'un client : « ready » (compteur de non lues), puis un
+    événement par news publiée ou dé-validée dans ses programmes.
+
+    L'abonnement est pris avant de lire le compteur : aucune validation
+    ne peut tomber entre les deux. Un commentaire est envoyé toutes les
+    EVENTS_KEEPALIVE secondes pour garder la connexion ouverte à travers
+    les proxies. Si le client ne suit pas, « resync » lui demande de
+    relire /news/unread/ et le flux se ferme.
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(program_topic(program_id) for program_id in program_ids)
+    try:
+        unread_count = await sync_to_async(get_unread_count_with_pending)(user)
+        yield f"retry: {EVENTS_RETRY_MS}\n" + format_sse('ready', {
+            'programs': sorted(program_ids),
+            'unread_count': unread_count,
+        })
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event['type'] == 'resync':
+                yield format_sse('resync', {})
+                return
+            yield format_sse(event['type'], event['data'], event['id'])
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@async_api_view(['POST'])
+async def news_stream_token_async(request):
+    """
+    Token court pour ouvrir /news/stream/ depuis EventSource, renvoyé dans
+    la réponse (?token=) et posé en cookie HttpOnly limité au flux.
+    """
+    token = str(StreamToken.for_user(request.user))
+    lifetime = int(STREAM_TOKEN_LIFETIME.total_seconds())
+    response = api_response({'token': token, 'expires_in': lifetime})
+    # Cookie envoyé au seul flux : /api/news/stream/token/ -> /api/news/stream/
+    response.set_cookie(
+        STREAM_TOKEN_COOKIE, token, max_age=lifetime, path=posixpath.dirname(request.path.rstrip('/')) + '/',
+        secure=request.is_secure(), httponly=True, samesite='Lax',
+    )
+    return response
+
+
+@async_api_view(['GET'], authentication=stream_authenticator)
+async def news_stream_async(request):
+    """
+    Flux temps réel (Server-Sent Events) des news des programmes suivis.
+
+    Authentification par en-tête, ou par le token de /news/stream/token/
+    (?token= ou cookie) pour EventSource. ?program_id=1,2 restreint le flux
+    à une partie des abonnements. Le polling de /news/unread/ reste le mode
+    dégradé (reconnexion, resync).
+    """
+    program_ids = {
+        program_id async for program_id in
+        Subscription.objects.filter(user=request.user).values_list('program_id', flat=True)
+    }
+    requested = request.query_params.get('program_id')
+    if requested:
+        try:
+            program_ids &= {int(value) for value in requested.split(',')}
+        except ValueError:
+            return api_response({'error': 'program_id invalide'}, status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        stream_news_events(request.user, program_ids),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # nginx : ne pas bufferiser le flux
+    response['X-Accel-Buffering'] = 'no'
+    return response
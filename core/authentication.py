@@ -0,0 +1,207 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .models import UserRole
+
+# Cache en mémoire de processus : chaque worker a le sien. L'invalidation par
+# signaux ne touche que le processus courant, le TTL borne le retard des autres.
+AUTH_USER_CACHE_SIZE = getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+AUTH_USER_CACHE_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 300)
+# Token des clients EventSource, qui ne peuvent pas envoyer d'en-tête Authorization
+STREAM_TOKEN_LIFETIME = getattr(settings, 'STREAM_TOKEN_LIFETIME', timedelta(minutes=2))
+STREAM_TOKEN_PARAM = 'token'
+STREAM_TOKEN_COOKIE = 'stream_token'
+
+
+class TTLLRUCache:
+    """
+    Dictionnaire borné : éviction LRU au-delà de maxsize, entrées expirées après ttl secondes.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+user_cache = TTLLRUCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL)
+
+
+def load_user_entry(user_id):
+    """
+    Utilisateur et rôles depuis le cache, ou depuis la base (2 requêtes) en cas d'absence.
+    
+    Returns:
+        tuple | None: (user, roles) ou None si l'utilisateur n'existe pas
+    """
+    entry = user_cache.get(user_id)
+    if entry is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+        roles = [user_role.role for user_role in UserRole.objects.filter(user_id=user_id).select_related('role')]
+        entry = (user, roles)
+        user_cache.set(user_id, entry)
+    return entry
+
+
+async def aload_user_entry(user_id):
+    """
+    load_user_entry avec l'ORM asynchrone (vues ASGI).
+    """
+    entry = user_cache.get(user_id)
+    if entry is None:
+        user = await User.objects.filter(pk=user_id).afirst()
+        if user is None:
+            return None
+        roles = [user_role.role async for user_role in UserRole.objects.filter(user_id=user_id).select_related('role')]
+        entry = (user, roles)
+        user_cache.set(user_id, entry)
+    return entry
+
+
+def get_user_roles(user):
+    """
+    Rôles (objets Role) d'un utilisateur, sans requête si le cache est chaud.
+    """
+    roles = getattr(user, 'cached_roles', None)
+    if roles is None:
+        entry = load_user_entry(user.pk)
+        roles = entry[1] if entry else []
+    return roles
+
+
+def invalidate_user(user_id):
+    user_cache.delete(user_id)
+
+
+def invalidate_all_users():
+    user_cache.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication sans requête par appel : l'utilisateur et ses rôles
+    viennent d'un LRU en mémoire, invalidé à chaque changement de User,
+    UserRole ou Role (voir core.signals).
+
+    Les rôles ne sont pas copiés dans le token : ceux du cache suivent les
+    changements de UserRole, un claim resterait figé jusqu'à l'expiration.
+    """
+
+    def get_user_id(self, validated_token):
+        try:
+            return int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def get_user(self, validated_token):
+        return self.user_from_entry(load_user_entry(self.get_user_id(validated_token)), validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() pour les vues asynchrones : seule la lecture de
+        l'utilisateur (cache froid) touche la base, via l'ORM asynchrone.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        entry = await aload_user_entry(self.get_user_id(validated_token))
+        return self.user_from_entry(entry, validated_token), validated_token
+
+    def user_from_entry(self, entry, validated_token):
+        """
+        Mêmes contrôles que JWTAuthentication.get_user (utilisateur actif,
+        token révoqué par un changement de mot de passe avec CHECK_REVOKE_TOKEN).
+        """
+        if entry is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        cached_user, roles = entry
+        if api_settings.CHECK_USER_IS_ACTIVE and not cached_user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(cached_user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # Copie profonde : une vue qui modifie request.user (ou ses rôles,
+        # son cache de relations) ne touche pas l'entrée partagée
+        user, roles = copy.deepcopy((cached_user, roles))
+        user.cached_roles = roles
+        return user
+
+
+class StreamToken(Token):
+    """
+    Token court réservé au flux SSE (/news/stream/), seul accepté dans
+    l'URL ou le cookie : un token d'accès n'y finit pas dans les journaux.
+    """
+    token_type = 'stream'
+    lifetime = STREAM_TOKEN_LIFETIME
+
+
+class StreamTokenAuthentication(CachedJWTAuthentication):
+    """
+    Authentification du flux SSE : en-tête Authorization s'il est présent,
+    sinon StreamToken dans ?token= ou le cookie stream_token (EventSource
+    ne sait pas envoyer d'en-tête). Le token n'est vérifié qu'à l'ouverture
+    du flux ; le client en redemande un avant de se reconnecter.
+    """
+
+    async def aauthenticate(self, request):
+        if self.get_header(request) is not None:
+            return await super().aauthenticate(request)
+        raw_token = request.GET.get(STREAM_TOKEN_PARAM) or request.COOKIES.get(STREAM_TOKEN_COOKIE)
+        if not raw_token:
+            return None
+        try:
+            validated_token = StreamToken(raw_token)
+        except TokenError as exc:
+            raise InvalidToken({'detail': str(exc)})
+        entry = await aload_user_entry(self.get_user_id(validated_token))
+        return self.user_from_entry(entry, validated_token), validated_token
@@ -0,0 +1,488 @@
+"""
+Jeu de données synthétique, charges scriptées et serveur OneSignal factice
+pour la commande `benchmark_api`.
+
+Chaque charge rejoue une route de core.urls à travers toute la pile Django
+(middlewares, authentification JWT, vues, sérialisation) avec le client de
+test ; les tirages aléatoires ont une graine fixe : deux exécutions sur le même
+jeu de données envoient les mêmes requêtes.
+"""
+import asyncio
+import io
+import itertools
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from . import utils
+from .models import (
+    Attachment,
+    News,
+    NewsStats,
+    NewsView,
+    NotificationPref,
+    Program,
+    PushSubscription,
+    ReadState,
+    Subscription,
+)
+from .onesignal_async import AsyncOneSignalClient, send_news_notification_async
+from .unread import rebuild_read_states
+
+# Mot de passe de tous les comptes générés (route /api/token/)
+BENCHMARK_PASSWORD = 'bench-password'
+# Nombre d'utilisateurs distincts dont les requêtes sont rejouées
+BENCHMARK_ACTIVE_USERS = 100
+# Répartition des préférences de notification (immediate, daily, weekly)
+BENCHMARK_FREQUENCY_WEIGHTS = (70, 20, 10)
+# Requêtes mesurées au plus pour les routes qui hachent un mot de passe
+SLOW_WORKLOAD_REQUESTS = 20
+# Taille (octets) des pièces jointes générées
+BENCHMARK_ATTACHMENT_SIZE = 64 * 1024
+# Mots des titres et contenus, pour que ?search= trouve des résultats
+BENCHMARK_WORDS = (
+    'examen', 'partiel', 'soutenance', 'stage', 'rentrée', 'emploi', 'salle',
+    'projet', 'bourse', 'inscription', 'conférence', 'bibliothèque', 'jury',
+)
+
+DEFAULT_DATASET = {
+    'programs': 20,
+    'users': 2000,
+    'subscriptions': 3,
+    'news': 5000,
+    'attachments': 500,
+    'views': 50000,
+}
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(BENCHMARK_WORDS) for _ in range(words))
+
+
+def generate_dataset(programs, users, subscriptions, news, attachments, views, seed=0):
+    """
+    Remplit la base courante (bulk_create) et reconstruit les données
+    dérivées que les signaux maintiennent d'habitude : NewsStats, ReadState.
+
+    Les pièces jointes passent par Attachment.save() (stockage par contenu) ;
+    elles réutilisent 10 contenus distincts, comme des documents partagés
+    entre plusieurs news.
+
+    Returns:
+        dict: ids et jetons utilisés par les charges
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    program_objs = Program.objects.bulk_create([
+        Program(name=f"Programme {i}", code=f"BENCH{i}") for i in range(programs)
+    ])
+    program_ids = [program.pk for program in program_objs]
+
+    password = make_password(BENCHMARK_PASSWORD)  # hash unique : les comptes partagent le mot de passe
+    user_objs = User.objects.bulk_create([
+        User(username=f"bench{i}", email=f"bench{i}@example.com", password=password)
+        for i in range(users)
+    ])
+    admin = User.objects.create_superuser('bench-admin', 'bench-admin@example.com', BENCHMARK_PASSWORD)
+    user_ids = [user.pk for user in user_objs]
+
+    subscription_pairs = [
+        (user_id, program_id)
+        for user_id in user_ids
+        for program_id in rng.sample(program_ids, min(subscriptions, len(program_ids)))
+    ]
+    Subscription.objects.bulk_create([Subscription(user_id=u, program_id=p) for u, p in subscription_pairs])
+    ReadState.objects.bulk_create([ReadState(user_id=u, program_id=p) for u, p in subscription_pairs])
+    NotificationPref.objects.bulk_create([
+        NotificationPref(
+            user_id=user_id,
+            frequency=rng.choices(('immediate', 'daily', 'weekly'), BENCHMARK_FREQUENCY_WEIGHTS)[0],
+        )
+        for user_id in user_ids
+    ])
+    PushSubscription.objects.bulk_create([
+        PushSubscription(user_id=user_id, external_user_id=f"bench-{user_id}") for user_id in user_ids
+    ])
+
+    news_objs = []
+    for i in range(news):
+        approved = rng.random() < 0.8
+        moderated_at = now - timedelta(minutes=rng.randrange(60 * 24 * 30)) if approved else None
+        news_objs.append(News(
+            author_id=rng.choice(user_ids),
+            program_id=rng.choice(program_ids),
+            title_draft=random_text(rng, 4),
+            title_final=random_text(rng, 4) if approved else '',
+            content_draft=random_text(rng, 40),
+            content_final=random_text(rng, 40) if approved else '',
+            importance=rng.choice(('faible', 'moyenne', 'haute')),
+            moderator_approved=approved,
+            moderator=admin if approved else None,
+            moderated_at=moderated_at,
+            publish_date_effective=timezone.localdate(moderated_at) if approved else None,
+        ))
+    news_objs = News.objects.bulk_create(news_objs)
+    news_ids = [item.pk for item in news_objs]
+    approved_ids = [item.pk for item in news_objs if item.moderator_approved]
+    pending_ids = [item.pk for item in news_objs if not item.moderator_approved]
+    # Déjà créées par le trigger SQLite de core_news (migration 0019)
+    NewsStats.objects.bulk_create([NewsStats(news_id=news_id) for news_id in news_ids], ignore_conflicts=True)
+
+    payloads = [rng.randbytes(BENCHMARK_ATTACHMENT_SIZE) for _ in range(10)]
+    attachment_ids = []
+    for i in range(attachments):
+        attachment = Attachment(news_id=rng.choice(news_ids))
+        attachment.file = SimpleUploadedFile(f"document{i}.bin", rng.choice(payloads), 'application/octet-stream')
+        attachment.save()
+        attachment_ids.append(attachment.pk)
+
+    if approved_ids:
+        pairs = {(rng.choice(user_ids), rng.choice(approved_ids)) for _ in range(views)}
+        NewsView.objects.bulk_create(
+            [NewsView(user_id=u, news_id=n) for u, n in pairs], batch_size=5000, ignore_conflicts=True,
+        )
+        counts = NewsView.objects.values('news_id').annotate(total=Count('pk'))
+        NewsStats.objects.bulk_update(
+            [NewsStats(news_id=row['news_id'], views_count=row['total']) for row in counts],
+            ['views_count'], batch_size=5000,
+        )
+    rebuild_read_states()
+
+    # Fan-out : news validée du programme qui a le plus d'abonnés
+    audience = Counter(program_id for _, program_id in subscription_pairs)
+    largest = max(program_ids, key=lambda program_id: audience[program_id])
+    fanout_news_id = max((item.pk for item in news_objs if item.moderator_approved and item.program_id == largest),
+                         default=None)
+
+    active = rng.sample(user_objs, min(BENCHMARK_ACTIVE_USERS, len(user_objs)))
+    return {
+        'program_ids': program_ids,
+        'program_codes': [program.code for program in program_objs],
+        'user_ids': user_ids,
+        'usernames': [user.username for user in active],
+        'news_ids': news_ids,
+        'approved_ids': approved_ids,
+        'pending_ids': pending_ids or news_ids,
+        'attachment_ids': attachment_ids,
+        'tokens': [str(AccessToken.for_user(user)) for user in active],
+        'admin_token': str(AccessToken.for_user(admin)),
+        'fanout_news_id': fanout_news_id,
+    }
+
+
+class Workload:
+    """
+    Une route rejouée en boucle.
+
+    `path` et `body` sont des valeurs ou des fonctions (dataset, rng, i) ;
+    `auth` : 'user' (jeton tiré parmi les utilisateurs actifs), 'admin' ou None ;
+    `max_requests` plafonne les routes lentes par nature (hachage de mots de passe).
+    """
+
+    def __init__(self, name, method, path, body=None, auth='user', multipart=False, max_requests=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.auth = auth
+        self.multipart = multipart
+        self.max_requests = max_requests
+
+    def resolve(self, value, dataset, rng, i):
+        return value(dataset, rng, i) if callable(value) else value
+
+    def request(self, client, dataset, rng, i):
+        path = self.resolve(self.path, dataset, rng, i)
+        headers = {}
+        if self.auth == 'user':
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {rng.choice(dataset['tokens'])}"
+        elif self.auth == 'admin':
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {dataset['admin_token']}"
+
+        if self.method == 'get':
+            response = client.get(path, **headers)
+        else:
+            body = self.resolve(self.body, dataset, rng, i)
+            if self.multipart:
+                response = getattr(client, self.method)(path, body, **headers)
+            else:
+                response = getattr(client, self.method)(
+                    path, json.dumps(body), content_type='application/json', **headers
+                )
+        if response.streaming:
+            b''.join(response.streaming_content)  # téléchargement : lire tout le fichier
+        return response.status_code < 400
+
+
+class FanoutWorkload:
+    """
+    Fan-out OneSignal d'une news validée du plus gros programme, vers le
+    serveur factice (envoi synchrone ou client asyncio).
+    """
+
+    max_requests = None
+
+    def __init__(self, name, mode, stub):
+        self.name = name
+        self.mode = mode
+        self.stub = stub
+
+    def request(self, client, dataset, rng, i):
+        news = News.objects.get(pk=dataset['fanout_news_id'])
+        # Les envois affichent un résumé par batch : hors du rapport
+        with redirect_stdout(io.StringIO()):
+            if self.mode == 'async':
+                success, errors = asyncio.run(self.send_async(news))
+            else:
+                success, errors = utils.send_news_notification(news)
+        return errors == 0
+
+    async def send_async(self, news):
+        async with AsyncOneSignalClient(url=self.stub.url, headers=utils.ONESIGNAL_HEADERS) as client:
+            return await send_news_notification_async(news, client)
+
+
+def pick(key):
+    return lambda dataset, rng, i: rng.choice(dataset[key])
+
+
+def build_workloads(stub=None):
+    """
+    Une charge par route de core.urls (lecture et écriture) ; les
+    suppressions sont exclues pour garder le jeu de données stable.
+    """
+    workloads = [
+        Workload('news-list', 'get', '/api/news/'),
+        Workload('news-list-program', 'get', lambda d, rng, i: f"/api/news/?program={rng.choice(d['program_ids'])}"),
+        Workload('news-list-page', 'get', lambda d, rng, i: f"/api/news/?page={rng.randint(1, 20)}"),
+        Workload('news-list-sparse', 'get', lambda d, rng, i: (
+            f"/api/news/?program={rng.choice(d['program_ids'])}&fields=id,title_final,importance,created_at"
+        )),
+        Workload('news-search', 'get', lambda d, rng, i: f"/api/news/?search={rng.choice(BENCHMARK_WORDS)}"),
+        Workload('news-detail', 'get', lambda d, rng, i: f"/api/news/{rng.choice(d['news_ids'])}/"),
+        Workload('news-pending', 'get', '/api/news/pending/'),
+        Workload('news-approved', 'get', '/api/news/approved/'),
+        Workload('news-rejected', 'get', '/api/news/rejected/'),
+        Workload('news-create', 'post', '/api/news/', lambda d, rng, i: {
+            'program': rng.choice(d['program_ids']),
+            'title_draft': random_text(rng, 4),
+            'content_draft': random_text(rng, 40),
+        }),
+        Workload('news-update', 'patch', lambda d, rng, i: f"/api/news/{rng.choice(d['news_ids'])}/update/",
+                 lambda d, rng, i: {'title_final': random_text(rng, 4)}, auth='admin'),
+        Workload('news-moderate', 'post', '/api/news/moderate/', lambda d, rng, i: {
+            'news_ids': rng.sample(d['pending_ids'], min(20, len(d['pending_ids']))),
+            'approved': rng.random() < 0.5,
+        }, auth='admin'),
+        Workload('news-unread', 'get', '/api/news/unread/'),
+        Workload('news-unread-count', 'get', '/api/news/unread/count/'),
+        Workload('news-view', 'post', lambda d, rng, i: f"/api/news/{rng.choice(d['approved_ids'])}/view/", {}),
+        Workload('news-view-bulk', 'post', '/api/news/view/', lambda d, rng, i: {
+            'news_ids': rng.sample(d['approved_ids'], min(20, len(d['approved_ids']))),
+        }),
+        Workload('news-views', 'get', '/api/news/views/'),
+        Workload('news-views-detail', 'get', lambda d, rng, i: f"/api/news/{rng.choice(d['approved_ids'])}/views/"),
+        Workload('attachment-download', 'get',
+                 lambda d, rng, i: f"/api/attachments/{rng.choice(d['attachment_ids'])}/download/"),
+        Workload('me', 'get', '/api/me/'),
+        Workload('signup', 'post', '/api/signup/', lambda d, rng, i: {
+            'username': f"signup-{i}-{rng.getrandbits(32)}", 'password': BENCHMARK_PASSWORD,
+        }, auth=None, max_requests=SLOW_WORKLOAD_REQUESTS),
+        Workload('token', 'post', '/api/token/', lambda d, rng, i: {
+            'username': rng.choice(d['usernames']), 'password': BENCHMARK_PASSWORD,
+        }, auth=None, max_requests=SLOW_WORKLOAD_REQUESTS),
+        Workload('register-push', 'post', '/api/register_push/', lambda d, rng, i: {
+            'external_user_id': f"push-{i}-{rng.getrandbits(32)}",
+        }),
+        Workload('users-import', 'post', '/api/users/import/', lambda d, rng, i: {
+            'file': SimpleUploadedFile('users.ndjson', ''.join(
+                json.dumps({'username': f"import-{i}-{n}-{rng.getrandbits(32)}", 'password': BENCHMARK_PASSWORD}) + '\n'
+                for n in range(10)
+            ).encode(), 'application/x-ndjson'),
+        }, auth='admin', multipart=True, max_requests=SLOW_WORKLOAD_REQUESTS),
+    ]
+    # Routes du router : liste et détail
+    for resource, key in (
+        ('users', 'user_ids'), ('roles', None), ('userroles', None), ('programs', 'program_ids'),
+        ('subscriptions', None), ('moderations', None), ('attachments', 'attachment_ids'), ('logs', None),
+        ('notifications', None), ('push_subscriptions', None), ('news_views', None),
+    ):
+        workloads.append(Workload(f"{resource}-list", 'get', f"/api/{resource}/"))
+        if key:
+            workloads.append(Workload(
+                f"{resource}-detail", 'get',
+                lambda d, rng, i, resource=resource, key=key: f"/api/{resource}/{rng.choice(d[key])}/",
+            ))
+    if stub is not None:
+        workloads += [FanoutWorkload('fanout-sync', 'sync', stub), FanoutWorkload('fanout-async', 'async', stub)]
+    return workloads
+
+
+def percentile(latencies, q):
+    """
+    Percentile par rang le plus proche sur une liste triée.
+    """
+    if not latencies:
+        return None
+    return latencies[max(0, math.ceil(q * len(latencies)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': to_ms(statistics.fmean(latencies)) if latencies else None,
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p95_ms': to_ms(percentile(latencies, 0.95)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+        'max_ms': to_ms(latencies[-1]) if latencies else None,
+    }
+
+
+def run_workload(workload, dataset, requests, warmup=5, concurrency=1, seed=0):
+    """
+    Rejoue `requests` requêtes (après `warmup` non mesurées) sur
+    `concurrency` threads, chacun avec son client et sa connexion.
+
+    Returns:
+        dict: voir summarize()
+    """
+    requests = min(requests, workload.max_requests or requests)
+    rng = random.Random(f"{seed}-{workload.name}-warmup")
+    client = Client()
+    for i in range(warmup):
+        workload.request(client, dataset, rng, i)
+
+    counter = itertools.count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(f"{seed}-{workload.name}-{worker_id}")
+        client = Client()
+        local_latencies, local_errors = [], 0
+        try:
+            while (i := next(counter)) < requests:
+                started = time.perf_counter()
+                try:
+                    ok = workload.request(client, dataset, rng, i)
+                except Exception:
+                    ok = False
+                if ok:
+                    local_latencies.append(time.perf_counter() - started)
+                else:
+                    local_errors += 1
+        finally:
+            if worker_id:
+                connections.close_all()  # connexions propres au thread
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(1, concurrency)]
+    for thread in threads:
+        thread.start()
+    worker(0)
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, sum(errors), time.perf_counter() - started)
+
+
+def compare_results(current, baseline, threshold=0.10):
+    """
+    Compare deux exécutions route par route.
+
+    Une régression : p95 plus lent ou débit plus faible de plus de
+    `threshold` (fraction) par rapport à la référence.
+
+    Returns:
+        list[dict]: name, p95_change, throughput_change, regression
+    """
+    rows = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if not reference or not reference['p95_ms'] or not result['p95_ms'] or not reference['throughput']:
+            continue
+        p95_change = result['p95_ms'] / reference['p95_ms'] - 1
+        throughput_change = result['throughput'] / reference['throughput'] - 1
+        rows.append({
+            'name': name,
+            'p95_change': round(p95_change, 4),
+            'throughput_change': round(throughput_change, 4),
+            'regression': p95_change > threshold or throughput_change < -threshold,
+        })
+    return rows
+
+
+class StubOneSignalServer:
+    """
+    Serveur HTTP local qui répond comme l'API OneSignal (200 + id), avec
+    une latence configurable ; compte les appels et les destinataires.
+
+    Tant qu'il tourne, utils.ONESIGNAL_API_URL pointe vers lui.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.recipients = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, comme l'API réelle
+            # En-têtes et corps en un seul envoi (sinon Nagle + ACK retardé : ~40 ms)
+            wbufsize = -1
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub.lock:
+                    stub.requests += 1
+                    stub.recipients += len(payload.get('include_external_user_ids', []))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = json.dumps({'id': f"stub-{stub.requests}"}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/notifications"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.patcher = mock.patch.object(utils, 'ONESIGNAL_API_URL', self.url)
+        self.patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
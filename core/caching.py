@@ -0,0 +1,202 @@
+import hashlib
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.http import HttpResponse, HttpResponseBase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from .models import CacheGeneration
+from .renderers import ORJSONRenderer
+
+# Durée de vie des réponses en cache (secondes) ; l'invalidation est explicite
+NEWS_CACHE_TIMEOUT = getattr(settings, 'NEWS_CACHE_TIMEOUT', 300)
+NEWS_CACHE_GENERATION_KEY = 'news-cache:generation'
+NEWS_CACHE_GENERATION_NAME = 'news'
+# Backends propres au processus : une invalidation faite ailleurs (autre
+# worker, planificateur, outbox, import) ne les atteindrait pas
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def generation_in_database():
+    """
+    True si la génération est gardée en base (CacheGeneration) plutôt que
+    dans le cache : NEWS_CACHE_GENERATION_STORE = 'database' ou 'cache' ;
+    par défaut en base si le cache n'est pas partagé entre processus.
+    """
+    store = getattr(settings, 'NEWS_CACHE_GENERATION_STORE', None)
+    if store is not None:
+        return store == 'database'
+    return isinstance(caches['default'], LOCAL_CACHE_BACKENDS)
+
+
+def new_generation(now):
+    return (int(now.timestamp() * 1000), now.timestamp())
+
+
+def get_news_generation():
+    """
+    Génération courante du cache des news et date de la dernière modification.
+    
+    Changer de génération invalide d'un coup toutes les réponses et tous
+    les ETags, sans avoir à connaître les clés déjà en cache. Avec un cache
+    local au processus, la génération est lue en base (une requête par
+    réponse) pour que toutes les invalidations soient vues.
+    """
+    if generation_in_database():
+        current = (
+            CacheGeneration.objects.filter(name=NEWS_CACHE_GENERATION_NAME)
+            .values_list('generation', 'modified').first()
+        )
+        if current is None:
+            generation, modified = new_generation(timezone.now())
+            row, _ = CacheGeneration.objects.get_or_create(
+                name=NEWS_CACHE_GENERATION_NAME, defaults={'generation': generation, 'modified': modified}
+            )
+            current = (row.generation, row.modified)
+        return current
+
+    current = cache.get(NEWS_CACHE_GENERATION_KEY)
+    if current is None:
+        current = new_generation(timezone.now())
+        cache.add(NEWS_CACHE_GENERATION_KEY, current, None)
+        current = cache.get(NEWS_CACHE_GENERATION_KEY, current)
+    return current
+
+
+async def aget_news_generation():
+    """
+    get_news_generation pour les vues asynchrones.
+    """
+    if generation_in_database():
+        return await sync_to_async(get_news_generation)()
+
+    current = await cache.aget(NEWS_CACHE_GENERATION_KEY)
+    if current is None:
+        current = new_generation(timezone.now())
+        await cache.aadd(NEWS_CACHE_GENERATION_KEY, current, None)
+        current = await cache.aget(NEWS_CACHE_GENERATION_KEY, current)
+    return current
+
+
+def invalidate_news_cache():
+    """
+    À appeler après toute écriture sur News, Attachment ou Moderation
+    (fait par les signaux ; les update()/bulk_create() doivent l'appeler).
+    
+    La nouvelle génération part au moins de l'horodatage courant : une
+    génération remise à zéro ne retombe pas sur des clés déjà en cache.
+    """
+    now = timezone.now()
+    if generation_in_database():
+        fresh, modified = new_generation(now)
+        row = CacheGeneration.objects.filter(name=NEWS_CACHE_GENERATION_NAME)
+        bump = lambda: row.update(generation=Greatest(F('generation') + 1, Value(fresh)), modified=modified)
+        if not bump():
+            _, created = CacheGeneration.objects.get_or_create(
+                name=NEWS_CACHE_GENERATION_NAME, defaults={'generation': fresh, 'modified': modified}
+            )
+            if not created:
+                bump()
+        return
+
+    generation, _ = get_news_generation()
+    cache.set(NEWS_CACHE_GENERATION_KEY, (max(generation + 1, int(now.timestamp() * 1000)), now.timestamp()), None)
+
+
+def build_news_cache_key(request, generation):
+    scope = 'auth' if request.user and request.user.is_authenticated else 'anon'
+    params = sorted(request.query_params.lists())
+    raw = f"{generation}|{scope}|{request.path}|{params}"
+    return 'news-cache:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def cached_news_response(method):
+    """
+    Met en cache la réponse d'une action GET de NewsViewSet.
+    
+    - Clé : génération du cache + chemin + paramètres + portée (anonyme/connecté)
+    - ETag dérivé de la clé, Last-Modified depuis News.updated_at (détail)
+      ou la dernière invalidation (listes) ; If-None-Match / If-Modified-Since
+      donnent un 304 sans toucher à la base.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        generation, modified = get_news_generation()
+        key = build_news_cache_key(request, generation)
+        etag = quote_etag(key.split(':', 1)[1])
+
+        cached = cache.get(key)
+        if cached is not None:
+            data, last_modified = cached
+            if not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(data)
+        else:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            updated_at = parse_datetime(response.data.get('updated_at') or '')
+            last_modified = updated_at.timestamp() if updated_at else modified
+            cache.set(key, (response.data, last_modified), NEWS_CACHE_TIMEOUT)
+            if not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
+
+
+def acached_news_response(view):
+    """
+    cached_news_response pour les vues asynchrones de core.async_views.
+    
+    La vue retourne les données (dict) ou une réponse d'erreur. Clés, ETag
+    et contenu sont les mêmes que côté synchrone : les deux implémentations
+    partagent le cache.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        generation, modified = await aget_news_generation()
+        key = build_news_cache_key(request, generation)
+        etag = quote_etag(key.split(':', 1)[1])
+
+        cached = await cache.aget(key)
+        if cached is None:
+            data = await view(request, *args, **kwargs)
+            if isinstance(data, HttpResponseBase):
+                return data
+            updated_at = parse_datetime(data.get('updated_at') or '')
+            cached = (data, updated_at.timestamp() if updated_at else modified)
+            await cache.aset(key, cached, NEWS_CACHE_TIMEOUT)
+
+        data, last_modified = cached
+        if not_modified(request, etag, last_modified):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(ORJSONRenderer().render(data), content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
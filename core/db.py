@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import connections
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Handler de connection_created : applique settings.SQLITE_PRAGMAS aux
+    connexions SQLite, plus query_only sur les alias en lecture seule.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if connection.alias in getattr(settings, 'DATABASE_READ_ALIASES', ()):
+        # journal_mode ne peut pas être modifié par une connexion en lecture seule
+        pragmas.pop('journal_mode', None)
+        pragmas['query_only'] = 'ON'
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class ReadReplicaRouter:
+    """
+    Lectures sur un alias en lecture seule, écritures sur 'default'.
+    
+    Dans une transaction ouverte sur 'default', les lectures y restent :
+    une connexion séparée ne verrait pas les écritures non commitées.
+    """
+    read_alias = 'replica'
+
+    def db_for_read(self, model, **hints):
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return self.read_alias
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Même fichier SQLite derrière les deux alias
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
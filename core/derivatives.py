@@ -0,0 +1,184 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Dérivés générés pour chaque pièce jointe image/PDF : nom -> boîte maximale (px)
+DERIVATIVE_SPECS = {
+    'thumbnail': (320, 320),
+    'preview': (1280, 1280),
+}
+DERIVATIVE_QUALITY = 80
+
+_pool = None
+_pool_lock = threading.Lock()
+# Outils de rendu absents déjà signalés par ce processus
+_missing_renderers_logged = set()
+
+
+def derivative_name(source_key, kind):
+    """
+    Chemin (relatif à MEDIA_ROOT) d'un dérivé.
+    
+    La clé ne dépend que du contenu source (SHA-256 du blob) et de la
+    taille demandée : deux pièces jointes identiques partagent leurs dérivés
+    et un changement de taille ne réutilise pas d'anciens fichiers.
+    """
+    width, height = DERIVATIVE_SPECS[kind]
+    return f"derivatives/{source_key[:2]}/{source_key}-{kind}-{width}x{height}.jpg"
+
+
+def attachment_source_key(attachment):
+    # Pièces jointes historiques sans blob : pas de dérivé (voir migrate_attachment_blobs)
+    return attachment.blob_id
+
+
+def is_derivable(mime):
+    return mime.startswith('image/') or mime == 'application/pdf'
+
+
+def get_derivative_url(attachment, kind):
+    """
+    URL du dérivé s'il existe déjà sur disque, sinon None.
+    """
+    return derivative_url(attachment_source_key(attachment), attachment.mime, kind)
+
+
+def derivative_url(source_key, mime, kind):
+    """
+    get_derivative_url à partir des colonnes (lignes .values(), voir core.fastserializers).
+    """
+    if not source_key or not is_derivable(mime):
+        return None
+    name = derivative_name(source_key, kind)
+    if not (Path(settings.MEDIA_ROOT) / name).exists():
+        return None
+    return settings.MEDIA_URL + name
+
+
+def missing_renderer(mime):
+    """
+    Outil de rendu absent pour ce type de fichier (Pillow pour les images,
+    pdftoppm de poppler-utils pour les PDF), ou None.
+    """
+    if mime == 'application/pdf':
+        return None if shutil.which('pdftoppm') else 'pdftoppm (poppler-utils)'
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return 'Pillow'
+    return None
+
+
+def log_missing_renderer(renderer):
+    # Une fois par processus : chaque pièce jointe concernée le rappellerait
+    if renderer not in _missing_renderers_logged:
+        _missing_renderers_logged.add(renderer)
+        logger.warning("%s introuvable : pièces jointes servies sans miniature ni aperçu", renderer)
+
+
+def render_image(source, target, size):
+    from PIL import Image, ImageOps  # dépendance optionnelle (Pillow)
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size)
+        image.convert('RGB').save(target, 'JPEG', quality=DERIVATIVE_QUALITY, optimize=True)
+
+
+def render_pdf_page(source, target, size):
+    # Première page via poppler (pdftoppm), sans charger le PDF dans Python
+    base = str(target) + '.page'
+    subprocess.run(
+        ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+         '-scale-to', str(max(size)), str(source), base],
+        check=True, capture_output=True, timeout=60,
+    )
+    os.replace(base + '.jpg', target)
+
+
+def generate_derivatives(media_root, source_name, source_key, mime):
+    """
+    Génère les dérivés manquants d'un fichier source.
+    
+    Exécuté dans un processus du pool : ne reçoit que des chemins et
+    n'accède pas à la base. Chaque dérivé est écrit dans un fichier
+    temporaire puis renommé, un lecteur ne voit jamais de fichier partiel.
+    
+    Returns:
+        list: noms des dérivés générés
+    """
+    renderer = missing_renderer(mime)
+    if renderer:
+        log_missing_renderer(renderer)
+        return []
+    render = render_pdf_page if mime == 'application/pdf' else render_image
+
+    source = Path(media_root) / source_name
+    generated = []
+    for kind, size in DERIVATIVE_SPECS.items():
+        target = Path(media_root) / derivative_name(source_key, kind)
+        if target.exists():
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix='.jpg')
+        os.close(fd)
+        try:
+            render(source, tmp_path, size)
+            os.replace(tmp_path, target)
+            generated.append(target.name)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    return generated
+
+
+def get_derivative_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn : les workers n'héritent ni des connexions DB ni des threads
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'DERIVATIVE_WORKERS', 2),
+                mp_context=get_context('spawn'),
+            )
+        return _pool
+
+
+def log_failure(future):
+    error = future.exception()
+    if error:
+        logger.warning("Génération de dérivés échouée : %s", error)
+
+
+def schedule_derivatives(attachment):
+    """
+    Soumet la génération des dérivés au pool, après le commit.
+    
+    Tant que les fichiers n'existent pas, le serializer renvoie l'URL
+    de l'original.
+    """
+    source_key = attachment_source_key(attachment)
+    if not getattr(settings, 'ATTACHMENT_DERIVATIVES', True):
+        return
+    if not source_key or not is_derivable(attachment.mime):
+        return
+    renderer = missing_renderer(attachment.mime)
+    if renderer:
+        log_missing_renderer(renderer)
+        return
+    args = (str(settings.MEDIA_ROOT), attachment.file.name, source_key, attachment.mime)
+
+    def submit():
+        get_derivative_pool().submit(generate_derivatives, *args).add_done_callback(log_failure)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,203 @@
+from collections import Counter, defaultdict
+from itertools import groupby
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import DigestItem, PublicationLog, PushSubscription
+from .outbox import OUTBOX_MAX_ATTEMPTS, compute_backoff
+from .utils import (
+    AUDIENCE_CHUNK_SIZE,
+    ONESIGNAL_HEADERS,
+    ONESIGNAL_MAX_IDS_PER_REQUEST,
+    BatchProgress,
+    NotificationBatch,
+    build_digest_content,
+    dispatch_notification_batches,
+)
+
+# Destinataires en attente d'envoi gardés en mémoire, toutes tranches confondues
+DIGEST_MAX_BUFFERED = 10 * ONESIGNAL_MAX_IDS_PER_REQUEST
+
+def digest_audience_queryset(frequency, program_ids):
+    """
+    Lignes (external_user_id, program_id) des destinataires d'un digest,
+    triées par external_user_id pour pouvoir être regroupées en flux.
+    """
+    return (
+        PushSubscription.objects.filter(
+            user__subscription__program_id__in=program_ids,
+            user__notificationpref__push_enabled=True,
+            user__notificationpref__frequency=frequency,
+        )
+        .order_by('external_user_id')
+        .values_list('external_user_id', 'user__subscription__program_id')
+    )
+
+
+def iter_digest_audience(frequency, program_ids, chunk_size=AUDIENCE_CHUNK_SIZE):
+    return digest_audience_queryset(frequency, program_ids).iterator(chunk_size=chunk_size)
+
+
+def slice_key(program_ids):
+    """
+    Clé d'une tranche : ses programmes, triés ("1,4,7").
+    """
+    return ','.join(map(str, sorted(program_ids)))
+
+
+def iter_digest_batches(rows, frequency, progress, content_for):
+    """
+    Regroupe le flux (external_user_id, program_id), trié par
+    external_user_id, en batches par tranche.
+    
+    Tous les utilisateurs d'une même tranche (ensemble de programmes
+    suivis) reçoivent exactement les mêmes news : un seul message pour eux.
+    Chaque tranche a son tampon, vidé à ONESIGNAL_MAX_IDS_PER_REQUEST ; au
+    delà de DIGEST_MAX_BUFFERED destinataires en mémoire, la tranche la plus
+    remplie part sans attendre. Les destinataires déjà servis par une
+    tentative précédente (`progress`) sont sautés.
+    
+    Yields:
+        NotificationBatch: batch d'une tranche, clé = slice_key
+    """
+    buffers = {}
+    batch_nums = Counter()
+    buffered = 0
+
+    def flush(key):
+        nonlocal buffered
+        batch = buffers.pop(key)
+        buffered -= len(batch)
+        batch_nums[key] += 1
+        return NotificationBatch(
+            batch, None, f"digest {frequency} [{key}] #{batch_nums[key]}", content=content_for(key), key=key
+        )
+
+    for external_id, program_rows in groupby(rows, key=lambda row: row[0]):
+        key = slice_key({program_id for _, program_id in program_rows})
+        if progress.is_sent(key, external_id):
+            continue
+        buffers.setdefault(key, []).append(external_id)
+        buffered += 1
+        if len(buffers[key]) >= ONESIGNAL_MAX_IDS_PER_REQUEST:
+            yield flush(key)
+        elif buffered > DIGEST_MAX_BUFFERED:
+            yield flush(max(buffers, key=lambda key: len(buffers[key])))
+
+    for key in list(buffers):
+        yield flush(key)
+
+
+def send_digest(frequency, window_end, items):
+    """
+    Envoie le digest d'une fenêtre.
+    
+    Les batches acceptés sont enregistrés au fil de l'envoi
+    (DigestItem.sent_batches) : après un échec, le digest est reprogrammé
+    avec le backoff de l'outbox et la tentative suivante n'envoie qu'aux
+    destinataires restants. Les entrées ne sont marquées envoyées, avec
+    leur PublicationLog, qu'une fois tous les batches passés, ou après
+    OUTBOX_MAX_ATTEMPTS tentatives (last_error garde alors l'échec).
+    
+    Les entrées dont la news a été dé-validée ou invalidée depuis leur
+    ajout sont supprimées sans PublicationLog : une nouvelle validation
+    remet la news dans le digest de la fenêtre alors en cours.
+    
+    Returns:
+        tuple: (success_count, error_count) de cette tentative
+    """
+    stale_ids = [item.pk for item in items if not item.news.moderator_approved or item.news.invalidated]
+    if stale_ids:
+        DigestItem.objects.filter(pk__in=stale_ids).delete()
+        items = [item for item in items if item.pk not in stale_ids]
+        print(f"🗑️ Digest {frequency} ({window_end:%Y-%m-%d %H:%M}) : "
+              f"{len(stale_ids)} news retirées depuis leur ajout")
+        if not items:
+            return 0, 0
+
+    news_by_program = defaultdict(list)
+    for item in items:
+        news_by_program[item.program_id].append(item.news)
+
+    def slice_news(key):
+        return sorted(
+            (news for program_id in key.split(',') for news in news_by_program.get(int(program_id), ())),
+            key=lambda news: news.created_at,
+        )
+
+    contents = {}
+
+    def content_for(key):
+        if key not in contents:
+            contents[key] = build_digest_content(slice_news(key))
+        return contents[key]
+
+    item_ids = [item.pk for item in items]
+    progress = BatchProgress(
+        items[0].sent_batches,
+        on_record=lambda state: DigestItem.objects.filter(pk__in=item_ids).update(sent_batches=state),
+    )
+
+    batches = iter_digest_batches(
+        iter_digest_audience(frequency, list(news_by_program)), frequency, progress, content_for
+    )
+    total_success, total_errors = dispatch_notification_batches(
+        batches, None, ONESIGNAL_HEADERS, on_batch_done=progress.batch_done
+    )
+
+    attempts = items[0].attempts + 1
+    now = timezone.now()
+    last_error = f"{total_errors} envois en échec" if total_errors else ''
+    if total_errors and attempts < OUTBOX_MAX_ATTEMPTS:
+        next_attempt_at = now + compute_backoff(attempts)
+        DigestItem.objects.filter(pk__in=item_ids).update(
+            attempts=attempts, next_attempt_at=next_attempt_at, last_error=last_error
+        )
+        print(f"🔁 Digest {frequency} ({window_end:%Y-%m-%d %H:%M}) : ❌ {total_errors} échecs, "
+              f"nouvel essai à {next_attempt_at:%H:%M:%S}")
+        return total_success, total_errors
+
+    sent_by_news = Counter()
+    for key in progress.state:
+        for news in slice_news(key):
+            sent_by_news[news.id] += progress.sent(key)
+
+    with transaction.atomic():
+        DigestItem.objects.filter(pk__in=item_ids).update(sent_at=now, attempts=attempts, last_error=last_error)
+        PublicationLog.objects.bulk_create([
+            PublicationLog(
+                news=item.news,
+                scheduled_at=window_end,
+                published_at=now,
+                channel=f"digest_{frequency}",
+                sent_count=sent_by_news[item.news_id],
+            )
+            for item in items
+        ])
+
+    print(f"📰 Digest {frequency} ({window_end:%Y-%m-%d %H:%M}) : {len(items)} news, "
+          f"{len(progress.state)} tranches, ✅ {progress.sent()} envoyées, ❌ {total_errors} échecs")
+    return total_success, total_errors
+
+
+def send_due_digests(now=None):
+    """
+    Envoie tous les digests dont la fenêtre est close (et dont le nouvel
+    essai est dû, après un échec).
+    
+    Returns:
+        int: nombre de digests envoyés
+    """
+    now = now or timezone.now()
+    due_items = (
+        DigestItem.objects.filter(sent_at__isnull=True, window_end__lte=now)
+        .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+        .select_related('news')
+        .order_by('frequency', 'window_end')
+    )
+
+    sent = 0
+    for (frequency, window_end), items in groupby(due_items, key=lambda item: (item.frequency, item.window_end)):
+        send_digest(frequency, window_end, list(items))
+        sent += 1
+    return sent
@@ -0,0 +1,197 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Backend de diffusion entre processus : LocalBackend (un seul processus) ou
+# UnixSocketBackend (plusieurs workers sur la même machine)
+EVENTS_BACKEND = getattr(settings, 'EVENTS_BACKEND', 'core.events.LocalBackend')
+EVENTS_SOCKET_DIR = Path(getattr(settings, 'EVENTS_SOCKET_DIR', settings.BASE_DIR / 'var' / 'events'))
+# Événements en attente par abonné ; au-delà, l'abonné lent est déconnecté
+EVENTS_QUEUE_SIZE = getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+# Intervalle (secondes) des commentaires keep-alive du flux SSE
+EVENTS_KEEPALIVE = getattr(settings, 'EVENTS_KEEPALIVE', 15)
+# Délai de reconnexion conseillé aux clients EventSource (millisecondes)
+EVENTS_RETRY_MS = 5000
+# Taille maximale d'un datagramme (événement sérialisé)
+EVENTS_MAX_MESSAGE = 64 * 1024
+
+
+def program_topic(program_id):
+    return f'program:{program_id}'
+
+
+class LocalBackend:
+    """
+    Diffusion dans le processus courant uniquement.
+    """
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, message):
+        self.deliver(message)
+
+
+class UnixSocketBackend:
+    """
+    Diffusion entre les processus d'une même machine.
+
+    Chaque processus lie un socket datagramme Unix « events-<pid>.sock »
+    dans EVENTS_SOCKET_DIR ; publier envoie l'événement à tous les sockets
+    du répertoire, y compris le sien. Un thread par processus lit son
+    socket et remet les événements au broker local. Le socket d'un
+    processus mort (connexion refusée) est supprimé au passage.
+    """
+
+    def __init__(self, directory=None, name=None):
+        self.directory = Path(directory or EVENTS_SOCKET_DIR)
+        self.name = name or f'events-{os.getpid()}.sock'
+
+    def start(self, deliver):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / self.name
+        if self.path.exists():
+            self.path.unlink()
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(str(self.path))
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Un worker bloqué ne doit jamais ralentir celui qui publie
+        self.sender.setblocking(False)
+        self.deliver = deliver
+        threading.Thread(target=self.listen, name='events-listener', daemon=True).start()
+
+    def listen(self):
+        while True:
+            try:
+                data = self.socket.recv(EVENTS_MAX_MESSAGE)
+            except OSError:
+                return  # socket fermé (stop)
+            self.deliver(json.loads(data))
+
+    def publish(self, message):
+        data = json.dumps(message).encode()
+        for path in self.directory.glob('events-*.sock'):
+            try:
+                self.sender.sendto(data, str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                path.unlink(missing_ok=True)
+            except BlockingIOError:
+                pass  # file du destinataire pleine : événement perdu, le client resynchronise
+
+    def stop(self):
+        self.socket.close()
+        self.sender.close()
+        self.path.unlink(missing_ok=True)
+
+
+class EventSubscription:
+    """
+    File d'événements d'un client, lue dans sa boucle asyncio.
+    """
+
+    def __init__(self, topics, loop):
+        self.topics = set(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        # Exécuté dans la boucle de l'abonné (call_soon_threadsafe)
+        if self.overflowed:
+            return
+        if self.queue.full():
+            # Client trop lent : la suite est abandonnée, il devra resynchroniser
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync'})
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class EventBroker:
+    """
+    Pub/sub en mémoire : les vues de streaming s'abonnent à des topics
+    (« program:<id> »), les écritures publient depuis n'importe quel thread.
+
+    L'acheminement entre processus est délégué au backend ; le broker ne
+    fait que remettre chaque événement reçu aux abonnés locaux du topic.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+        self.sequence = itertools.count(1)
+        backend.start(self.dispatch)
+
+    def subscribe(self, topics):
+        subscription = EventSubscription(topics, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, topic, event_type, data):
+        self.backend.publish({'topic': topic, 'type': event_type, 'data': data})
+
+    def dispatch(self, message):
+        with self.lock:
+            targets = [sub for sub in self.subscriptions if message['topic'] in sub.topics]
+        if not targets:
+            return
+        event = {'id': next(self.sequence), 'type': message['type'], 'data': message['data']}
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                self.unsubscribe(subscription)  # boucle fermée : client parti
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = EventBroker(import_string(EVENTS_BACKEND)())
+        return _broker
+
+
+def news_event_data(news):
+    """
+    Contenu compact d'un événement news : de quoi afficher une notification
+    in-app ; le détail se lit ensuite sur /news/<id>/.
+    """
+    return {
+        'id': news.pk,
+        'program_id': news.program_id,
+        'title': news.title_final or news.title_draft,
+        'importance': news.importance,
+        'moderated_at': news.moderated_at.isoformat() if news.moderated_at else None,
+    }
+
+
+def publish_news_moderated(news_list, approved):
+    """
+    Publie news.approved / news.unapproved pour chaque news, sur le topic de
+    son programme. À appeler après le commit (transaction.on_commit).
+    """
+    broker = get_broker()
+    event_type = 'news.approved' if approved else 'news.unapproved'
+    for news in news_list:
+        if news.program_id:
+            broker.publish(program_topic(news.program_id), event_type, news_event_data(news))
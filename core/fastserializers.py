@@ -0,0 +1,193 @@
+"""
+Chemin de lecture rapide des listes de news : lignes .values() et
+serializers précompilés.
+
+NewsSerializer construit une instance de modèle par ligne puis appelle un
+champ DRF par attribut. Ici les champs, leurs colonnes et leurs conversions
+sont calculés une fois depuis les serializers DRF (mêmes clés, même ordre,
+mêmes formats de date) puis appliqués à des dicts lus avec .values() ; les
+pièces jointes d'une page sont lues en une requête.
+
+?fields=id,title_final,created_at restreint les clés renvoyées et les
+colonnes lues (sparse fieldsets). Sans ?fields=, la sortie est celle de
+NewsSerializer.
+"""
+from types import MethodType
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from .derivatives import derivative_url
+from .metrics import timed_serialization
+from .serializers import AttachmentSerializer, NewsSerializer
+
+FIELDS_PARAM = 'fields'
+
+# Champs DRF dont la représentation est la valeur lue en base
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.ChoiceField,
+)
+
+
+def get_sparse_fields(request):
+    """
+    Champs demandés par ?fields=a,b,c, ou None (tous).
+    """
+    raw = request.query_params.get(FIELDS_PARAM)
+    if not raw:
+        return None
+    return [name.strip() for name in raw.split(',') if name.strip()]
+
+
+class RowSerializer:
+    """
+    Sérialisation en lecture seule de lignes .values(), précompilée depuis
+    `serializer_class` :
+
+    - champs du modèle : colonne (attname pour les clés étrangères) et
+      conversion DRF (dates, fichiers)
+    - SerializerMethodField : méthode get_<champ>(row), colonnes lues
+      déclarées dans `method_columns`
+    - serializers imbriqués : `nested` = {champ: (RowSerializer, clé étrangère)}
+    - champs hors modèle (search_snippet) : repris de la ligne s'ils y sont
+    """
+    serializer_class = None
+    method_columns = {}
+    nested = {}
+
+    def __init__(self, fields=None, context=None):
+        self.context = context or {}
+        self.request = self.context.get('request')
+        plan = self.compile()
+        if fields is not None:
+            unknown = [name for name in fields if name not in plan]
+            if unknown:
+                raise ValidationError({FIELDS_PARAM: [f"Champ inconnu : {name}" for name in unknown]})
+        self.fields = [
+            (name, column, MethodType(convert, self) if bound else convert, optional)
+            for name, (column, convert, bound, optional) in plan.items()
+            if fields is None or name in fields
+        ]
+        self.selected = {name for name, *_ in self.fields}
+
+    @classmethod
+    def compile(cls):
+        """
+        {champ: (colonne, conversion, méthode à lier, colonne facultative)},
+        calculé une fois par classe.
+        """
+        if '_plan' not in cls.__dict__:
+            cls._plan = cls.build_plan()
+        return cls._plan
+
+    @classmethod
+    def build_plan(cls):
+        model = cls.serializer_class.Meta.model
+        concrete = {field.name: field for field in model._meta.concrete_fields}
+        plan = {}
+        for name, field in cls.serializer_class().fields.items():
+            if isinstance(field, serializers.SerializerMethodField):
+                plan[name] = (None, getattr(cls, field.method_name), True, False)
+            elif name in cls.nested:
+                plan[name] = (name, None, False, False)
+            elif field.source not in concrete:
+                plan[name] = (field.source, None, False, True)
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                convert = field.pk_field.to_representation if field.pk_field else None
+                plan[name] = (concrete[field.source].attname, convert, False, False)
+            elif isinstance(field, serializers.FileField):
+                plan[name] = (field.source, cls.file_url(concrete[field.source].storage), True, False)
+            elif isinstance(field, PASSTHROUGH_FIELDS):
+                plan[name] = (field.source, None, False, False)
+            else:
+                plan[name] = (field.source, field.to_representation, False, False)
+        return plan
+
+    @staticmethod
+    def file_url(storage):
+        # FileField.to_representation sur le nom stocké en base
+        def convert(self, name):
+            return self.build_url(storage.url(name)) if name else None
+        return convert
+
+    def build_url(self, url):
+        return self.request.build_absolute_uri(url) if self.request else url
+
+    def get_columns(self):
+        columns = {'id': None}
+        for name, column, convert, optional in self.fields:
+            if column is None:
+                columns.update(dict.fromkeys(self.method_columns.get(name, ())))
+            elif not optional and name not in self.nested:
+                columns[column] = None
+        return list(columns)
+
+    def values(self, queryset, *extra):
+        """
+        `queryset` en lignes .values() limitées aux colonnes utiles, plus
+        `extra` (champs de pagination) et les colonnes de .extra(select=...).
+        """
+        columns = dict.fromkeys(self.get_columns() + list(extra) + list(queryset.query.extra_select))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def prepare(self, rows):
+        """
+        Lit les serializers imbriqués de toute la page en une requête chacun.
+        """
+        for name, (row_serializer_class, foreign_key) in self.nested.items():
+            if name not in self.selected:
+                continue
+            groups = {row['id']: [] for row in rows}
+            for row in rows:
+                row[name] = groups[row['id']]
+            if not groups:
+                continue
+            child = row_serializer_class(context=self.context)
+            model = row_serializer_class.serializer_class.Meta.model
+            queryset = model.objects.filter(**{f'{foreign_key}__in': list(groups)}).order_by('pk')
+            children = list(child.values(queryset, foreign_key))
+            for child_row, data in zip(children, child.serialize(children)):
+                groups[child_row[foreign_key]].append(data)
+
+    def serialize(self, rows):
+        with timed_serialization():
+            rows = list(rows)
+            self.prepare(rows)
+            fields = [
+                (name, column, convert) for name, column, convert, optional in self.fields
+                if not optional or (rows and column in rows[0])
+            ]
+            results = []
+            for row in rows:
+                data = {}
+                for name, column, convert in fields:
+                    value = row if column is None else row[column]
+                    data[name] = value if convert is None or value is None else convert(value)
+                results.append(data)
+            return results
+
+
+class AttachmentRowSerializer(RowSerializer):
+    serializer_class = AttachmentSerializer
+    method_columns = {
+        'thumbnail_url': ('blob_id', 'mime'),
+        'preview_url': ('blob_id', 'mime'),
+    }
+
+    def get_download_url(self, row):
+        return self.build_url(reverse('attachment-download', args=[row['id']]))
+
+    def get_thumbnail_url(self, row):
+        url = derivative_url(row['blob_id'], row['mime'], 'thumbnail')
+        return self.build_url(url) if url else self.get_download_url(row)
+
+    def get_preview_url(self, row):
+        url = derivative_url(row['blob_id'], row['mime'], 'preview')
+        return self.build_url(url) if url else self.get_download_url(row)
+
+
+class NewsRowSerializer(RowSerializer):
+    """
+    Listes de news (NewsViewSet, non lues, vues ASGI).
+    """
+    serializer_class = NewsSerializer
+    nested = {'attachments': (AttachmentRowSerializer, 'news_id')}
@@ -0,0 +1,67 @@
+from django.db import connection
+from rest_framework import filters
+
+# Poids bm25 des colonnes de core_news_fts (titres > programme > contenus)
+NEWS_FTS_WEIGHTS = (10.0, 10.0, 1.0, 1.0, 5.0)
+NEWS_SNIPPET_TOKENS = 12
+
+
+def filter_news_queryset(queryset, params):
+    """
+    Filtres ?program_id=, ?author_id= et ?importance= des listes de news
+    (NewsViewSet et sa version asynchrone).
+    """
+    program_id = params.get('program_id')
+    author_id = params.get('author_id')
+    importance = params.get('importance')
+
+    if program_id:
+        queryset = queryset.filter(program_id=program_id)
+    if author_id:
+        queryset = queryset.filter(author_id=author_id)
+    if importance:
+        queryset = queryset.filter(importance=importance)
+
+    return queryset
+
+
+def build_fts_query(terms):
+    """
+    Transforme les termes de ?search= en requête FTS5 : chaque terme est
+    cité (pas d'opérateurs injectés) et cherché en préfixe, tous requis.
+    """
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+class NewsSearchFilter(filters.SearchFilter):
+    """
+    ?search= sur les news via l'index FTS5 core_news_fts (voir migration 0007).
+    
+    Résultats classés par pertinence (bm25) sauf si ?ordering= est fourni,
+    avec un extrait surligné exposé dans `search_snippet`. Hors SQLite,
+    retombe sur le SearchFilter DRF (icontains).
+    
+    À placer après OrderingFilter dans filter_backends.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if connection.vendor != 'sqlite':
+            return super().filter_queryset(request, queryset, view)
+
+        weights = ", ".join(str(weight) for weight in NEWS_FTS_WEIGHTS)
+        queryset = queryset.extra(
+            tables=['core_news_fts'],
+            where=['core_news_fts MATCH %s', 'core_news_fts.rowid = core_news.id'],
+            params=[build_fts_query(terms)],
+            select={
+                'search_rank': f"bm25(core_news_fts, {weights})",
+                'search_snippet': "snippet(core_news_fts, -1, '<mark>', '</mark>', '…', %s)",
+            },
+            select_params=[NEWS_SNIPPET_TOKENS],
+        )
+        if not request.query_params.get(filters.OrderingFilter.ordering_param):
+            queryset = queryset.order_by('search_rank', '-created_at')
+        return queryset
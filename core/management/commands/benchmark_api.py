@@ -0,0 +1,145 @@
+import fnmatch
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+import django
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.core.paginator import UnorderedObjectListWarning
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from core.benchmark import (
+    DEFAULT_DATASET,
+    StubOneSignalServer,
+    build_workloads,
+    compare_results,
+    generate_dataset,
+    run_workload,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure débit et latences (p50/p95/p99) de chaque route de l'API sur un jeu "
+        "de données synthétique, dans une base temporaire ; résultats en JSON, "
+        "comparables à une exécution de référence (--baseline)."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_DATASET.items():
+            parser.add_argument(f'--{name}', type=int, default=default, help=f"Taille du jeu de données (défaut : {default})")
+        parser.add_argument('--seed', type=int, default=0, help="Graine du jeu de données et des requêtes")
+        parser.add_argument('--requests', type=int, default=200, help="Requêtes mesurées par route")
+        parser.add_argument('--warmup', type=int, default=5, help="Requêtes non mesurées avant chaque route")
+        parser.add_argument('--concurrency', type=int, default=1, help="Clients simultanés")
+        parser.add_argument('--only', action='append', default=[], help="Routes à mesurer (motif, ex. 'news-*')")
+        parser.add_argument('--stub-latency', type=float, default=0.0, help="Latence (ms) du serveur OneSignal factice")
+        parser.add_argument('--output', help="Fichier JSON des résultats (défaut : var/benchmarks/<date>.json)")
+        parser.add_argument('--baseline', help="Résultats de référence à comparer")
+        parser.add_argument('--threshold', type=float, default=10.0, help="Écart toléré (%%) sur p95 et débit")
+        parser.add_argument('--fail-on-regression', action='store_true', help="Code de sortie non nul si régression")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Base et médias jetables : db.sqlite3 et MEDIA_ROOT ne sont pas touchés
+            for alias in connections:
+                connections[alias].settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / f"{alias}.sqlite3")
+            setup_test_environment()
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                with override_settings(MEDIA_ROOT=Path(tmp) / 'media', ATTACHMENT_DERIVATIVES=False):
+                    results = self.run_benchmark(options)
+            finally:
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+        output = Path(options['output'] or settings.BASE_DIR / 'var' / 'benchmarks' / f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(f"💾 Résultats : {output}")
+
+        if baseline is not None:
+            self.report_comparison(results, baseline, options)
+
+    def run_benchmark(self, options):
+        dataset_options = {name: options[name] for name in DEFAULT_DATASET}
+        started = time.perf_counter()
+        dataset = generate_dataset(seed=options['seed'], **dataset_options)
+        self.stdout.write(f"🧪 Jeu de données généré en {time.perf_counter() - started:.1f} s ({dataset_options})")
+
+        # Pagination des routes du router sans tri explicite : averti une fois par requête
+        warnings.simplefilter('ignore', UnorderedObjectListWarning)
+
+        results = {}
+        with StubOneSignalServer(latency=options['stub_latency'] / 1000) as stub:
+            for workload in build_workloads(stub):
+                if options['only'] and not any(fnmatch.fnmatch(workload.name, pattern) for pattern in options['only']):
+                    continue
+                if workload.name.startswith('fanout') and not dataset['fanout_news_id']:
+                    continue
+                cache.clear()
+                result = run_workload(
+                    workload, dataset, options['requests'],
+                    warmup=options['warmup'], concurrency=options['concurrency'], seed=options['seed'],
+                )
+                results[workload.name] = result
+                self.report(workload.name, result)
+            stub_stats = {'requests': stub.requests, 'recipients': stub.recipients}
+
+        return {
+            'meta': {
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'commit': self.git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'db_profile': settings.DB_PROFILE,
+                'dataset': dataset_options,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'stub_latency_ms': options['stub_latency'],
+                'stub': stub_stats,
+            },
+            'results': results,
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, name, result):
+        if result['p50_ms'] is None:
+            self.stdout.write(f"   {name:24s} ❌ {result['errors']} erreurs, aucune requête réussie")
+            return
+        errors = f"  ⚠️ {result['errors']} erreurs" if result['errors'] else ''
+        self.stdout.write(
+            f"   {name:24s} {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+            f"p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms{errors}"
+        )
+
+    def report_comparison(self, results, baseline, options):
+        rows = compare_results(results, baseline, options['threshold'] / 100)
+        self.stdout.write(f"📊 Comparaison avec {options['baseline']} (commit {baseline['meta'].get('commit')})")
+        for row in rows:
+            marker = '🔴' if row['regression'] else '🟢'
+            self.stdout.write(
+                f"   {marker} {row['name']:24s} p95 {row['p95_change']:+7.1%}  débit {row['throughput_change']:+7.1%}"
+            )
+        regressions = [row['name'] for row in rows if row['regression']]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Régressions au-delà de {options['threshold']} % : {', '.join(regressions)}")
@@ -0,0 +1,155 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from core.models import News, NewsView, Program
+
+PROFILES = ('default', 'production')
+PROGRAMS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit lecture/écriture concurrent de SQLite avec la configuration "
+        "par défaut et le profil production (PRAGMAs, replica en lecture seule, BEGIN IMMEDIATE), "
+        "à travers l'ORM et le router de chaque profil."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help="Durée de chaque mesure (secondes)")
+        parser.add_argument('--news', type=int, default=20000, help="Nombre de news du jeu de données")
+        # Usage interne : mesure du profil de ce processus (DJANGO_DB_PROFILE), résultats en JSON
+        parser.add_argument('--run', action='store_true', help="(interne) mesurer le profil courant")
+
+    def handle(self, *args, **options):
+        if options['run']:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+
+        # Un processus par profil : DATABASES, PRAGMAs et router sont ceux des settings
+        for profile in PROFILES:
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_sqlite', '--run',
+                '--readers', str(options['readers']), '--writers', str(options['writers']),
+                '--duration', str(options['duration']), '--news', str(options['news']),
+            ]
+            result = subprocess.run(
+                command, env={**os.environ, 'DJANGO_DB_PROFILE': profile}, capture_output=True, text=True,
+            )
+            if result.returncode:
+                raise CommandError(f"Profil {profile} : {result.stderr.strip()}")
+            self.report(profile, json.loads(result.stdout.strip().splitlines()[-1]), options['duration'])
+
+    def measure(self, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Base jetable créée par les migrations (replica : miroir de default)
+            for alias in connections:
+                connections[alias].settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / f"{alias}.sqlite3")
+            setup_test_environment()
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                user_ids = self.create_dataset(options['news'], options['writers'])
+                return self.run(options, user_ids)
+            finally:
+                connections.close_all()
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+    def create_dataset(self, news_count, writers):
+        programs = Program.objects.bulk_create(
+            [Program(name=f"Programme {i}", code=f"P{i}") for i in range(PROGRAMS)]
+        )
+        News.objects.bulk_create(
+            [
+                News(program=programs[i % PROGRAMS], title_final=f"News {i}", moderator_approved=True)
+                for i in range(news_count)
+            ],
+            batch_size=1000,
+        )
+        users = User.objects.bulk_create([User(username=f"bench{i}") for i in range(writers)])
+        return [user.pk for user in users]
+
+    def run(self, options, user_ids):
+        stats = {'read': [], 'write': [], 'errors': 0, 'read_alias': None}
+        lock = threading.Lock()
+        news_ids = list(News.objects.values_list('id', flat=True))
+        program_ids = list(Program.objects.values_list('id', flat=True))
+        stop = time.monotonic() + options['duration']
+
+        # Chaque thread garde sa connexion Django (une par alias) toute la
+        # mesure : seuls les PRAGMAs, la replica et BEGIN IMMEDIATE sont comparés
+        def reader(worker_id):
+            latencies = []
+            errors = 0
+            i = worker_id
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                try:
+                    list(
+                        News.objects.filter(program_id=program_ids[i % PROGRAMS])
+                        .order_by('-created_at').values('id', 'title_final')[:10]
+                    )
+                    latencies.append(time.perf_counter() - started)
+                except OperationalError:
+                    errors += 1
+                i += 1
+            connections.close_all()
+            with lock:
+                stats['read'] += latencies
+                stats['errors'] += errors
+
+        def writer(worker_id):
+            latencies = []
+            errors = 0
+            i = 0
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        NewsView.objects.bulk_create(
+                            [NewsView(user_id=user_ids[worker_id], news_id=news_ids[i % len(news_ids)])],
+                            ignore_conflicts=True,
+                        )
+                    latencies.append(time.perf_counter() - started)
+                except OperationalError:
+                    errors += 1
+                i += 1
+            connections.close_all()
+            with lock:
+                stats['write'] += latencies
+                stats['errors'] += errors
+
+        stats['read_alias'] = News.objects.all().db
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def report(self, profile, stats, duration):
+        self.stdout.write(f"📊 Profil {profile} (lectures sur '{stats['read_alias']}')")
+        for kind in ('read', 'write'):
+            latencies = sorted(stats[kind])
+            if not latencies:
+                self.stdout.write(f"   {kind:5s}: aucune opération réussie")
+                continue
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+            self.stdout.write(
+                f"   {kind:5s}: {len(latencies) / duration:8.0f} ops/s  "
+                f"p50 {statistics.median(latencies) * 1000:6.2f} ms  p95 {p95 * 1000:6.2f} ms"
+            )
+        self.stdout.write(f"   erreurs (database is locked) : {stats['errors']}")
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from core.viewbuffer import flush_view_buffer
+
+
+class Command(BaseCommand):
+    help = "Insère par lots les vues de news mises en buffer (NEWS_VIEW_WRITE_BEHIND)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Vider le buffer une fois puis quitter")
+        parser.add_argument('--interval', type=float, default=2.0, help="Délai maximal (secondes) avant insertion")
+        parser.add_argument('--max-bytes', type=int, default=64 * 1024, help="Taille de segment qui déclenche une insertion immédiate")
+        parser.add_argument('--poll', type=float, default=0.2, help="Fréquence de vérification de la taille des segments")
+
+    def handle(self, *args, **options):
+        last_flush = time.monotonic()
+        while True:
+            # Seuil de taille à chaque passage, tout le buffer à chaque intervalle
+            due = options['once'] or time.monotonic() - last_flush >= options['interval']
+            events, created = flush_view_buffer(max_bytes=0 if due else options['max_bytes'])
+            if due:
+                last_flush = time.monotonic()
+            if events:
+                self.stdout.write(f"👁️ {events} événements, {created} vues créées")
+            if options['once']:
+                break
+            time.sleep(options['poll'])
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.derivatives import generate_derivatives, get_derivative_pool, is_derivable
+from core.models import Blob
+
+
+class Command(BaseCommand):
+    help = "Génère les miniatures et aperçus manquants des pièces jointes (un blob = un passage)."
+
+    def handle(self, *args, **options):
+        # Dérivés indexés par contenu : un seul passage par blob
+        blobs = [blob for blob in Blob.objects.filter(ref_count__gt=0).iterator() if is_derivable(blob.mime)]
+        pool = get_derivative_pool()
+        futures = [
+            pool.submit(generate_derivatives, str(settings.MEDIA_ROOT), blob.name, blob.sha256, blob.mime)
+            for blob in blobs
+        ]
+        generated = failed = 0
+        for future in futures:
+            try:
+                generated += len(future.result())
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"⚠️ {error}")
+        pool.shutdown()
+        self.stdout.write(f"🖼️ {len(blobs)} fichiers traités, {generated} dérivés générés, {failed} erreurs")
@@ -0,0 +1,30 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from core.models import Attachment
+from core.storage import media_path, store_uploaded_file
+
+
+class Command(BaseCommand):
+    help = "Déplace les pièces jointes historiques (media/attachments/) vers le stockage adressé par contenu."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-files', action='store_true', help="Conserver les fichiers d'origine")
+
+    def handle(self, *args, **options):
+        migrated = missing = 0
+        for attachment in Attachment.objects.filter(blob__isnull=True).exclude(file='').iterator():
+            path = media_path(attachment.file.name)
+            if not path.exists():
+                missing += 1
+                continue
+            with open(path, 'rb') as source:
+                blob = store_uploaded_file(File(source, name=path.name))
+            # update() : pas de signaux, le contenu de la news ne change pas
+            Attachment.objects.filter(pk=attachment.pk).update(
+                blob=blob, file=blob.name, original_name=attachment.original_name or path.name,
+                filesize=blob.size, mime=attachment.mime or blob.mime,
+            )
+            if not options['keep_files'] and not Attachment.objects.filter(file=attachment.file.name).exists():
+                path.unlink()
+            migrated += 1
+        self.stdout.write(f"📦 {migrated} pièces jointes migrées, {missing} fichiers introuvables")
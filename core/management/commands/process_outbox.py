@@ -0,0 +1,30 @@
+import asyncio
+import time
+from django.core.management.base import BaseCommand
+from core.outbox import process_outbox, process_outbox_async
+
+
+class Command(BaseCommand):
+    help = "Worker qui vide l'outbox des notifications (fan-out OneSignal) avec retries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Traiter un seul lot puis quitter")
+        parser.add_argument('--batch-size', type=int, default=50, help="Nombre d'entrées réservées par lot")
+        parser.add_argument('--interval', type=float, default=5.0, help="Pause (secondes) quand l'outbox est vide")
+        parser.add_argument('--async', dest='use_async', action='store_true', help="Client OneSignal asyncio : les entrées d'un lot partent en parallèle")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        interval = options['interval']
+
+        while True:
+            if options['use_async']:
+                processed, failed = asyncio.run(process_outbox_async(limit=batch_size))
+            else:
+                processed, failed = process_outbox(limit=batch_size)
+            if processed:
+                self.stdout.write(f"📤 {processed} entrées traitées ({failed} à réessayer)")
+            if options['once']:
+                break
+            if processed < batch_size:
+                time.sleep(interval)
@@ -0,0 +1,43 @@
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from core.provisioning import (
+    PROVISIONING_CHUNK_SIZE,
+    PROVISIONING_DEFAULT_ROLE,
+    detect_format,
+    parse_user_rows,
+    provision_users,
+)
+
+
+class Command(BaseCommand):
+    help = "Importe des comptes en masse depuis un fichier CSV ou NDJSON (rentrée)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier .csv ou .ndjson/.jsonl")
+        parser.add_argument('--format', dest='fmt', choices=['csv', 'ndjson'], help="Format (déduit de l'extension sinon)")
+        parser.add_argument('--chunk-size', type=int, default=PROVISIONING_CHUNK_SIZE, help="Utilisateurs par transaction")
+        parser.add_argument('--workers', type=int, help="Processus de hachage des mots de passe (défaut : nombre de CPU)")
+        parser.add_argument('--role', action='append', dest='roles', help=f"Rôle par défaut (défaut : {PROVISIONING_DEFAULT_ROLE})")
+        parser.add_argument('--program', action='append', dest='programs', default=[], help="Code programme abonné pour tous les comptes")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['fmt'] or detect_format(path.name)
+        if not fmt:
+            raise CommandError("Format introuvable : utiliser --format csv|ndjson")
+
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = provision_users(
+                parse_user_rows(stream, fmt),
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                default_roles=tuple(options['roles'] or [PROVISIONING_DEFAULT_ROLE]),
+                default_programs=tuple(options['programs']),
+            )
+
+        for error in report['errors'] + report['warnings']:
+            self.stderr.write(f"⚠️ {error['username']} : {error['error']}")
+        self.stdout.write(
+            f"👥 {report['created']} comptes créés, {report['skipped']} ignorés "
+            f"en {report['elapsed']} s ({report['users_per_second']} comptes/s)"
+        )
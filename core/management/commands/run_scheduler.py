@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from core.scheduler import PublicationScheduler
+
+
+class Command(BaseCommand):
+    help = "Planificateur qui publie les news validées à leur date demandée (publish_date_requested)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Publier les news échues puis quitter")
+        parser.add_argument('--refresh', type=float, default=60.0, help="Rechargement de la file (secondes), pour voir les nouvelles validations")
+
+    def handle(self, *args, **options):
+        scheduler = PublicationScheduler(refresh_interval=options['refresh'])
+        while True:
+            published = scheduler.run_pending()
+            if published:
+                self.stdout.write(f"🗓️ {published} news publiées")
+            if options['once']:
+                break
+            time.sleep(scheduler.seconds_until_next())
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from core.digest import send_due_digests
+
+
+class Command(BaseCommand):
+    help = "Envoie les digests daily/weekly dont la fenêtre est close."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Vérifier une seule fois puis quitter")
+        parser.add_argument('--interval', type=float, default=60.0, help="Pause (secondes) entre deux vérifications")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_due_digests()
+            if sent:
+                self.stdout.write(f"📰 {sent} digests envoyés")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,344 @@
+"""
+Instrumentation par requête : temps SQL, sérialisation, appels HTTP
+sortants (OneSignal) et latence totale.
+
+- en-tête Server-Timing sur chaque réponse (SERVER_TIMING_HEADER)
+- histogrammes agrégés par route au format texte Prometheus sur /metrics
+- journal des requêtes lentes (logger core.slow_requests) avec leur SQL
+
+Les mesures de la requête en cours sont portées par une contextvar :
+sync_to_async et les threads lancés avec copy_context() la voient aussi.
+Les agrégats sont propres au processus : Prometheus interroge chaque worker.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import APIException
+from .authentication import CachedJWTAuthentication
+
+logger = logging.getLogger('core.slow_requests')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+# Requêtes SQL gardées par requête HTTP pour le journal des requêtes lentes
+SLOW_REQUEST_MAX_QUERIES = 1000
+# Requêtes SQL détaillées dans une entrée du journal
+SLOW_REQUEST_LOGGED_QUERIES = 10
+
+# Groupe nommé d'un motif regex : (?P<pk>[^/.]+)
+ROUTE_GROUP_RE = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class RequestMetrics:
+    """
+    Mesures d'une requête HTTP (secondes cumulées).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.http_count = 0
+        self.http_time = 0.0
+        self.queries = []
+        self.lock = threading.Lock()  # envois OneSignal en parallèle (threads)
+
+    def record_query(self, sql, duration):
+        with self.lock:
+            self.sql_count += 1
+            self.sql_time += duration
+            if len(self.queries) < SLOW_REQUEST_MAX_QUERIES:
+                self.queries.append((duration, sql))
+
+    def record_http(self, duration):
+        with self.lock:
+            self.http_count += 1
+            self.http_time += duration
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def sql_timer(execute, sql, params, many, context):
+    """
+    Wrapper d'exécution SQL (connection.execute_wrappers), installé sur
+    chaque connexion à sa création ; sans requête HTTP en cours il ne fait rien.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def install_sql_timer(sender, connection, **kwargs):
+    if sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_timer)
+
+
+@contextmanager
+def timed_http():
+    """
+    Mesure un appel HTTP sortant (OneSignal) pour la requête en cours.
+    """
+    metrics = current_metrics.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.record_http(time.perf_counter() - started)
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Mesure une sérialisation au premier niveau seulement : les
+    serializers imbriqués sont compris dans le temps de leur parent.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        if not metrics.serializer_depth:
+            metrics.serializer_time += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """
+    Compte to_representation() dans le temps de sérialisation de la requête.
+    """
+
+    def to_representation(self, instance):
+        if current_metrics.get() is None:
+            return super().to_representation(instance)
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.series.items()):
+            base = format_labels(labels)
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {counts[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {counts[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {counts[-1]}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = Counter()
+
+    def inc(self, labels):
+        self.series[labels] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{format_labels(labels)}}} {value}")
+        return lines
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class MetricsRegistry:
+    """
+    Agrégats du processus, par (méthode, route).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = CounterMetric('ccc_http_requests_total', "Requêtes HTTP par route et statut.")
+        self.slow_requests = CounterMetric('ccc_http_slow_requests_total', "Requêtes au-delà du seuil de lenteur.")
+        self.duration = Histogram('ccc_http_request_duration_seconds', "Latence totale des requêtes.", DURATION_BUCKETS)
+        self.sql_time = Histogram('ccc_http_request_sql_seconds', "Temps SQL par requête.", DURATION_BUCKETS)
+        self.sql_count = Histogram('ccc_http_request_sql_queries', "Requêtes SQL par requête HTTP.", QUERY_COUNT_BUCKETS)
+        self.serializer_time = Histogram(
+            'ccc_http_request_serializer_seconds', "Temps de sérialisation DRF par requête.", DURATION_BUCKETS,
+        )
+        self.http_time = Histogram(
+            'ccc_http_request_outbound_seconds', "Temps des appels HTTP sortants par requête.", DURATION_BUCKETS,
+        )
+
+    def observe(self, method, route, status, metrics, elapsed, slow):
+        labels = (('method', method), ('route', route))
+        with self.lock:
+            self.requests.inc(labels + (('status', str(status)),))
+            self.duration.observe(labels, elapsed)
+            self.sql_time.observe(labels, metrics.sql_time)
+            self.sql_count.observe(labels, metrics.sql_count)
+            self.serializer_time.observe(labels, metrics.serializer_time)
+            self.http_time.observe(labels, metrics.http_time)
+            if slow:
+                self.slow_requests.inc(labels)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (
+                self.requests, self.slow_requests, self.duration, self.sql_time,
+                self.sql_count, self.serializer_time, self.http_time,
+            ):
+                lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def request_route(request):
+    """
+    Motif de l'URL (« api/news/<int:pk>/ ») : une série par route, pas par id.
+    Les motifs regex du router DRF sont ramenés à la même forme (« api/news/<pk>/ »).
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return ROUTE_GROUP_RE.sub(r'<\1>', match.route).replace('^', '').replace('$', '')
+
+
+def server_timing(metrics, elapsed):
+    ms = lambda seconds: f"{seconds * 1000:.1f}"
+    return ', '.join([
+        f'db;dur={ms(metrics.sql_time)};desc="{metrics.sql_count} queries"',
+        f'ser;dur={ms(metrics.serializer_time)}',
+        f'http;dur={ms(metrics.http_time)};desc="{metrics.http_count} calls"',
+        f'total;dur={ms(elapsed)}',
+    ])
+
+
+def log_slow_request(request, route, status, metrics, elapsed):
+    repeated = Counter(sql for _, sql in metrics.queries).most_common(1)
+    lines = [
+        f"{request.method} {request.path} ({route}) -> {status} en {elapsed * 1000:.0f} ms : "
+        f"{metrics.sql_count} requêtes SQL ({metrics.sql_time * 1000:.0f} ms), "
+        f"sérialisation {metrics.serializer_time * 1000:.0f} ms, "
+        f"HTTP sortant {metrics.http_time * 1000:.0f} ms"
+    ]
+    if repeated and repeated[0][1] > 1:
+        lines.append(f"  requête répétée {repeated[0][1]} fois : {repeated[0][0]}")
+    for duration, sql in sorted(metrics.queries, key=lambda query: query[0], reverse=True)[:SLOW_REQUEST_LOGGED_QUERIES]:
+        lines.append(f"  {duration * 1000:8.2f} ms  {sql}")
+    logger.warning('\n'.join(lines))
+
+
+class RequestMetricsMiddleware:
+    """
+    Mesure chaque requête (synchrone ou ASGI) ; à placer en tête de
+    MIDDLEWARE pour que la latence totale couvre toute la chaîne.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        elapsed = metrics.elapsed
+        route = request_route(request)
+        if route == 'metrics':
+            return response
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500)
+        slow = threshold is not None and elapsed * 1000 >= threshold
+        registry.observe(request.method, route, response.status_code, metrics, elapsed, slow)
+        if slow:
+            log_slow_request(request, route, response.status_code, metrics, elapsed)
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = server_timing(metrics, elapsed)
+        return response
+
+
+def metrics_user(request):
+    """
+    Utilisateur de la session, sinon celui du token JWT (None si absent ou invalide).
+    """
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        result = CachedJWTAuthentication().authenticate(request)
+    except APIException:
+        return None
+    return result[0] if result else None
+
+
+def metrics_view(request):
+    """
+    Agrégats au format texte Prometheus, réservés au staff (session ou
+    JWT) ou à « Authorization: Bearer <METRICS_TOKEN> » si METRICS_TOKEN
+    est défini (scraper Prometheus).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not (token and constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")):
+        user = metrics_user(request)
+        if user is None:
+            return HttpResponse(status=401)
+        if not user.is_staff:
+            return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frequency', models.CharField(choices=[('immediate', 'Immédiate'), ('daily', 'Quotidienne'), ('weekly', 'Hebdomadaire')], max_length=10)),
+                ('window_end', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('news', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digest_items', to='core.news')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.program')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sent_at', 'window_end'], name='core_digest_sent_at_6e9d5b_idx')],
+                'unique_together': {('news', 'frequency')},
+            },
+        ),
+    ]
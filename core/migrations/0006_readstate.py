@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_read_states(apps, schema_editor):
+    News = apps.get_model('core', 'News')
+    NewsView = apps.get_model('core', 'NewsView')
+    ReadState = apps.get_model('core', 'ReadState')
+    Subscription = apps.get_model('core', 'Subscription')
+
+    # Les news validées avant l'index n'ont pas toujours de moderated_at
+    for news in News.objects.filter(moderator_approved=True, moderated_at__isnull=True):
+        News.objects.filter(pk=news.pk).update(moderated_at=news.updated_at)
+
+    states = []
+    for sub in Subscription.objects.all():
+        unread_count = (
+            News.objects.filter(program_id=sub.program_id, moderator_approved=True)
+            .exclude(id__in=NewsView.objects.filter(user_id=sub.user_id).values('news_id'))
+            .count()
+        )
+        states.append(ReadState(user_id=sub.user_id, program_id=sub.program_id, unread_count=unread_count))
+    ReadState.objects.bulk_create(states)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_digestitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_until', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['program', 'moderator_approved', 'moderated_at'], name='core_news_program_8c86e5_idx'),
+        ),
+        migrations.AddField(
+            model_name='readstate',
+            name='program',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='core.program'),
+        ),
+        migrations.AddField(
+            model_name='readstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='readstate',
+            unique_together={('user', 'program')},
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
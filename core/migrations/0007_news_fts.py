@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# Index plein texte FTS5 des news, synchronisé par triggers SQLite
+# (couvre aussi les update()/bulk_create() qui ne déclenchent pas de signaux).
+NEWS_FTS_COLUMNS = "title_draft, title_final, content_draft, content_final, program_name"
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE core_news_fts USING fts5(
+        {NEWS_FTS_COLUMNS},
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER core_news_fts_ai AFTER INSERT ON core_news BEGIN
+        INSERT INTO core_news_fts(rowid, {NEWS_FTS_COLUMNS})
+        VALUES (new.id, new.title_draft, new.title_final, new.content_draft, new.content_final,
+                (SELECT name FROM core_program WHERE id = new.program_id));
+    END
+    """,
+    f"""
+    CREATE TRIGGER core_news_fts_au
+    AFTER UPDATE OF title_draft, title_final, content_draft, content_final, program_id ON core_news BEGIN
+        DELETE FROM core_news_fts WHERE rowid = old.id;
+        INSERT INTO core_news_fts(rowid, {NEWS_FTS_COLUMNS})
+        VALUES (new.id, new.title_draft, new.title_final, new.content_draft, new.content_final,
+                (SELECT name FROM core_program WHERE id = new.program_id));
+    END
+    """,
+    """
+    CREATE TRIGGER core_news_fts_ad AFTER DELETE ON core_news BEGIN
+        DELETE FROM core_news_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER core_program_fts_au AFTER UPDATE OF name ON core_program BEGIN
+        UPDATE core_news_fts SET program_name = new.name
+        WHERE rowid IN (SELECT id FROM core_news WHERE program_id = new.id);
+    END
+    """,
+    f"""
+    INSERT INTO core_news_fts(rowid, {NEWS_FTS_COLUMNS})
+    SELECT n.id, n.title_draft, n.title_final, n.content_draft, n.content_final, p.name
+    FROM core_news n LEFT JOIN core_program p ON p.id = n.program_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_program_fts_au",
+    "DROP TRIGGER IF EXISTS core_news_fts_ad",
+    "DROP TRIGGER IF EXISTS core_news_fts_au",
+    "DROP TRIGGER IF EXISTS core_news_fts_ai",
+    "DROP TABLE IF EXISTS core_news_fts",
+]
+
+
+def create_news_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_news_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_readstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_news_fts, drop_news_fts),
+    ]
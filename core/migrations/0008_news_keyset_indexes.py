@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_news_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['created_at', 'id'], name='core_news_created_923575_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['publish_date_effective', 'id'], name='core_news_publish_41b4b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['moderator_approved', 'created_at', 'id'], name='core_news_moderat_7ec755_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['moderator_approved', 'publish_date_effective', 'id'], name='core_news_moderat_a8314e_idx'),
+        ),
+    ]
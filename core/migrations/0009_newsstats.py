@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_news_stats(apps, schema_editor):
+    News = apps.get_model('core', 'News')
+    NewsStats = apps.get_model('core', 'NewsStats')
+    NewsStats.objects.bulk_create([
+        NewsStats(news_id=row['id'], views_count=row['total'])
+        for row in News.objects.annotate(total=Count('views')).values('id', 'total')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_news_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsStats',
+            fields=[
+                ('news', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.news')),
+                ('views_count', models.IntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='newsview',
+            index=models.Index(fields=['news', 'viewed_at', 'id'], name='core_newsvi_news_id_bf0092_idx'),
+        ),
+        migrations.RunPython(backfill_news_stats, migrations.RunPython.noop),
+    ]
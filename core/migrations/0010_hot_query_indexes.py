@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_newsstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newsstats',
+            name='views_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['program', 'moderator_approved', 'created_at'], name='core_news_program_cbbb77_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['program', 'created_at', 'id'], name='core_news_program_a35091_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['importance', 'created_at', 'id'], name='core_news_importa_2c9dca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsstats',
+            index=models.Index(fields=['views_count', 'news'], name='core_newsst_views_c_b5dfb8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationpref',
+            index=models.Index(fields=['user', 'push_enabled', 'frequency'], name='core_notifi_user_id_33c947_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['program', 'user'], name='core_subscr_program_2e153c_idx'),
+        ),
+    ]
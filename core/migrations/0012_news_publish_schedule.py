@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_publish_date_effective(apps, schema_editor):
+    # News déjà validées (et notifiées) : publiées, le planificateur les ignore
+    News = apps.get_model('core', 'News')
+    News.objects.filter(moderator_approved=True, publish_date_effective__isnull=True).update(
+        publish_date_effective=Coalesce(TruncDate('moderated_at'), TruncDate('created_at'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_attachment_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['publish_date_effective', 'publish_date_requested', 'id'], name='core_news_publish_352ffe_idx'),
+        ),
+        migrations.RunPython(backfill_publish_date_effective, migrations.RunPython.noop),
+    ]
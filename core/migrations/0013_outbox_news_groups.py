@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_news_publish_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='news_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+from django.db import migrations
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def clear_unpublished_moderated_at(apps, schema_editor):
+    # moderated_at date désormais la publication : les news validées en
+    # attente du planificateur sortent des fils et des compteurs de non lues
+    News = apps.get_model('core', 'News')
+    NewsView = apps.get_model('core', 'NewsView')
+    ReadState = apps.get_model('core', 'ReadState')
+
+    waiting = News.objects.filter(
+        moderator_approved=True, publish_date_effective__isnull=True, moderated_at__isnull=False
+    )
+    program_ids = set(waiting.exclude(program_id=None).values_list('program_id', flat=True))
+    waiting.update(moderated_at=None)
+    if not program_ids:
+        return
+
+    unread = (
+        News.objects.filter(
+            program_id=OuterRef('program_id'),
+            moderator_approved=True,
+            moderated_at__gt=Coalesce(OuterRef('read_until'), Value(datetime(1970, 1, 1, tzinfo=timezone.utc))),
+        )
+        .exclude(Exists(NewsView.objects.filter(user_id=OuterRef(OuterRef('user_id')), news_id=OuterRef('pk'))))
+        .values('program_id')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    ReadState.objects.filter(program_id__in=program_ids).update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_outbox_news_groups'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_unpublished_moderated_at, migrations.RunPython.noop),
+    ]
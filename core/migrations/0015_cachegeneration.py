@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_unpublished_news_moderated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('generation', models.BigIntegerField()),
+                ('modified', models.FloatField()),
+            ],
+        ),
+    ]
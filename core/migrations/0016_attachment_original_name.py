@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:59
+
+import os
+
+from django.db import migrations, models
+
+
+def fill_original_name(apps, schema_editor):
+    # Pièces jointes encore sous attachments/ : leur nom est celui de l'envoi
+    # (celles déjà en blobs/ ont perdu le leur, voir storage.download_filename)
+    Attachment = apps.get_model('core', 'Attachment')
+    for attachment in Attachment.objects.filter(blob__isnull=True, original_name='').only('file'):
+        Attachment.objects.filter(pk=attachment.pk).update(original_name=os.path.basename(attachment.file.name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(upload_to=''),
+        ),
+        migrations.RunPython(fill_original_name, migrations.RunPython.noop),
+    ]
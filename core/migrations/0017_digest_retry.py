@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_attachment_original_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestitem',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='digestitem',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='digestitem',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='digestitem',
+            name='sent_batches',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# Une ligne NewsStats par news, créée par trigger SQLite : le classement
+# (/news/views/) lit NewsStats seul, y compris pour les news insérées par
+# bulk_create() ou en SQL, qui ne déclenchent pas le signal post_save.
+CREATE_TRIGGER_SQL = """
+    CREATE TRIGGER core_news_stats_ai AFTER INSERT ON core_news BEGIN
+        INSERT OR IGNORE INTO core_newsstats(news_id, views_count) VALUES (new.id, 0);
+    END
+"""
+DROP_TRIGGER_SQL = "DROP TRIGGER IF EXISTS core_news_stats_ai"
+
+
+def create_missing_news_stats(apps, schema_editor):
+    News = apps.get_model('core', 'News')
+    NewsStats = apps.get_model('core', 'NewsStats')
+    NewsView = apps.get_model('core', 'NewsView')
+    missing = News.objects.filter(stats__isnull=True).values_list('id', flat=True)
+    counts = {}
+    for news_id in NewsView.objects.filter(news_id__in=missing).values_list('news_id', flat=True):
+        counts[news_id] = counts.get(news_id, 0) + 1
+    NewsStats.objects.bulk_create(
+        [NewsStats(news_id=news_id, views_count=counts.get(news_id, 0)) for news_id in missing],
+        batch_size=1000,
+    )
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_TRIGGER_SQL)
+
+
+def drop_news_stats_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_TRIGGER_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_outbox_sent_batches'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_news_stats, drop_news_stats_trigger),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
+import os
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -40,6 +42,10 @@ class Subscription(models.Model):
 
     class Meta:
         unique_together = ('user', 'program')
+        indexes = [
+            # Audience d'un programme : couvre le JOIN vers l'utilisateur
+            models.Index(fields=['program', 'user']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} → {self.program.name}"
@@ -72,9 +78,67 @@ class News(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Fil des non lues : news validées d'un programme après le read_until
+            models.Index(fields=['program', 'moderator_approved', 'moderated_at']),
+            # Fil d'un programme (?program_id=, non lues) trié par date de création
+            models.Index(fields=['program', 'moderator_approved', 'created_at']),
+            models.Index(fields=['program', 'created_at', 'id']),
+            # Filtre ?importance= trié par date de création
+            models.Index(fields=['importance', 'created_at', 'id']),
+            # Pagination par curseur (KeysetPagination) : (champ, id), global et fil des validées
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['publish_date_effective', 'id']),
+            models.Index(fields=['moderator_approved', 'created_at', 'id']),
+            models.Index(fields=['moderator_approved', 'publish_date_effective', 'id']),
+            # File du planificateur : news pas encore publiées (effective NULL) par date demandée
+            models.Index(fields=['publish_date_effective', 'publish_date_requested', 'id']),
+        ]
+
     def __str__(self):
         return self.title_final or self.title_draft
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        news = super().from_db(db, field_names, values)
+        # État de validation lu en base : save() détecte une (dé-)validation
+        news._approved_in_db = news.__dict__.get('moderator_approved')
+        return news
+
+    def approved_in_db(self):
+        if self._state.adding:
+            return False
+        approved = getattr(self, '_approved_in_db', None)
+        if approved is None:
+            approved = News.objects.filter(pk=self.pk).values_list('moderator_approved', flat=True).first()
+        return bool(approved)
+
+    def save(self, *args, **kwargs):
+        # Validation / dé-validation par n'importe quel chemin (API, admin) :
+        # non lues, outbox et flux temps réel (voir core.publication)
+        from .publication import news_published, news_unapproved, stamp_approval
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'moderator_approved' not in update_fields:
+            return super().save(*args, **kwargs)
+        was_approved = self.approved_in_db()
+        if self.moderator_approved == was_approved:
+            super().save(*args, **kwargs)
+            self._approved_in_db = self.moderator_approved
+            return
+
+        with transaction.atomic():
+            published = self.moderator_approved and stamp_approval(self, timezone.now())
+            if self.moderator_approved and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'moderated_at', 'publish_date_effective'}
+            super().save(*args, **kwargs)
+            if published:
+                news_published([self])
+            elif not self.moderator_approved:
+                news_unapproved([self])
+        self._approved_in_db = self.moderator_approved
+
 # --- Modération ---
 class Moderation(models.Model):
     news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='moderations')
@@ -86,17 +150,54 @@ class Moderation(models.Model):
     def __str__(self):
         return f"{self.moderator} - {self.news.title_final}"
 
+# --- Contenu des fichiers, stocké une seule fois par empreinte SHA-256 ---
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    mime = models.CharField(max_length=100, blank=True)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def name(self):
+        # Chemin relatif à MEDIA_ROOT : blobs/ab/cd/abcd…
+        return f"blobs/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}"
+
+    def __str__(self):
+        return f"{self.sha256[:12]}… ({self.ref_count} réf.)"
+
+
 # --- Pièces jointes ---
 class Attachment(models.Model):
     news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to='attachments/')  # 🔹 stocke le fichier réel
+    # 🔹 fichier réel, nommé d'après son contenu (blobs/ab/cd/<sha256>, voir core.storage)
+    file = models.FileField()
+    # Nom du fichier envoyé, rendu au téléchargement (Content-Disposition)
+    original_name = models.CharField(max_length=255, blank=True)
     mime = models.CharField(max_length=100, blank=True)
     filesize = models.IntegerField(default=0)
+    blob = models.ForeignKey(Blob, on_delete=models.SET_NULL, null=True, blank=True, related_name='attachments')
 
     def save(self, *args, **kwargs):
-        if self.file:
-            self.filesize = self.file.size
-            self.mime = self.file.file.content_type if hasattr(self.file, 'file') else ''
+        # Nouveau fichier : hashé en flux et dédupliqué (voir core.storage)
+        if self.file and not self.file._committed:
+            from .storage import release_blob, store_uploaded_file
+            previous_blob_id = self.blob_id
+            self.blob = store_uploaded_file(self.file)
+            self.original_name = os.path.basename(self.file.name)
+            self.file.name = self.blob.name
+            self.file._committed = True
+            self.filesize = self.blob.size
+            self.mime = self.blob.mime
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                # La ligne n'est pas écrite : la référence prise sur le blob non plus
+                release_blob(self.blob_id)
+                raise
+            if previous_blob_id and previous_blob_id != self.blob_id:
+                release_blob(previous_blob_id)
+            return
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -125,6 +226,12 @@ class NotificationPref(models.Model):
     email_enabled = models.BooleanField(default=False)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Audience push : le JOIN lit push_enabled/frequency dans l'index, pas dans la table
+            models.Index(fields=['user', 'push_enabled', 'frequency']),
+        ]
+
     def __str__(self):
         return f"Prefs({self.user.username})"
 
@@ -145,6 +252,111 @@ class NewsView(models.Model):
 
     class Meta:
         unique_together = ('user', 'news')
+        indexes = [
+            # Liste paginée des lecteurs d'une news (plus récents d'abord)
+            models.Index(fields=['news', 'viewed_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} viewed {self.news.title_final}"
+
+# --- Outbox des notifications (fan-out asynchrone) ---
+class NotificationOutbox(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('processing', 'En cours'),
+        ('done', 'Envoyée'),
+        ('failed', 'Échec définitif'),
+    ]
+
+    news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='outbox_entries')
+    # Fan-out groupé (modération en masse) : toutes les news couvertes, `news` compris
+    news_ids = models.JSONField(default=list, blank=True)
+    channel = models.CharField(max_length=50, default='onesignal')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Batches déjà envoyés, sautés par les tentatives suivantes (utils.BatchProgress)
+    sent_batches = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Outbox({self.news_id}, {self.channel}, {self.status})"
+
+
+# --- Digest : news regroupées par fenêtre pour les fréquences daily/weekly ---
+class DigestItem(models.Model):
+    news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='digest_items')
+    program = models.ForeignKey(Program, on_delete=models.CASCADE)
+    frequency = models.CharField(max_length=10, choices=NotificationPref.FREQUENCY_CHOICES)
+    window_end = models.DateTimeField()
+    # Digest clos : envoyé, ou abandonné après OUTBOX_MAX_ATTEMPTS (last_error)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Reprise après échec, commune aux entrées d'une fenêtre (voir core.digest)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    sent_batches = models.JSONField(default=dict, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('news', 'frequency')
+        indexes = [
+            models.Index(fields=['sent_at', 'window_end']),
+        ]
+
+    def __str__(self):
+        return f"Digest {self.frequency} ({self.window_end:%Y-%m-%d %H:%M}) - {self.news_id}"
+
+
+# --- Index des news non lues, par utilisateur et par programme ---
+class ReadState(models.Model):
+    """
+    Toutes les news validées du programme avec moderated_at <= read_until
+    sont considérées comme lues ; au-delà, les lectures sont celles de
+    NewsView. unread_count est maintenu de façon incrémentale (badge).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='read_states')
+    program = models.ForeignKey(Program, on_delete=models.CASCADE, related_name='read_states')
+    read_until = models.DateTimeField(null=True, blank=True)
+    unread_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'program')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.program.name} ({self.unread_count} non lues)"
+
+
+# --- Statistiques de lecture (compteur dénormalisé de NewsView) ---
+class NewsStats(models.Model):
+    news = models.OneToOneField(News, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    views_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Le classement top-N (-views_count, -news_id) se lit directement dans l'index
+            models.Index(fields=['views_count', 'news']),
+        ]
+
+    def __str__(self):
+        return f"Stats({self.news_id}): {self.views_count} vues"
+
+
+# --- Génération d'un cache, partagée par tous les processus (voir core.caching) ---
+class CacheGeneration(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    generation = models.BigIntegerField()
+    modified = models.FloatField()  # timestamp de la dernière invalidation
 
     def __str__(self):
-        return f"{self.user.username} viewed {self.news.title_final}"
\ No newline at end of file
+        return f"{self.name}: {self.generation}"
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.utils import timezone
+from .caching import invalidate_news_cache
+from .models import Moderation, News
+from .publication import news_published, news_unapproved, stamp_approval
+
+# Nombre maximal de news par appel de modération en masse
+BULK_MODERATE_MAX_IDS = 500
+
+
+def moderate_news_bulk(news_ids, approved, moderator, comment=''):
+    """
+    Valide ou refuse plusieurs news en une transaction.
+    
+    - une ligne Moderation par news (bulk_create)
+    - les news nouvellement validées d'un même programme partagent une
+      seule entrée d'outbox, donc un seul fan-out par programme
+    - les news avec une date de publication future sont laissées au
+      planificateur (voir core.scheduler)
+    - les clients du flux temps réel reçoivent un événement par news
+      publiée ou dé-validée, après le commit
+    
+    Les UPDATE et bulk_create n'envoient pas de signaux : le cache des
+    news est invalidé ici, une fois.
+    
+    Returns:
+        dict: moderated, newly_approved, unapproved, notifications (entrées d'outbox)
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        news_list = list(
+            News.objects.filter(pk__in=news_ids)
+            .only(
+                'id', 'program_id', 'moderator_approved', 'moderated_at', 'publish_date_requested',
+                'publish_date_effective', 'created_at', 'title_draft', 'title_final', 'importance',
+            )
+            .order_by('-created_at', '-id')
+        )
+        ids = [news.pk for news in news_list]
+        changed = [news for news in news_list if news.moderator_approved != approved]
+
+        News.objects.filter(pk__in=ids).update(moderator_approved=approved, moderator=moderator, updated_at=now)
+        Moderation.objects.bulk_create([
+            Moderation(news_id=news.pk, moderator=moderator, approved=approved, comment=comment)
+            for news in news_list
+        ])
+
+        # Même suite que News.save() (voir core.publication), en une requête par étape
+        notifications = 0
+        if approved:
+            published = []
+            for news in changed:
+                news.moderator_approved = True
+                if stamp_approval(news, now):
+                    published.append(news)
+            News.objects.bulk_update(changed, ['moderated_at', 'publish_date_effective'])
+            notifications = news_published(published)
+        else:
+            news_unapproved(changed)
+
+    invalidate_news_cache()
+
+    return {
+        'moderated': len(news_list),
+        'newly_approved': len(changed) if approved else 0,
+        'unapproved': 0 if approved else len(changed),
+        'notifications': notifications,
+        'missing': sorted(set(news_ids) - set(ids)),
+    }
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import ssl
+from itertools import islice
+from urllib.parse import urlsplit
+from asgiref.sync import sync_to_async
+from .metrics import timed_http
+from .utils import (
+    AUDIENCE_CHUNK_SIZE,
+    ONESIGNAL_API_URL,
+    ONESIGNAL_HEADERS,
+    ONESIGNAL_MAX_CONCURRENCY,
+    ONESIGNAL_MAX_IDS_PER_REQUEST,
+    ONESIGNAL_MAX_RETRIES,
+    NotificationBatch,
+    add_news_to_digests,
+    build_digest_content,
+    build_notification_payload,
+    iter_news_audience,
+    parse_retry_after,
+)
+
+# Délai maximal (secondes) d'un appel OneSignal, connexion comprise
+ONESIGNAL_TIMEOUT = 30
+
+
+class AsyncHTTPResponse:
+    def __init__(self, status, headers, body):
+        self.status_code = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', 'replace')
+
+
+class AsyncOneSignalClient:
+    """
+    Client HTTP/1.1 asyncio (bibliothèque standard) pour l'API OneSignal.
+
+    Les connexions keep-alive sont gardées dans un pool d'au plus
+    `max_connections` ; un appel attend une connexion libre au lieu d'en
+    ouvrir une nouvelle. Toute la concurrence tient dans une seule boucle
+    d'événements, sans thread par requête.
+    """
+
+    def __init__(self, url=ONESIGNAL_API_URL, headers=ONESIGNAL_HEADERS, max_connections=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.secure = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.secure else 80)
+        self.path = parts.path or '/'
+        self.headers = headers
+        self.max_connections = max_connections or ONESIGNAL_MAX_CONCURRENCY
+        self._idle = []
+        self._slots = asyncio.Semaphore(self.max_connections)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _open(self):
+        context = ssl.create_default_context() if self.secure else None
+        return await asyncio.open_connection(self.host, self.port, ssl=context)
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connexion fermée par le serveur")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            headers['connection'] = 'close'
+        return AsyncHTTPResponse(status, headers, body)
+
+    async def post(self, body):
+        """
+        POST `body` (bytes) sur l'URL de l'API, en réutilisant une connexion du pool.
+        """
+        request_headers = {
+            'Host': self.host,
+            'Content-Length': str(len(body)),
+            'Connection': 'keep-alive',
+            **self.headers,
+        }
+        head = f"POST {self.path} HTTP/1.1\r\n" + ''.join(
+            f"{name}: {value}\r\n" for name, value in request_headers.items()
+        ) + "\r\n"
+
+        async with self._slots:
+            # Une connexion reprise du pool a pu être fermée par le serveur : un nouvel essai sur une neuve
+            for reused in (bool(self._idle), False):
+                reader, writer = self._idle.pop() if reused else await self._open()
+                try:
+                    writer.write(head.encode('latin-1') + body)
+                    await writer.drain()
+                    response = await self._read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if response.headers.get('connection', '').lower() == 'close':
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer))
+                return response
+
+    async def send_batch(self, external_ids, send_after, news, batch_label, content=None):
+        """
+        Équivalent asyncio de utils.send_notification_batch (mêmes retries sur 429).
+
+        Returns:
+            tuple: (success_count, error_count)
+        """
+        if not external_ids:
+            return 0, 0
+        body = json.dumps(build_notification_payload(external_ids, send_after, news, content)).encode()
+
+        try:
+            for attempt in range(ONESIGNAL_MAX_RETRIES + 1):
+                with timed_http():
+                    response = await asyncio.wait_for(self.post(body), ONESIGNAL_TIMEOUT)
+                if response.status_code != 429 or attempt == ONESIGNAL_MAX_RETRIES:
+                    break
+                delay = parse_retry_after(response.headers.get('retry-after'), default=2 ** attempt)
+                print(f"🐢 Batch {batch_label} limité (429), nouvel essai dans {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+            if response.status_code == 200:
+                print(f"✅ Batch {batch_label} envoyé ({len(external_ids)} utilisateurs)")
+                return len(external_ids), 0
+            print(f"❌ Erreur batch {batch_label} ({response.status_code}): {response.text[:200]}")
+            return 0, len(external_ids)
+
+        except asyncio.TimeoutError:
+            print(f"⏱️ Timeout batch {batch_label} ({len(external_ids)} utilisateurs)")
+            return 0, len(external_ids)
+        except Exception as e:
+            print(f"⚠️ Erreur batch {batch_label}: {e}")
+            return 0, len(external_ids)
+
+
+async def send_news_group_notification_async(news_list, client=None, progress=None):
+    """
+    Équivalent asyncio de utils.send_news_group_notification (une news :
+    send_news_notification).
+
+    Les destinataires immédiats sont lus par paquets et chaque
+    batch de ONESIGNAL_MAX_IDS_PER_REQUEST part dès qu'il est plein ; le
+    pool du client borne le nombre d'appels simultanés et, comme
+    dispatch_notification_batches, la lecture attend dès que
+    2 × max_connections batches sont en cours : la mémoire reste bornée
+    quelle que soit l'audience. `progress` comme pour
+    send_news_notification (reprise par l'outbox).
+
+    Returns:
+        tuple: (success_count, error_count)
+    """
+    for news in news_list:
+        await sync_to_async(add_news_to_digests)(news)
+    news = news_list[0]
+    content = build_digest_content(news_list) if len(news_list) > 1 else None
+
+    owns_client = client is None
+    client = client or AsyncOneSignalClient()
+    in_flight = set()
+    submitted = 0
+    total_success = total_errors = 0
+    batch = []
+
+    async def send(job):
+        success, errors = await client.send_batch(job.external_ids, None, news, job.batch_num, content)
+        if progress:
+            await sync_to_async(progress.batch_done)(job, success, errors)
+        return success, errors
+
+    async def collect(return_when):
+        nonlocal total_success, total_errors
+        done, _ = await asyncio.wait(in_flight, return_when=return_when)
+        in_flight.difference_update(done)
+        for task in done:
+            success, errors = task.result()
+            total_success += success
+            total_errors += errors
+
+    async def submit():
+        nonlocal submitted
+        if len(in_flight) >= client.max_connections * 2:
+            await collect(asyncio.FIRST_COMPLETED)
+        submitted += 1
+        job = NotificationBatch(batch, None, f"immediate #{submitted}", key='immediate')
+        in_flight.add(asyncio.create_task(send(job)))
+
+    # QuerySet.aiterator() exécute un values_list() multi-colonnes dans la
+    # boucle (SynchronousOnlyOperation) : le curseur est lu dans le thread de la base
+    rows = iter_news_audience(news, frequencies=['immediate'])
+    next_chunk = sync_to_async(lambda: list(islice(rows, AUDIENCE_CHUNK_SIZE)))
+
+    try:
+        while chunk := await next_chunk():
+            for external_id, frequency in chunk:
+                if progress and progress.is_sent(frequency, external_id):
+                    continue
+                batch.append(external_id)
+                if len(batch) >= ONESIGNAL_MAX_IDS_PER_REQUEST:
+                    await submit()
+                    batch = []
+        if batch:
+            await submit()
+        if in_flight:
+            await collect(asyncio.ALL_COMPLETED)
+    finally:
+        # Erreur (lecture de l'audience, progress) : les envois restants sont annulés et attendus
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        if owns_client:
+            await client.close()
+
+    if not submitted:
+        print("ℹ️ Aucun destinataire push immédiat pour ce programme")
+    return total_success, total_errors
+
+
+async def send_news_notification_async(news, client=None):
+    """
+    Équivalent asyncio de utils.send_news_notification.
+    """
+    return await send_news_group_notification_async([news], client)
@@ -0,0 +1,214 @@
+import asyncio
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import News, NotificationOutbox, PublicationLog
+from .onesignal_async import AsyncOneSignalClient, send_news_group_notification_async
+from .utils import BatchProgress, send_news_group_notification, send_news_notification
+
+# Nombre maximal de tentatives avant de marquer une entrée en échec définitif
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+# Délai de base (secondes) du backoff exponentiel : 30s, 60s, 120s, ...
+OUTBOX_BACKOFF_BASE = getattr(settings, 'OUTBOX_BACKOFF_BASE', 30)
+OUTBOX_BACKOFF_MAX = 3600
+# Durée du verrou d'un worker sur une entrée ; passé ce délai, une entrée
+# restée "processing" (worker tué) est reprise par un autre worker.
+OUTBOX_LEASE_SECONDS = getattr(settings, 'OUTBOX_LEASE_SECONDS', 300)
+
+
+def enqueue_news_notification(news, channel='onesignal'):
+    """
+    Ajoute une notification à l'outbox.
+    
+    À appeler dans la même transaction que la validation de la news :
+    si la transaction est annulée, l'entrée disparaît avec elle.
+    """
+    return NotificationOutbox.objects.create(news=news, channel=channel)
+
+
+def enqueue_news_group_notification(news_list, channel='onesignal'):
+    """
+    Ajoute une seule entrée d'outbox pour plusieurs news d'un même
+    programme : un seul fan-out au lieu d'un par news.
+    """
+    if len(news_list) == 1:
+        return enqueue_news_notification(news_list[0], channel)
+    return NotificationOutbox.objects.create(
+        news=news_list[0], news_ids=[news.pk for news in news_list], channel=channel
+    )
+
+
+def get_entry_news(entry):
+    """
+    News couvertes par une entrée, relues au moment de l'envoi : une news
+    dé-validée entre-temps n'est plus envoyée.
+    """
+    return list(
+        News.objects.filter(pk__in=entry.news_ids or [entry.news_id], moderator_approved=True)
+        .select_related('program')
+        .order_by('-created_at', '-id')
+    )
+
+
+def get_entry_progress(entry):
+    """
+    Batches déjà envoyés par les tentatives précédentes de l'entrée.
+
+    Chaque batch réussi est enregistré tout de suite et prolonge le verrou
+    du worker : une reprise (échec, worker tué) ne renvoie que les autres.
+    """
+    def save(state):
+        entry.sent_batches = state
+        NotificationOutbox.objects.filter(pk=entry.pk).update(
+            sent_batches=state, locked_until=timezone.now() + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        )
+    return BatchProgress(entry.sent_batches, on_record=save)
+
+
+def compute_backoff(attempts):
+    """
+    Délai avant la prochaine tentative après `attempts` échecs.
+    """
+    return timedelta(seconds=min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX))
+
+
+def claim_due_entries(limit=50):
+    """
+    Réserve jusqu'à `limit` entrées dues pour ce worker.
+    
+    La réservation se fait par UPDATE conditionnel (pas de SELECT FOR UPDATE
+    sous SQLite) : une entrée n'est prise que si personne ne l'a réservée
+    entre-temps, ou si le verrou précédent a expiré.
+    """
+    now = timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='processing', locked_until__lt=now)
+    candidate_ids = list(
+        NotificationOutbox.objects.filter(due)
+        .order_by('next_attempt_at')
+        .values_list('id', flat=True)[:limit]
+    )
+
+    claimed = []
+    lease = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    for entry_id in candidate_ids:
+        updated = NotificationOutbox.objects.filter(due, pk=entry_id).update(
+            status='processing', locked_until=lease
+        )
+        if updated:
+            claimed.append(entry_id)
+
+    return list(
+        NotificationOutbox.objects.filter(pk__in=claimed)
+        .select_related('news', 'news__program')
+        .order_by('next_attempt_at')
+    )
+
+
+def process_entry(entry):
+    """
+    Exécute le fan-out d'une entrée et enregistre le résultat.
+    
+    Sémantique at-least-once : l'entrée n'est marquée "done" qu'après un envoi
+    sans erreur ; en cas d'échec (même partiel), elle est reprogrammée et
+    la tentative suivante n'envoie que les batches en échec (sent_batches).
+    
+    Returns:
+        bool: True si l'envoi a réussi
+    """
+    entry.attempts += 1
+    news_list = get_entry_news(entry)
+    progress = get_entry_progress(entry)
+    try:
+        if not news_list:
+            errors = 0
+        elif entry.news_ids:
+            _, errors = send_news_group_notification(news_list, progress)
+        else:
+            _, errors = send_news_notification(news_list[0], progress)
+    except Exception as e:
+        return record_entry_result(entry, news_list, progress, str(e))
+    return record_entry_result(entry, news_list, progress, f"{errors} envois en échec" if errors else '')
+
+
+async def process_entry_async(entry, client):
+    """
+    process_entry avec le client OneSignal asyncio : les envois de
+    plusieurs entrées se font en parallèle dans une seule boucle.
+    """
+    entry.attempts += 1
+    news_list = await sync_to_async(get_entry_news)(entry)
+    progress = get_entry_progress(entry)
+    try:
+        _, errors = await send_news_group_notification_async(news_list, client, progress) if news_list else (0, 0)
+    except Exception as e:
+        return await sync_to_async(record_entry_result)(entry, news_list, progress, str(e))
+    return await sync_to_async(record_entry_result)(
+        entry, news_list, progress, f"{errors} envois en échec" if errors else ''
+    )
+
+
+def record_entry_result(entry, news_list, progress, error_message):
+    """
+    Marque l'entrée "done" (avec un PublicationLog par news, destinataires
+    de toutes les tentatives comptés) ou la reprogramme.
+    """
+    now = timezone.now()
+    if not error_message:
+        with transaction.atomic():
+            PublicationLog.objects.bulk_create([
+                PublicationLog(
+                    news=news,
+                    scheduled_at=entry.created_at,
+                    published_at=now,
+                    channel=entry.channel,
+                    sent_count=progress.sent(),
+                )
+                for news in news_list
+            ])
+            entry.status = 'done'
+            entry.locked_until = None
+            entry.last_error = ''
+            entry.save(update_fields=['status', 'attempts', 'locked_until', 'last_error', 'updated_at'])
+        return True
+
+    if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+        entry.status = 'failed'
+    else:
+        entry.status = 'pending'
+        entry.next_attempt_at = now + compute_backoff(entry.attempts)
+    entry.locked_until = None
+    entry.last_error = error_message
+    entry.save(update_fields=['status', 'attempts', 'next_attempt_at', 'locked_until', 'last_error', 'updated_at'])
+    return False
+
+
+def process_outbox(limit=50):
+    """
+    Traite un lot d'entrées dues.
+    
+    Returns:
+        tuple: (processed_count, failed_count)
+    """
+    entries = claim_due_entries(limit)
+    failed = 0
+    for entry in entries:
+        if not process_entry(entry):
+            failed += 1
+    return len(entries), failed
+
+
+async def process_outbox_async(limit=50):
+    """
+    process_outbox avec le client OneSignal asyncio (commande process_outbox --async).
+    
+    Returns:
+        tuple: (processed_count, failed_count)
+    """
+    entries = await sync_to_async(claim_due_entries)(limit)
+    async with AsyncOneSignalClient() as client:
+        results = await asyncio.gather(*(process_entry_async(entry, client) for entry in entries))
+    return len(entries), results.count(False)
+
@@ -0,0 +1,196 @@
+import json
+from base64 import b64decode, b64encode
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur (keyset) sur (champ, id).
+    
+    Chaque page est lue avec WHERE (champ, id) < (dernier champ, dernier id)
+    ... LIMIT n : pas de COUNT(*) ni d'OFFSET, le coût reste constant quelle
+    que soit la profondeur. Les valeurs NULL (publish_date_effective) sont
+    placées comme le fait SQLite : en premier en tri croissant, en dernier
+    en tri décroissant.
+    
+    ?ordering= choisit le champ parmi `keyset_fields`. Avec ?search=, ?page=
+    ou un autre tri (ex. importance), on retombe sur la pagination par
+    numéro de page. `id_field` départage les égalités sur le champ.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    default_ordering = '-created_at'
+    keyset_fields = ('created_at', 'publish_date_effective')
+    fallback_params = ('search', 'page')
+    fallback_class = PageNumberPagination
+    id_field = 'id'
+
+    def get_ordering(self, request):
+        return request.query_params.get(self.ordering_param) or self.default_ordering
+
+    def uses_fallback(self, request):
+        """
+        True si la requête doit être paginée par numéro de page.
+        """
+        requested = self.get_ordering(request)
+        return requested.lstrip('-') not in self.keyset_fields or any(
+            request.query_params.get(param) for param in self.fallback_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fallback = None
+
+        if self.uses_fallback(request):
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        # Chaque segment est une plage d'index lue dans l'ordre ; on ne passe
+        # au suivant (ex. les NULL) que si la page n'est pas encore pleine.
+        results = []
+        for segment_queryset in self.get_segment_querysets(queryset, request):
+            limit = self.page_size + 1 - len(results)
+            results += list(segment_queryset[:limit])
+            if len(results) > self.page_size:
+                break
+        return self.finish_page(results)
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        paginate_queryset avec l'ORM asynchrone (vues ASGI, voir core.async_views).
+        
+        Le repli par numéro de page n'est pas géré ici : l'appelant vérifie
+        uses_fallback() et délègue à la vue synchrone.
+        """
+        self.request = request
+        self.fallback = None
+
+        results = []
+        for segment_queryset in self.get_segment_querysets(queryset, request):
+            limit = self.page_size + 1 - len(results)
+            results += [obj async for obj in segment_queryset[:limit]]
+            if len(results) > self.page_size:
+                break
+        return self.finish_page(results)
+
+    def get_segment_querysets(self, queryset, request):
+        requested = self.get_ordering(request)
+        self.field = requested.lstrip('-')
+        self.descending = requested.startswith('-')
+        id_ordering = f'-{self.id_field}' if self.descending else self.id_field
+        queryset = queryset.order_by(requested, id_ordering)
+
+        self.nullable = queryset.model._meta.get_field(self.field).null
+        position = self.decode_cursor(request, queryset.model)
+        return [queryset.filter(segment) for segment in self.get_segments(position)]
+
+    def finish_page(self, results):
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.has_next:
+            last = results[-1]
+            if isinstance(last, dict):
+                # Lignes .values() (voir core.fastserializers)
+                self.next_position = (last[self.field], last[self.id_field])
+            else:
+                self.next_position = (getattr(last, self.field), getattr(last, self.id_field))
+        return results
+
+    def get_segments(self, position):
+        """
+        Conditions successives pour lire la suite de la page après `position`.
+        
+        Les comparaisons sont écrites sous la forme
+        « champ <= v AND (champ < v OR id < pk) » pour que SQLite parcoure
+        l'index (champ, id) à partir du curseur au lieu de le scanner.
+        """
+        field = self.field
+        id_field = self.id_field
+        is_null = Q(**{f'{field}__isnull': True})
+        not_null = Q(**{f'{field}__isnull': False})
+
+        if self.descending:
+            # Ordre SQLite : valeurs décroissantes, puis NULL
+            if position is None:
+                return [not_null, is_null] if self.nullable else [Q()]
+            value, pk = position
+            if value is None:
+                return [is_null & Q(**{f'{id_field}__lt': pk})]
+            after = Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(**{f'{id_field}__lt': pk}))
+            return [after, is_null] if self.nullable else [after]
+
+        # Ordre SQLite : NULL, puis valeurs croissantes
+        if position is None:
+            return [is_null, not_null] if self.nullable else [Q()]
+        value, pk = position
+        if value is None:
+            return [is_null & Q(**{f'{id_field}__gt': pk}), not_null]
+        return [Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(**{f'{id_field}__gt': pk}))]
+
+    def encode_cursor(self, value, pk):
+        # Dates en ISO (microsecondes comprises), entiers tels quels
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value, pk])
+        return b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(b64decode(encoded.encode()).decode())
+            if value is not None:
+                value = model._meta.get_field(self.field).to_python(value)
+            return value, int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Curseur invalide')
+
+    def get_next_link(self):
+        if self.fallback is not None:
+            return self.fallback.get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class ViewerPagination(KeysetPagination):
+    """
+    Lecteurs d'une news, plus récents d'abord (index (news, viewed_at, id)).
+    """
+    default_ordering = '-viewed_at'
+    keyset_fields = ('viewed_at',)
+
+
+class LeaderboardPagination(KeysetPagination):
+    """
+    Classement des news les plus lues (index (views_count, news) de
+    NewsStats), news_id départageant les égalités. La page suivante est
+    annoncée dans l'en-tête Link : la réponse reste une liste.
+    """
+    default_ordering = '-views_count'
+    keyset_fields = ('views_count',)
+    fallback_params = ()
+    id_field = 'news_id'
+
+    def get_ordering(self, request):
+        # Ordre fixe : pas de ?ordering= ni de repli par numéro de page
+        return self.default_ordering
+
+    def get_paginated_response(self, data):
+        next_link = self.get_next_link()
+        return Response(data, headers={'Link': f'<{next_link}>; rel="next"'} if next_link else None)
@@ -0,0 +1,21 @@
+"""
+Hachage des mots de passe dans des processus `spawn`.
+
+Module volontairement sans import de modèles : les workers le
+réimportent avant que Django ne soit initialisé.
+"""
+import os
+
+
+def init_hash_worker():
+    # PASSWORD_HASHERS vient des settings : Django initialisé une fois par worker
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ccc_backend.settings')
+    import django
+    django.setup()
+
+
+def hash_password(raw):
+    from django.contrib.auth.hashers import make_password
+
+    # Mot de passe absent : compte inutilisable jusqu'à réinitialisation
+    return make_password(raw or None)
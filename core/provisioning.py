@@ -0,0 +1,290 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import NotificationPref, Program, ReadState, Role, Subscription, UserRole
+from .passwords import hash_password, init_hash_worker
+from .unread import rebuild_read_states
+
+# Utilisateurs insérés par transaction
+PROVISIONING_CHUNK_SIZE = 500
+# Rôle attribué à chaque compte importé (comme signup)
+PROVISIONING_DEFAULT_ROLE = 'Étudiant'
+USER_FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+# Taille du pool partagé par les imports de l'API (voir get_shared_hash_pool)
+PROVISIONING_API_WORKERS = getattr(settings, 'PROVISIONING_API_WORKERS', 2)
+
+# Ligne écartée dès la lecture (JSON invalide, pas un objet...) : message d'erreur
+ROW_ERROR = '_error'
+
+_shared_hash_pool = None
+_shared_hash_pool_lock = threading.Lock()
+
+
+def parse_user_rows(stream, fmt):
+    """
+    Lit les comptes à importer, un dict par ligne.
+    
+    - csv : en-tête avec au moins `username` ; `programs` et `roles`
+      séparés par des ';'
+    - ndjson : un objet JSON par ligne ; `programs`/`roles` en liste ou chaîne
+
+    Une ligne illisible est rendue avec son message sous ROW_ERROR, puis
+    signalée dans les erreurs de l'import comme un doublon.
+    """
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.StringIO(stream.decode('utf-8-sig'))
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        rows = iter_ndjson_rows(stream)
+    else:
+        raise ValueError(f"Format inconnu : {fmt} (csv ou ndjson)")
+    for row in rows:
+        if ROW_ERROR in row:
+            yield row
+            continue
+        if not isinstance(row.get('username') or '', str):
+            row[ROW_ERROR] = "username doit être une chaîne"
+        for key in ('programs', 'roles'):
+            value = row.get(key) or []
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(';') if item.strip()]
+            elif not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                row[ROW_ERROR] = f"{key} doit être une liste de chaînes"
+                value = []
+            row[key] = value
+        yield row
+
+
+def iter_ndjson_rows(stream):
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield {ROW_ERROR: f"ligne {number} : JSON invalide ({e})"}
+            continue
+        if not isinstance(row, dict):
+            yield {ROW_ERROR: f"ligne {number} : objet JSON attendu"}
+            continue
+        yield row
+
+
+def detect_format(filename, content_type=''):
+    if filename.endswith('.csv') or content_type == 'text/csv':
+        return 'csv'
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type:
+        return 'ndjson'
+    return None
+
+
+def get_hash_pool(workers=None):
+    return ProcessPoolExecutor(
+        max_workers=workers or getattr(settings, 'PROVISIONING_WORKERS', None) or os.cpu_count(),
+        mp_context=get_context('spawn'),
+        initializer=init_hash_worker,
+    )
+
+
+def get_shared_hash_pool():
+    """
+    Pool de hachage des imports lancés par l'API : créé au premier import
+    puis réutilisé par les requêtes suivantes du processus, avec au plus
+    PROVISIONING_API_WORKERS processus (voir replace_broken_pool).
+    """
+    global _shared_hash_pool
+    with _shared_hash_pool_lock:
+        if _shared_hash_pool is None:
+            _shared_hash_pool = get_hash_pool(PROVISIONING_API_WORKERS)
+        return _shared_hash_pool
+
+
+def replace_broken_pool(pool, workers=None):
+    """
+    Remplace un pool qui a levé BrokenProcessPool (worker tué, OOM) ; le
+    pool partagé de l'API est remplacé pour tout le processus, une seule
+    fois si plusieurs imports le voient casser.
+    """
+    global _shared_hash_pool
+    pool.shutdown(wait=False)
+    with _shared_hash_pool_lock:
+        if pool is _shared_hash_pool:
+            _shared_hash_pool = get_hash_pool(PROVISIONING_API_WORKERS)
+            return _shared_hash_pool
+    return get_hash_pool(workers)
+
+
+def iter_chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_chunk(chunk, seen_usernames, seen_emails):
+    """
+    Écarte les lignes invalides ou déjà présentes (dans le fichier ou en base).
+    
+    Returns:
+        tuple: (lignes valides, liste d'erreurs {'username', 'error'})
+    """
+    valid, errors = [], []
+    readable = [row for row in chunk if ROW_ERROR not in row]
+    usernames = [row.get('username') for row in readable if row.get('username')]
+    emails = [row.get('email') for row in readable if row.get('email')]
+    existing_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    existing_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    for row in chunk:
+        username, email = row.get('username'), row.get('email')
+        if ROW_ERROR in row:
+            errors.append({'username': username if isinstance(username, str) else None, 'error': row[ROW_ERROR]})
+        elif not username:
+            errors.append({'username': None, 'error': "username requis"})
+        elif username in existing_usernames or username in seen_usernames:
+            errors.append({'username': username, 'error': "nom d'utilisateur déjà utilisé"})
+        elif email and (email in existing_emails or email in seen_emails):
+            errors.append({'username': username, 'error': "email déjà utilisé"})
+        else:
+            seen_usernames.add(username)
+            if email:
+                seen_emails.add(email)
+            valid.append(row)
+    return valid, errors
+
+
+def insert_chunk(rows, hashes, roles, programs, default_roles, default_programs):
+    """
+    Insère un lot d'utilisateurs et leurs rattachements, en une transaction.
+    """
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username=row['username'],
+                email=row.get('email') or '',
+                first_name=row.get('first_name') or '',
+                last_name=row.get('last_name') or '',
+                password=password_hash,
+            )
+            for row, password_hash in zip(rows, hashes)
+        ])
+        user_roles, subscriptions = [], []
+        for user, row in zip(users, rows):
+            for name in row['roles'] or default_roles:
+                if name in roles:
+                    user_roles.append(UserRole(user=user, role=roles[name]))
+            for code in set(row['programs']) | set(default_programs):
+                if code in programs:
+                    subscriptions.append(Subscription(user=user, program=programs[code]))
+        UserRole.objects.bulk_create(user_roles, ignore_conflicts=True)
+        NotificationPref.objects.bulk_create([NotificationPref(user=user) for user in users])
+        Subscription.objects.bulk_create(subscriptions)
+        # bulk_create n'envoie pas de signaux : états de lecture créés ici
+        ReadState.objects.bulk_create(
+            [ReadState(user_id=sub.user_id, program_id=sub.program_id) for sub in subscriptions],
+            ignore_conflicts=True,
+        )
+        if subscriptions:
+            rebuild_read_states(user_id__in=[user.pk for user in users])
+    return len(users)
+
+
+def provision_users(rows, chunk_size=PROVISIONING_CHUNK_SIZE, workers=None,
+                    default_roles=(PROVISIONING_DEFAULT_ROLE,), default_programs=(), pool=None):
+    """
+    Importe des comptes en masse.
+    
+    Les mots de passe (PBKDF2, coûteux en CPU) sont hachés dans un pool de
+    processus ; le lot suivant est haché pendant l'insertion du lot courant.
+    Chaque lot est inséré en bulk_create dans sa propre transaction : une
+    erreur n'annule que son lot, dont les lignes sont signalées dans
+    `errors`, et l'import continue avec le lot suivant.
+    
+    Returns:
+        dict: created, skipped, errors (lignes écartées), warnings (programmes
+        ou rôles inconnus ignorés), elapsed (s), users_per_second
+    """
+    started = time.monotonic()
+    # Rôles par défaut créés au besoin, comme signup pour 'Étudiant'
+    for name in default_roles:
+        Role.objects.get_or_create(name=name)
+    roles = {role.name: role for role in Role.objects.all()}
+    programs = {program.code: program for program in Program.objects.all()}
+    seen_usernames, seen_emails = set(), set()
+    created, errors, warnings = 0, [], []
+
+    def submit(chunk):
+        valid, chunk_errors = validate_chunk(chunk, seen_usernames, seen_emails)
+        errors.extend(chunk_errors)
+        for row in valid:
+            unknown = sorted(set(row['programs']) - programs.keys()) + sorted(set(row['roles']) - roles.keys())
+            if unknown:
+                warnings.append({'username': row['username'], 'error': f"inconnus, ignorés : {', '.join(unknown)}"})
+        return (valid, *hash_passwords(valid))
+
+    def renew_pool(broken):
+        nonlocal pool
+        if pool is broken:
+            pool = replace_broken_pool(pool, workers)
+
+    def hash_passwords(valid):
+        """
+        (hachages en cours, pool qui les calcule) ; pool remplacé s'il est cassé.
+        """
+        passwords = [row.get('password') for row in valid]
+        try:
+            return pool.map(hash_password, passwords, chunksize=64), pool
+        except BrokenProcessPool:
+            renew_pool(pool)
+            return pool.map(hash_password, passwords, chunksize=64), pool
+
+    def insert(valid, hashes, source):
+        try:
+            try:
+                hashes = list(hashes)
+            except BrokenProcessPool:
+                # Worker mort pendant le lot : re-haché une fois dans un pool neuf
+                renew_pool(source)
+                hashes = list(hash_passwords(valid)[0])
+            return insert_chunk(valid, hashes, roles, programs, default_roles, default_programs)
+        except Exception as e:
+            errors.extend({'username': row['username'], 'error': f"lot non importé : {e}"} for row in valid)
+            return 0
+
+    owns_pool = pool is None
+    pool = pool or get_hash_pool(workers)
+    try:
+        pending = None
+        for chunk in iter_chunks(rows, chunk_size):
+            submitted = submit(chunk)
+            if pending:
+                created += insert(*pending)
+            pending = submitted
+        if pending:
+            created += insert(*pending)
+    finally:
+        if owns_pool:
+            pool.shutdown()
+
+    elapsed = time.monotonic() - started
+    return {
+        'created': created,
+        'skipped': len(errors),
+        'errors': errors,
+        'warnings': warnings,
+        'elapsed': round(elapsed, 3),
+        'users_per_second': round(created / elapsed, 1) if elapsed else None,
+    }
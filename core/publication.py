@@ -0,0 +1,89 @@
+"""
+Validation, publication et dé-validation des news : un seul chemin quelle
+que soit l'origine (update_news, PATCH /news/<pk>/, création déjà validée,
+admin, modération en masse, planificateur).
+
+Une news validée est publiée tout de suite, ou à sa date demandée par
+run_scheduler (voir core.scheduler). moderated_at date la publication :
+avant, la news n'est ni dans les fils (non lues, validées) ni dans le badge.
+
+News.save() appelle news_published / news_unapproved quand
+moderator_approved change ; les UPDATE en masse (core.moderation,
+core.scheduler) les appellent directement. À appeler dans la transaction.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from .caching import invalidate_news_cache
+from .events import publish_news_moderated
+from .outbox import enqueue_news_group_notification
+from .unread import rebuild_read_states, record_news_approved_many
+
+
+def is_publication_deferred(news, today=None):
+    """
+    True si la news validée doit attendre sa date de publication demandée.
+    """
+    today = today or timezone.localdate()
+    return bool(news.publish_date_requested and news.publish_date_requested > today)
+
+
+def published_news(queryset):
+    """
+    News visibles des lecteurs : validées et publiées.
+    """
+    return queryset.filter(moderator_approved=True, moderated_at__isnull=False)
+
+
+def stamp_approval(news, now):
+    """
+    Dates d'une news qui vient d'être validée, posées sur l'instance (à
+    sauvegarder par l'appelant) : moderated_at et publish_date_effective,
+    ou aucune des deux si la date demandée est future (le planificateur
+    les posera à la publication).
+
+    Returns:
+        bool: True si la news est publiée tout de suite
+    """
+    today = timezone.localdate(now)
+    if is_publication_deferred(news, today):
+        news.moderated_at = news.publish_date_effective = None
+        return False
+    news.moderated_at = now
+    news.publish_date_effective = news.publish_date_effective or today
+    return True
+
+
+def news_published(news_list):
+    """
+    Suite d'une publication, dates déjà enregistrées :
+
+    - +1 non lue pour les abonnés de chaque programme (un UPDATE par programme)
+    - une entrée d'outbox par programme
+    - après le commit : cache des news invalidé et news.approved poussé
+      aux clients de /news/stream/
+
+    Returns:
+        int: nombre d'entrées d'outbox
+    """
+    record_news_approved_many(news_list)
+    by_program = defaultdict(list)
+    for news in news_list:
+        by_program[news.program_id].append(news)
+    for group in by_program.values():
+        enqueue_news_group_notification(group)
+    transaction.on_commit(invalidate_news_cache)
+    transaction.on_commit(lambda: publish_news_moderated(news_list, approved=True))
+    return len(by_program)
+
+
+def news_unapproved(news_list):
+    """
+    Suite d'une dé-validation : les news ne comptent plus dans les non lues,
+    et news.unapproved est poussé après le commit.
+    """
+    program_ids = {news.program_id for news in news_list if news.program_id}
+    if program_ids:
+        rebuild_read_states(program_id__in=program_ids)
+    transaction.on_commit(invalidate_news_cache)
+    transaction.on_commit(lambda: publish_news_moderated(news_list, approved=False))
@@ -0,0 +1,35 @@
+"""
+Rendu JSON par orjson (dépendance optionnelle), sortie identique au
+JSONRenderer de DRF : compacte, UTF-8, dates au format DRF.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle : JSONRenderer de DRF
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer dont le rendu compact passe par orjson.
+
+    Les dates et les types inconnus d'orjson (Decimal, chaînes traduites)
+    sont confiés à l'encodeur de DRF ; l'indentation (?format=json;indent=4),
+    ensure_ascii ou l'absence d'orjson retombent sur JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        # Comme JSONRenderer : U+2028 / U+2029 échappés (JSON intégré dans du JavaScript)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
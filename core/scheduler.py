@@ -0,0 +1,125 @@
+import heapq
+from datetime import datetime, time as dt_time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import News, PublicationLog
+from .publication import news_published
+
+# Horizon chargé en mémoire à chaque rafraîchissement de la file
+SCHEDULER_LOOKAHEAD = timedelta(seconds=getattr(settings, 'SCHEDULER_LOOKAHEAD', 3600))
+# Nombre maximal de news gardées en file (les suivantes au prochain chargement)
+SCHEDULER_QUEUE_SIZE = getattr(settings, 'SCHEDULER_QUEUE_SIZE', 1000)
+
+
+def publish_due_at(publish_date):
+    """
+    Instant de publication d'une date demandée : minuit, heure locale.
+    """
+    return timezone.make_aware(datetime.combine(publish_date, dt_time.min))
+
+
+def pending_publications(until):
+    """
+    News validées, pas encore publiées, dont la date demandée est atteinte
+    avant `until`.
+    
+    Plage de l'index (publish_date_effective, publish_date_requested, id)
+    limitée à effective IS NULL : les news déjà publiées ne sont jamais lues,
+    et l'ordre de l'index donne le tri.
+    """
+    return (
+        News.objects.filter(
+            moderator_approved=True,
+            publish_date_effective__isnull=True,
+            publish_date_requested__lte=timezone.localdate(until),
+        )
+        .order_by('publish_date_requested', 'id')
+    )
+
+
+def publish_news(news_id, scheduled_at=None, now=None):
+    """
+    Publie une news programmée : moderated_at et publish_date_effective,
+    puis non lues, fan-out et flux temps réel (voir core.publication).
+    
+    L'UPDATE conditionnel ne publie qu'une fois, même si plusieurs
+    planificateurs tournent ou si la news a été dé-validée ou reprogrammée
+    depuis son chargement en file. L'entrée d'outbox et le log sont écrits
+    dans la même transaction ; l'UPDATE n'envoie pas de signaux, le cache
+    des news est invalidé après le commit.
+    
+    Returns:
+        bool: True si la news a été publiée par cet appel
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    with transaction.atomic():
+        published = News.objects.filter(
+            pk=news_id,
+            moderator_approved=True,
+            publish_date_effective__isnull=True,
+            publish_date_requested__lte=today,
+        ).update(publish_date_effective=today, moderated_at=now, updated_at=now)
+        if not published:
+            return False
+        news = News.objects.get(pk=news_id)
+        news_published([news])
+        PublicationLog.objects.create(
+            news=news,
+            scheduled_at=scheduled_at,
+            published_at=now,
+            channel='scheduler',
+        )
+    return True
+
+
+class PublicationScheduler:
+    """
+    File des publications programmées, triée par échéance.
+    
+    La file est chargée depuis la base (news dues avant maintenant +
+    SCHEDULER_LOOKAHEAD), puis rechargée à chaque `refresh_interval` pour
+    voir les nouvelles validations. Entre deux chargements, le processus
+    dort jusqu'à la prochaine échéance. Tout l'état est en base : après un
+    redémarrage, le premier chargement reprend les news en retard.
+    """
+
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self.queue = []
+        self.next_refresh = None
+
+    def refresh(self, now=None):
+        now = now or timezone.now()
+        rows = pending_publications(now + SCHEDULER_LOOKAHEAD).values_list('id', 'publish_date_requested')
+        self.queue = [(publish_due_at(requested), news_id) for news_id, requested in rows[:SCHEDULER_QUEUE_SIZE]]
+        heapq.heapify(self.queue)
+        self.next_refresh = now + timedelta(seconds=self.refresh_interval)
+
+    def run_pending(self, now=None):
+        """
+        Publie les news échues de la file.
+        
+        Returns:
+            int: nombre de news publiées
+        """
+        now = now or timezone.now()
+        if self.next_refresh is None or now >= self.next_refresh:
+            self.refresh(now)
+        published = 0
+        while self.queue and self.queue[0][0] <= now:
+            due_at, news_id = heapq.heappop(self.queue)
+            if publish_news(news_id, scheduled_at=due_at, now=now):
+                published += 1
+        return published
+
+    def seconds_until_next(self, now=None):
+        """
+        Durée de sommeil : jusqu'à la prochaine échéance ou au prochain rechargement.
+        """
+        now = now or timezone.now()
+        wake_at = self.next_refresh
+        if self.queue:
+            wake_at = min(wake_at, self.queue[0][0])
+        return max((wake_at - now).total_seconds(), 0)
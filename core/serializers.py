@@ -1,67 +1,100 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.urls import reverse
 from .models import *
+from .derivatives import get_derivative_url
+from .metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    ModelSerializer dont le temps de sérialisation est compté dans les
+    mesures de la requête (Server-Timing, /metrics).
+    """
+
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
-class RoleSerializer(serializers.ModelSerializer):
+class RoleSerializer(ModelSerializer):
     class Meta:
         model = Role
         fields = '__all__'
 
-class ProgramSerializer(serializers.ModelSerializer):
+class ProgramSerializer(ModelSerializer):
     class Meta:
         model = Program
         fields = '__all__'
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(ModelSerializer):
     class Meta:
         model = Subscription
         fields = '__all__'
 
-class AttachmentSerializer(serializers.ModelSerializer):
+class AttachmentSerializer(ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+    # Miniature / aperçu générés en arrière-plan ; l'original tant qu'ils ne sont pas prêts
+    thumbnail_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Attachment
         fields = '__all__'
+        read_only_fields = ('blob', 'original_name', 'mime', 'filesize')
+
+    def build_url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_download_url(self, obj):
+        return self.build_url(reverse('attachment-download', args=[obj.pk]))
+
+    def get_thumbnail_url(self, obj):
+        url = get_derivative_url(obj, 'thumbnail')
+        return self.build_url(url) if url else self.get_download_url(obj)
+
+    def get_preview_url(self, obj):
+        url = get_derivative_url(obj, 'preview')
+        return self.build_url(url) if url else self.get_download_url(obj)
 
 
-class NewsSerializer(serializers.ModelSerializer):
+class NewsSerializer(ModelSerializer):
     attachments = AttachmentSerializer(many=True, read_only=True)
+    # Extrait surligné, présent uniquement avec ?search= (voir NewsSearchFilter)
+    search_snippet = serializers.CharField(read_only=True)
     class Meta:
         model = News
         fields = '__all__'
 
-class ModerationSerializer(serializers.ModelSerializer):
+class ModerationSerializer(ModelSerializer):
     class Meta:
         model = Moderation
         fields = '__all__'
 
 
-class PublicationLogSerializer(serializers.ModelSerializer):
+class PublicationLogSerializer(ModelSerializer):
     class Meta:
         model = PublicationLog
         fields = '__all__'
 
-class NotificationPrefSerializer(serializers.ModelSerializer):
+class NotificationPrefSerializer(ModelSerializer):
     class Meta:
         model = NotificationPref
         fields = '__all__'
         
-class UserRoleSerializer(serializers.ModelSerializer):
+class UserRoleSerializer(ModelSerializer):
     class Meta:
         model = UserRole
         fields = '__all__'
 
-class PushSubscriptionSerializer(serializers.ModelSerializer):
+class PushSubscriptionSerializer(ModelSerializer):
     class Meta:
         model = PushSubscription
         fields = '__all__'
 
 
-class NewsViewSerializer(serializers.ModelSerializer):
+class NewsViewSerializer(ModelSerializer):
     class Meta:
         model = NewsView
         fields = '__all__'
\ No newline at end of file
@@ -0,0 +1,104 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .authentication import invalidate_all_users, invalidate_user
+from .caching import invalidate_news_cache
+from .db import apply_sqlite_pragmas
+from .derivatives import schedule_derivatives
+from .models import Attachment, Moderation, News, NewsStats, NewsView, ReadState, Role, Subscription, UserRole
+from .stats import increment_news_views
+from .storage import release_blob
+from .unread import create_read_state, rebuild_read_states
+
+
+# --- Connexions SQLite (profil production) ---
+connection_created.connect(apply_sqlite_pragmas)
+
+
+# --- Cache d'authentification ---
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def user_role_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_changed(sender, instance, **kwargs):
+    # Un rôle renommé concerne tous ses utilisateurs
+    invalidate_all_users()
+
+
+# --- Index des non lues ---
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        create_read_state(instance.user_id, instance.program_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    ReadState.objects.filter(user_id=instance.user_id, program_id=instance.program_id).delete()
+
+
+@receiver(post_delete, sender=News)
+def news_deleted(sender, instance, **kwargs):
+    # L'instance peut être périmée (validée depuis) : on recalcule dans tous les cas
+    if instance.program_id:
+        rebuild_read_states(program_id=instance.program_id)
+
+
+# --- Cache des réponses news ---
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def news_changed(sender, instance, **kwargs):
+    invalidate_news_cache()
+
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+@receiver(post_save, sender=Moderation)
+@receiver(post_delete, sender=Moderation)
+def news_child_changed(sender, instance, **kwargs):
+    # Une pièce jointe ou une modération change la news : Last-Modified suit
+    News.objects.filter(pk=instance.news_id).update(updated_at=timezone.now())
+    invalidate_news_cache()
+
+
+# --- Stockage adressé par contenu ---
+@receiver(post_save, sender=Attachment)
+def attachment_saved(sender, instance, **kwargs):
+    # Les dérivés déjà présents sont ignorés : resauvegarder ne coûte rien
+    schedule_derivatives(instance)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+# --- Compteurs de vues ---
+@receiver(post_save, sender=News)
+def news_created_stats(sender, instance, created, **kwargs):
+    if created:
+        NewsStats.objects.get_or_create(news=instance)
+
+
+@receiver(post_save, sender=NewsView)
+def news_view_created(sender, instance, created, **kwargs):
+    if created:
+        increment_news_views(instance.news_id, 1)
+
+
+@receiver(post_delete, sender=NewsView)
+def news_view_deleted(sender, instance, **kwargs):
+    increment_news_views(instance.news_id, -1)
@@ -0,0 +1,43 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import NewsStats
+
+# Taille par défaut et maximale du classement des news les plus lues
+LEADERBOARD_DEFAULT_SIZE = 50
+LEADERBOARD_MAX_SIZE = 500
+
+
+def increment_news_views(news_id, delta=1):
+    """
+    Ajoute `delta` au compteur de vues d'une news (UPDATE atomique).
+    La ligne NewsStats est créée si besoin (news créées par bulk_create).
+    """
+    if not delta:
+        return
+    updated = NewsStats.objects.filter(news_id=news_id).update(views_count=F('views_count') + delta)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            NewsStats.objects.create(news_id=news_id, views_count=max(delta, 0))
+    except IntegrityError:
+        # Créée entre-temps par une requête concurrente
+        NewsStats.objects.filter(news_id=news_id).update(views_count=F('views_count') + delta)
+
+
+def increment_many_news_views(counts):
+    """
+    Applique plusieurs incréments : {news_id: delta}.
+    """
+    for news_id, delta in counts.items():
+        increment_news_views(news_id, delta)
+
+
+def leaderboard_queryset():
+    """
+    Compteurs de vues des news, à paginer avec LeaderboardPagination :
+    chaque page se lit dans l'index de views_count (coût proportionnel à
+    la taille de page, pas au nombre de vues). Toute news a sa ligne
+    NewsStats, même insérée par bulk_create (trigger, migration 0019).
+    """
+    return NewsStats.objects.values('news_id', 'news__title_final', 'views_count')
@@ -0,0 +1,234 @@
+import fcntl
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+from .models import Blob
+
+# Taille des morceaux lus/écrits : aucun fichier n'est chargé en entier en mémoire
+STORAGE_CHUNK_SIZE = 64 * 1024
+# Délégation de l'envoi au serveur web : 'X-Accel-Redirect' (nginx), 'X-Sendfile' (Apache/lighttpd) ou None
+ATTACHMENT_SENDFILE_HEADER = getattr(settings, 'ATTACHMENT_SENDFILE_HEADER', None)
+# Préfixe de la location interne nginx qui sert MEDIA_ROOT (X-Accel-Redirect)
+ATTACHMENT_ACCEL_PREFIX = getattr(settings, 'ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_path(name):
+    return Path(settings.MEDIA_ROOT) / name
+
+
+@contextmanager
+def blob_files_lock():
+    """
+    Verrou (flock, partagé entre processus) autour de la création et de la
+    suppression des fichiers de blobs : un envoi du contenu qu'on est en
+    train de supprimer ne peut pas perdre son fichier.
+    """
+    lock_path = media_path('blobs/.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def store_uploaded_file(uploaded):
+    """
+    Écrit un fichier envoyé dans le stockage adressé par contenu.
+    
+    Le fichier est copié morceau par morceau dans un fichier temporaire
+    tout en calculant son SHA-256 ; si ce contenu existe déjà, la copie
+    est supprimée et le Blob existant gagne une référence.
+    
+    Returns:
+        Blob: le blob référencé (ref_count déjà incrémenté)
+    """
+    tmp_dir = media_path('blobs/tmp')
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in uploaded.chunks(STORAGE_CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        mime = (
+            getattr(uploaded.file, 'content_type', None)
+            or mimetypes.guess_type(uploaded.name)[0]
+            or ''
+        )
+        with blob_files_lock():
+            blob = acquire_blob(digest.hexdigest(), size, mime)
+            target = media_path(blob.name)
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+        return blob
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def acquire_blob(sha256, size, mime):
+    """
+    Crée le Blob ou ajoute une référence au Blob existant.
+    """
+    while True:
+        blob = Blob.objects.filter(pk=sha256).first()
+        if blob is None:
+            try:
+                with transaction.atomic():
+                    return Blob.objects.create(sha256=sha256, size=size, mime=mime, ref_count=1)
+            except IntegrityError:
+                continue  # créé en parallèle : on ajoute une référence
+        # 0 ligne modifiée : supprimé par release_blob entre-temps, on recommence
+        if Blob.objects.filter(pk=sha256, ref_count__gt=0).update(ref_count=F('ref_count') + 1):
+            blob.ref_count += 1
+            return blob
+
+
+def release_blob(sha256):
+    """
+    Retire une référence ; supprime le blob à la dernière, et son fichier
+    après le commit (voir delete_blob_file).
+    """
+    with transaction.atomic():
+        Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') - 1)
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None or blob.ref_count > 0:
+            return
+        Blob.objects.filter(pk=sha256, ref_count__lte=0).delete()
+        transaction.on_commit(lambda: delete_blob_file(sha256, blob.name))
+
+
+def delete_blob_file(sha256, name):
+    """
+    Supprime le fichier d'un blob supprimé, sauf si le même contenu a été
+    renvoyé entre-temps : le Blob recréé est revérifié sous blob_files_lock,
+    que store_uploaded_file tient de la création de la ligne au fichier.
+    """
+    with blob_files_lock():
+        if Blob.objects.filter(pk=sha256).exists():
+            return
+        path = media_path(name)
+        if path.exists():
+            path.unlink()
+
+
+def parse_range(header, size):
+    """
+    Interprète un en-tête Range à une seule plage.
+    
+    Returns:
+        tuple | None: (start, end) inclusifs, None si absent ou non géré,
+        ou (None, None) si la plage n'est pas satisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # bytes=-N : les N derniers octets
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return None, None
+    return start, end
+
+
+def iter_file_range(path, start, length):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = source.read(min(STORAGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def download_filename(attachment):
+    """
+    Nom proposé au téléchargement : celui du fichier envoyé, ou à défaut
+    (pièces jointes stockées avant original_name) le nom stocké avec une
+    extension déduite du type MIME.
+    """
+    if attachment.original_name:
+        return attachment.original_name
+    name = os.path.basename(attachment.file.name)
+    if not os.path.splitext(name)[1]:
+        name += mimetypes.guess_extension(attachment.mime or '') or ''
+    return name
+
+
+def serve_attachment(request, attachment):
+    """
+    Réponse de téléchargement d'une pièce jointe.
+    
+    - ETag = SHA-256 du contenu (ou nom/taille/date pour les anciens fichiers) :
+      If-None-Match renvoie 304
+    - Range : réponse 206 partielle, 416 si la plage est invalide
+    - ATTACHMENT_SENDFILE_HEADER : le serveur web envoie le fichier lui-même
+    Le fichier est toujours lu par morceaux, jamais chargé en mémoire.
+    """
+    path = media_path(attachment.file.name)
+    if not path.exists():
+        return HttpResponse(status=404)
+    stat = path.stat()
+    size = stat.st_size
+    etag = quote_etag(attachment.blob_id or f"{attachment.file.name}-{size}-{int(stat.st_mtime)}")
+    content_type = attachment.mime or mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    if ATTACHMENT_SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if ATTACHMENT_SENDFILE_HEADER.lower() == 'x-accel-redirect':
+            response[ATTACHMENT_SENDFILE_HEADER] = ATTACHMENT_ACCEL_PREFIX + attachment.file.name
+        else:
+            response[ATTACHMENT_SENDFILE_HEADER] = str(path)
+    else:
+        byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range == (None, None):
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                iter_file_range(path, start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = STORAGE_CHUNK_SIZE
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = content_disposition_header(False, download_filename(attachment))
+    return response
@@ -1,3 +1,2017 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connection, connections, models, transaction
+from django.db.models import F, Q
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from django.utils import timezone
+from django.utils.http import http_date
+from requests.structures import CaseInsensitiveDict
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .async_views import (
+    current_user_async,
+    mark_news_viewed_async,
+    news_list_async,
+    news_stream_async,
+    news_stream_token_async,
+    unread_news_async,
+)
+from .authentication import STREAM_TOKEN_COOKIE, CachedJWTAuthentication, user_cache
+from .benchmark import StubOneSignalServer, build_workloads, compare_results, generate_dataset, run_workload
+from .caching import invalidate_news_cache
+from .onesignal_async import AsyncOneSignalClient, send_news_notification_async
+from .outbox import (
+    OUTBOX_BACKOFF_BASE,
+    OUTBOX_BACKOFF_MAX,
+    OUTBOX_MAX_ATTEMPTS,
+    claim_due_entries,
+    compute_backoff,
+    process_outbox,
+)
+from .db import ReadReplicaRouter
+from .derivatives import derivative_name, generate_derivatives, schedule_derivatives
+from .metrics import registry
+from .renderers import ORJSONRenderer
+from .events import EventBroker, UnixSocketBackend, get_broker
+from .digest import digest_audience_queryset, send_due_digests
+from .models import (
+    Attachment,
+    Blob,
+    CacheGeneration,
+    DigestItem,
+    Moderation,
+    News,
+    NewsStats,
+    NewsView,
+    NotificationOutbox,
+    NotificationPref,
+    Program,
+    PublicationLog,
+    PushSubscription,
+    ReadState,
+    Role,
+    Subscription,
+    UserRole,
+)
+from . import provisioning
+from .pagination import LeaderboardPagination, ViewerPagination
+from .provisioning import provision_users
+from .publication import published_news
+from .scheduler import PublicationScheduler, pending_publications, publish_news
+from .serializers import AttachmentSerializer, NewsSerializer
+from .unread import get_unread_count, unread_news_queryset
+from .utils import (
+    ONESIGNAL_MAX_RETRIES,
+    ONESIGNAL_MAX_RETRY_AFTER,
+    BatchProgress,
+    iter_news_audience,
+    iter_notification_batches,
+    news_audience_queryset,
+    send_notification_batch,
+)
+from .viewbuffer import (
+    flush_view_buffer,
+    get_pending_view_ids,
+    get_unread_count_with_pending,
+    ingest_events,
+    read_segment,
+    store_news_view,
+    unread_news_with_pending,
+)
+
+
+class NewsQueryCountTests(TestCase):
+    """
+    Les endpoints qui retournent des news doivent faire un nombre de
+    requêtes fixe, quel que soit le nombre de news et de pièces jointes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        Subscription.objects.create(user=cls.user, program=cls.program)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_news(self, count, approved):
+        news_list = News.objects.bulk_create([
+            News(
+                program=self.program,
+                author=self.user,
+                title_final=f"News {i}",
+                moderator_approved=approved,
+                moderated_at='2025-01-01T00:00:00Z' if approved else None,
+            )
+            for i in range(count)
+        ])
+        Attachment.objects.bulk_create([
+            Attachment(news=news, file=f"attachments/{news.pk}-{i}.pdf", mime='application/pdf')
+            for news in news_list
+            for i in range(2)
+        ])
+        # bulk_create n'envoie pas de signaux
+        invalidate_news_cache()
+
+    def assert_fixed_queries(self, url, expected, approved=True):
+        # Une page partielle puis une page pleine : même nombre de requêtes
+        for count in (2, 8):
+            self.create_news(count, approved)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('results', response.data)
+            self.assertTrue(all(len(item['attachments']) == 2 for item in response.data['results']))
+
+    # Réponses en cache : la génération du cache est lue en base (LocMemCache, voir core.caching)
+
+    def test_news_list(self):
+        # génération + news + attachments ; pas de COUNT avec le curseur
+        self.assert_fixed_queries('/api/news/', 3)
+
+    def test_news_list_page_number_fallback(self):
+        # ?ordering=importance : pagination par numéro de page, avec COUNT
+        self.assert_fixed_queries('/api/news/?ordering=importance', 4)
+
+    def test_news_detail(self):
+        self.create_news(1, True)
+        news = News.objects.get()
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/news/{news.pk}/')
+        self.assertEqual(len(response.data['attachments']), 2)
+
+    def test_pending_news(self):
+        self.assert_fixed_queries('/api/news/pending/', 2, approved=False)
+
+    def test_approved_news(self):
+        self.assert_fixed_queries('/api/news/approved/', 3)
+
+    def test_rejected_news(self):
+        self.assert_fixed_queries('/api/news/rejected/', 2, approved=False)
+
+    def test_unread_news(self):
+        # news + attachments + compteur du badge
+        self.assert_fixed_queries('/api/news/unread/', 3)
+
+    def test_custom_actions_are_paginated(self):
+        self.create_news(15, True)
+        response = self.client.get('/api/news/approved/')
+        self.assertEqual(len(response.data['results']), 10)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Parcours complet par curseur : aucune news perdue ni dupliquée,
+    y compris avec des valeurs égales et des NULL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        program = Program.objects.create(name='Informatique', code='INFO')
+        News.objects.bulk_create([
+            News(program=program, title_final=f"News {i}", publish_date_effective=[None, '2025-01-01', '2025-02-01'][i % 3])
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url):
+        client = APIClient()
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_created_at_ordering(self):
+        ids = self.walk('/api/news/')
+        expected = list(News.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_publish_date_ordering_with_nulls(self):
+        for ordering in ('publish_date_effective', '-publish_date_effective'):
+            ids = self.walk(f'/api/news/?ordering={ordering}')
+            expected = list(
+                News.objects.order_by(ordering, ordering.replace('publish_date_effective', 'id'))
+                .values_list('id', flat=True)
+            )
+            self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(APIClient().get('/api/news/?cursor=invalide').status_code, 404)
+
+
+class NewsViewsPaginationTests(TestCase):
+    """
+    Classement des news les plus lues et lecteurs d'une news parcourus par
+    curseur : suite continue, égalités sur la clé de tri, pas de page vide.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='moderateur', password='x')
+        program = Program.objects.create(name='Informatique', code='INFO')
+        cls.news = [News.objects.create(program=program, title_final=f"News {i}") for i in range(7)]
+        for news, views_count in zip(cls.news, (3, 5, 3, 0, 3, 1, 0)):
+            NewsStats.objects.update_or_create(news=news, defaults={'views_count': views_count})
+
+        # Lecteurs de la première news : deux groupes de trois à la même date
+        viewers = [User.objects.create_user(username=f"etudiant{i}") for i in range(6)]
+        views = [NewsView.objects.create(user=viewer, news=cls.news[0]) for viewer in viewers]
+        earlier = timezone.now() - timedelta(hours=1)
+        NewsView.objects.filter(pk__in=[view.pk for view in views[::2]]).update(viewed_at=earlier)
+        NewsView.objects.filter(pk__in=[view.pk for view in views[1::2]]).update(viewed_at=earlier + timedelta(minutes=5))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk_leaderboard(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data])
+            link = response.get('Link')
+            url = re.match(r'<([^>]+)>; rel="next"', link).group(1) if link else None
+        return pages
+
+    def walk_viewers(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([viewer['id'] for viewer in response.data['viewers']])
+            url = response.data['next']
+        return pages
+
+    def test_leaderboard_pages(self):
+        expected = list(NewsStats.objects.order_by('-views_count', '-news_id').values_list('news_id', flat=True))
+        pages = self.walk_leaderboard('/api/news/views/?limit=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        # Page pleine en fin de classement : pas de lien vers une page vide
+        self.assertEqual(self.walk_leaderboard('/api/news/views/?limit=7'), [expected])
+
+    def test_viewer_pages(self):
+        expected = list(
+            NewsView.objects.filter(news=self.news[0]).order_by('-viewed_at', '-id').values_list('user_id', flat=True)
+        )
+        with mock.patch.object(ViewerPagination, 'page_size', 2):
+            pages = self.walk_viewers(f'/api/news/{self.news[0].pk}/views/')
+        # 6 lecteurs, 3 pages pleines : la dernière n'annonce pas de suite
+        self.assertEqual([len(page) for page in pages], [2, 2, 2])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_news_without_views_are_ranked(self):
+        # bulk_create ne déclenche pas post_save : ligne créée par le trigger
+        created = News.objects.bulk_create([News(program=self.news[0].program, title_final="Import")])[0]
+        ids = sum(self.walk_leaderboard('/api/news/views/?limit=3'), [])
+        self.assertEqual(sorted(ids), sorted([news.pk for news in self.news] + [created.pk]))
+        self.assertEqual(NewsStats.objects.get(news=created).views_count, 0)
+
+    def test_cursor_past_the_end(self):
+        last = NewsStats.objects.order_by('views_count', 'news_id').first()
+        cursor = LeaderboardPagination().encode_cursor(last.views_count, last.news_id)
+        response = self.client.get(f'/api/news/views/?cursor={cursor}')
+        self.assertEqual((response.data, response.get('Link')), ([], None))
+
+        view = NewsView.objects.filter(news=self.news[0]).order_by('viewed_at', 'id').first()
+        cursor = ViewerPagination().encode_cursor(view.viewed_at, view.pk)
+        response = self.client.get(f'/api/news/{self.news[0].pk}/views/?cursor={cursor}')
+        self.assertEqual((response.data['viewers'], response.data['next']), ([], None))
+
+
+class NewsSearchTests(TestCase):
+    """
+    ?search= passe par l'index FTS5 tenu à jour par triggers.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        cls.title_match = News.objects.create(program=cls.program, title_final='Inscription des étudiants')
+        cls.content_match = News.objects.create(
+            program=cls.program, title_final='Examens', content_final="Inscription obligatoire avant lundi"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        response = APIClient().get('/api/news/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_prefix_and_accent_insensitive_match(self):
+        results = self.search('etud inscr')
+        self.assertEqual([item['id'] for item in results], [self.title_match.pk])
+        self.assertIn('<mark>', results[0]['search_snippet'])
+
+    def test_title_match_ranks_first(self):
+        results = self.search('inscription')
+        self.assertEqual([item['id'] for item in results], [self.title_match.pk, self.content_match.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        News.objects.filter(pk=self.content_match.pk).update(title_final='Rentrée')
+        self.assertEqual(len(self.search('rentree')), 1)
+        Program.objects.filter(pk=self.program.pk).update(name='Mathématiques')
+        self.assertEqual(len(self.search('mathematiques')), 2)
+        self.title_match.delete()
+        self.assertEqual(len(self.search('etudiants')), 0)
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"inscription OR'), [])
+
+
+class NewsResponseCacheTests(TestCase):
+    """
+    Listes et détail des news : cache, 304 conditionnels et invalidation.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        cls.news = News.objects.create(program=cls.program, title_final='Rentrée', moderator_approved=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    @override_settings(NEWS_CACHE_GENERATION_STORE='cache')
+    def test_cached_list_and_conditional_get(self):
+        # Génération dans un cache partagé : aucune requête SQL
+        first = self.client.get('/api/news/approved/')
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/news/approved/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/news/approved/')
+        self.assertEqual(response.data, first.data)
+
+    def test_generation_shared_between_processes(self):
+        # LocMemCache : génération lue en base, une requête par réponse en cache
+        first = self.client.get('/api/news/approved/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/news/approved/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Écriture faite par un autre processus (planificateur, autre worker) :
+        # seule la ligne CacheGeneration est partagée avec celui-ci
+        News.objects.filter(pk=self.news.pk).update(title_final='Rentrée 2025')
+        CacheGeneration.objects.filter(name='news').update(generation=F('generation') + 1)
+        response = self.client.get('/api/news/approved/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['title_final'], 'Rentrée 2025')
+
+    def test_detail_last_modified(self):
+        response = self.client.get(f'/api/news/{self.news.pk}/')
+        response = self.client.get(
+            f'/api/news/{self.news.pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidation_on_related_writes(self):
+        etag = self.client.get(f'/api/news/{self.news.pk}/')['ETag']
+        Moderation.objects.create(news=self.news, approved=True)
+        response = self.client.get(f'/api/news/{self.news.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.news.title_final = 'Rentrée 2025'
+        self.news.save()
+        response = self.client.get('/api/news/approved/')
+        self.assertEqual(response.data['results'][0]['title_final'], 'Rentrée 2025')
+
+
+class BulkMarkViewedTests(TestCase):
+    """
+    POST /news/view/ : vues créées en une fois, compteurs à jour.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        Subscription.objects.create(user=cls.user, program=cls.program)
+        cls.news = [
+            News.objects.create(program=cls.program, title_final=f"News {i}") for i in range(4)
+        ]
+        moderator = APIClient()
+        moderator.force_authenticate(User.objects.create_user(username='moderateur', password='x'))
+        for news in cls.news:
+            moderator.patch(f'/api/news/{news.pk}/update/', {'moderator_approved': True}, format='json')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_news_ids(self):
+        ids = [self.news[0].pk, self.news[1].pk]
+        response = self.client.post('/api/news/view/', {'news_ids': ids}, format='json')
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['unread_count'], 2)
+        # Rejouer la requête ne crée rien
+        response = self.client.post('/api/news/view/', {'news_ids': ids}, format='json')
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(NewsStats.objects.get(news=self.news[0]).views_count, 1)
+
+    def test_up_to_news(self):
+        response = self.client.post('/api/news/view/', {'up_to_news_id': self.news[2].pk}, format='json')
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(response.data['unread_count'], 1)
+        unread = self.client.get('/api/news/unread/').data['results']
+        self.assertEqual([item['id'] for item in unread], [self.news[3].pk])
+
+    def test_invalid_bodies(self):
+        for body in ({'up_to_news_id': 'abc'}, {'up_to_news_id': [1]}, {'up_to': '2025-13-01T00:00:00Z'},
+                     {'up_to': 'hier'}, {'news_ids': ['abc']}):
+            response = self.client.post('/api/news/view/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(NewsView.objects.exists())
+
+
+@override_settings(NEWS_VIEW_WRITE_BEHIND=True)
+class ViewBufferTests(TestCase):
+    """
+    Vues en écriture différée : segments par processus, vues en attente
+    visibles de tous les processus, ingestion par lots et rejouable.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        cls.users = [User.objects.create_user(username=f"etudiant{i}") for i in range(6)]
+        for user in cls.users:
+            Subscription.objects.create(user=user, program=cls.program)
+        cls.news = [
+            News.objects.create(program=cls.program, title_final=f"News {i}", moderator_approved=True)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.buffer_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.buffer_dir, ignore_errors=True)
+        override = override_settings(VIEW_BUFFER_DIR=self.buffer_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = self.users[0]
+
+    def segment(self, name, lines):
+        path = os.path.join(self.buffer_dir, name)
+        with open(path, 'w') as segment:
+            segment.write(''.join(lines))
+        return path
+
+    def test_pending_view_visible_before_flush(self):
+        self.assertTrue(store_news_view(self.user, self.news[0]))
+        self.assertFalse(store_news_view(self.user, self.news[0]))
+        self.assertFalse(NewsView.objects.exists())
+        self.assertEqual(get_pending_view_ids(self.user), {self.news[0].pk})
+        self.assertEqual(get_unread_count_with_pending(self.user), 2)
+        self.assertNotIn(self.news[0], unread_news_with_pending(self.user))
+
+        self.assertEqual(flush_view_buffer(), (1, 1))
+        self.assertTrue(NewsView.objects.filter(user=self.user, news=self.news[0]).exists())
+        self.assertEqual(get_pending_view_ids(self.user), set())
+        self.assertEqual(get_unread_count(self.user), 2)
+        self.assertEqual(NewsStats.objects.get(news=self.news[0]).views_count, 1)
+        self.assertEqual(os.listdir(os.path.join(self.buffer_dir, 'pending')), [])
+
+    def test_setting_read_at_call_time(self):
+        with override_settings(NEWS_VIEW_WRITE_BEHIND=False):
+            self.assertTrue(store_news_view(self.user, self.news[0]))
+        self.assertTrue(NewsView.objects.filter(user=self.user, news=self.news[0]).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.buffer_dir, f'views-{os.getpid()}.log')))
+
+    def test_append_after_rename_starts_a_new_segment(self):
+        store_news_view(self.user, self.news[0])
+        active = os.path.join(self.buffer_dir, f'views-{os.getpid()}.log')
+        os.rename(active, active + '.renamed')
+        store_news_view(self.user, self.news[1])
+        self.assertEqual(read_segment(active + '.renamed'), [(self.user.pk, self.news[0].pk)])
+        self.assertEqual(read_segment(active), [(self.user.pk, self.news[1].pk)])
+
+    def test_interrupted_flush_is_replayed_without_duplicates(self):
+        NewsView.objects.create(user=self.user, news=self.news[0])
+        # Segment laissé par un flusher interrompu : doublons et ligne tronquée
+        self.segment('views-1-1.flushing', [
+            f"{self.user.pk},{self.news[0].pk},1.0\n",
+            f"{self.user.pk},{self.news[1].pk},1.0\n",
+            f"{self.user.pk},{self.news[1].pk},2.0\n",
+            f"{self.users[1].pk},{self.news[1].pk},2.0\n",
+            f"{self.users[1].pk},99",
+        ])
+        self.assertEqual(flush_view_buffer(), (4, 2))
+        self.assertEqual(os.listdir(self.buffer_dir), [])
+        self.assertEqual(NewsStats.objects.get(news=self.news[1]).views_count, 2)
+        self.assertEqual(get_unread_count(self.users[1]), 2)
+
+        self.assertEqual(ingest_events([(self.user.pk, self.news[1].pk)]), 0)
+        self.assertEqual(NewsView.objects.count(), 3)
+
+    def test_ingestion_queries_do_not_grow_with_users(self):
+        def ingest(users):
+            events = [(user.pk, news.pk) for user in users for news in self.news[:2]]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(ingest_events(events), len(events))
+            return len(queries)
+
+        self.assertEqual(ingest(self.users[:3]), ingest(self.users[3:]))
+        self.assertEqual(NewsView.objects.count(), 12)
+        self.assertEqual({get_unread_count(user) for user in self.users}, {1})
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN QUERY PLAN des requêtes fréquentes : aucune ne doit retomber
+    sur un parcours complet de table (« SCAN <table> » sans index).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        Subscription.objects.create(user=cls.user, program=cls.program)
+        cls.news = News.objects.create(program=cls.program, title_final='Rentrée', moderator_approved=True)
+
+    def assert_no_full_scan(self, queryset):
+        if connection.vendor != 'sqlite':
+            self.skipTest("EXPLAIN QUERY PLAN propre à SQLite")
+        plan = queryset.explain()
+        full_scans = [
+            line for line in plan.splitlines()
+            if re.search(r'\bSCAN (?!CONSTANT ROW)\S+$', line.strip())
+        ]
+        self.assertEqual(full_scans, [], f"Parcours complet de table :\n{plan}")
+
+    def test_news_feeds(self):
+        cursor = (timezone.now(), 10)
+        feeds = [
+            News.objects.all(),
+            published_news(News.objects.all()),
+            News.objects.filter(moderator_approved=False),
+            News.objects.filter(program_id=self.program.pk),
+            News.objects.filter(importance='urgente'),
+        ]
+        for feed in feeds:
+            self.assert_no_full_scan(feed.order_by('-created_at', '-id')[:11])
+            self.assert_no_full_scan(
+                feed.filter(Q(created_at__lte=cursor[0]) & (Q(created_at__lt=cursor[0]) | Q(id__lt=cursor[1])))
+                .order_by('-created_at', '-id')[:11]
+            )
+        self.assert_no_full_scan(
+            News.objects.filter(publish_date_effective__isnull=False)
+            .order_by('-publish_date_effective', '-id')[:11]
+        )
+
+    def test_unread(self):
+        self.assert_no_full_scan(unread_news_queryset(self.user)[:11])
+        self.assert_no_full_scan(ReadState.objects.filter(user=self.user).values('unread_count'))
+
+    def test_audience(self):
+        self.assert_no_full_scan(news_audience_queryset(self.news))
+        self.assert_no_full_scan(news_audience_queryset(self.news, frequencies=['immediate']))
+        self.assert_no_full_scan(digest_audience_queryset('daily', [self.program.pk]))
+
+    def test_views_and_stats(self):
+        self.assert_no_full_scan(NewsView.objects.filter(news=self.news).order_by('-viewed_at', '-id')[:11])
+        self.assert_no_full_scan(NewsView.objects.filter(user=self.user, news_id__in=[1, 2, 3]))
+        self.assert_no_full_scan(NewsStats.objects.order_by('-views_count', '-news_id')[:50])
+        # Page suivante du classement (LeaderboardPagination)
+        after = Q(views_count__lte=3) & (Q(views_count__lt=3) | Q(news_id__lt=10))
+        self.assert_no_full_scan(NewsStats.objects.filter(after).order_by('-views_count', '-news_id')[:51])
+
+    def test_background_workers(self):
+        now = timezone.now()
+        self.assert_no_full_scan(
+            NotificationOutbox.objects.filter(
+                Q(status='pending', next_attempt_at__lte=now) | Q(status='processing', locked_until__lt=now)
+            ).order_by('next_attempt_at')[:50]
+        )
+        self.assert_no_full_scan(
+            DigestItem.objects.filter(sent_at__isnull=True, window_end__lte=now).order_by('frequency', 'window_end')
+        )
+        self.assert_no_full_scan(pending_publications(now)[:1000])
+
+
+class ReadReplicaRouterTests(TransactionTestCase):
+    """
+    Profil production : lectures sur la replica hors transaction,
+    écritures et lectures des transactions sur 'default', PRAGMAs par alias.
+    """
+
+    def test_read_write_split(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(News), 'replica')
+        self.assertEqual(router.db_for_write(News), 'default')
+        self.assertTrue(router.allow_migrate('default', 'core'))
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+
+    @override_settings(DATABASE_ROUTERS=['core.db.ReadReplicaRouter'])
+    def test_reads_stay_on_default_inside_atomic(self):
+        self.assertEqual(News.objects.all().db, 'replica')
+        with transaction.atomic():
+            # Une connexion séparée ne verrait pas cette écriture non commitée
+            program = Program.objects.create(name='Informatique', code='INFO')
+            self.assertEqual(News.objects.all().db, 'default')
+            self.assertEqual(Program.objects.get(pk=program.pk), program)
+        self.assertEqual(News.objects.all().db, 'replica')
+
+    @override_settings(
+        SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000},
+        DATABASE_READ_ALIASES=('replica',),
+    )
+    def test_pragmas_per_alias(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = os.path.join(tmp, 'db.sqlite3')
+
+        def open_alias(alias, name):
+            database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+            settings_dict = connections.configure_settings({DEFAULT_DB_ALIAS: database, alias: database})[alias]
+            wrapper = connections[DEFAULT_DB_ALIAS].__class__(settings_dict, alias)
+            self.addCleanup(wrapper.close)
+            wrapper.ensure_connection()
+            return wrapper
+
+        def pragma(wrapper, name):
+            with wrapper.cursor() as cursor:
+                cursor.execute(f'PRAGMA {name}')
+                return cursor.fetchone()[0]
+
+        writer = open_alias('bench', path)
+        self.assertEqual(pragma(writer, 'journal_mode'), 'wal')
+        self.assertEqual(pragma(writer, 'synchronous'), 1)
+        self.assertEqual(pragma(writer, 'busy_timeout'), 5000)
+        self.assertEqual(pragma(writer, 'query_only'), 0)
+        with writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+
+        replica = open_alias('replica', path)
+        self.assertEqual(pragma(replica, 'query_only'), 1)
+        self.assertEqual(pragma(replica, 'busy_timeout'), 5000)
+        with self.assertRaises(OperationalError), replica.cursor() as cursor:
+            cursor.execute('INSERT INTO t DEFAULT VALUES')
+
+
+class AttachmentStorageTests(TestCase):
+    """
+    Stockage adressé par contenu : un contenu identique n'est écrit qu'une
+    fois, et le téléchargement gère Range et If-None-Match.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auteur', password='x')
+        program = Program.objects.create(name='Informatique', code='INFO')
+        cls.news = [
+            News.objects.create(program=program, author=cls.user, title_final=f"News {i}")
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def attach(self, news, content=b'%PDF-1.4 contenu', name='cours.pdf', content_type='application/pdf'):
+        upload = SimpleUploadedFile(name, content, content_type=content_type)
+        return Attachment.objects.create(news=news, file=upload)
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.attach(self.news[0])
+        second = self.attach(self.news[1], name='copie.pdf')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(first.filesize, len(b'%PDF-1.4 contenu'))
+
+        first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        # Fichier supprimé après le commit
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, first.file.name)))
+
+    def test_reupload_during_release_keeps_the_file(self):
+        first = self.attach(self.news[0])
+        path = os.path.join(self.media_root, first.file.name)
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        self.assertFalse(Blob.objects.exists())
+
+        # Même contenu renvoyé entre la suppression du Blob et celle du fichier
+        second = self.attach(self.news[1])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+        response = self.client.get(f'/api/attachments/{second.pk}/download/')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 contenu')
+
+    def test_download_keeps_the_uploaded_name(self):
+        attachment = self.attach(self.news[0], name='cours été.pdf')
+        self.assertEqual(attachment.original_name, 'cours été.pdf')
+        self.assertTrue(attachment.file.name.startswith('blobs/'))
+
+        response = self.client.get(f'/api/attachments/{attachment.pk}/download/')
+        self.assertEqual(response['Content-Disposition'], "inline; filename*=utf-8''cours%20%C3%A9t%C3%A9.pdf")
+
+        # Pièce jointe stockée sans nom d'origine : nom du blob + extension du type MIME
+        Attachment.objects.filter(pk=attachment.pk).update(original_name='')
+        response = self.client.get(f'/api/attachments/{attachment.pk}/download/')
+        self.assertEqual(response['Content-Disposition'], f'inline; filename="{attachment.blob_id}.pdf"')
+
+    def test_failed_save_releases_the_blob(self):
+        save = models.Model.save
+
+        def failing_save(instance, *args, **kwargs):
+            if isinstance(instance, Attachment):
+                raise DatabaseError('disque plein')
+            return save(instance, *args, **kwargs)
+
+        with mock.patch.object(models.Model, 'save', autospec=True, side_effect=failing_save):
+            with self.assertRaises(DatabaseError), self.captureOnCommitCallbacks(execute=True):
+                self.attach(self.news[0])
+        self.assertFalse(Blob.objects.exists())
+        blob_files = [name for _, _, files in os.walk(self.media_root) for name in files if name != '.lock']
+        self.assertEqual(blob_files, [])
+
+    def test_download_supports_range_and_etag(self):
+        attachment = self.attach(self.news[0], content=b'0123456789')
+        url = f'/api/attachments/{attachment.pk}/download/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_derivative_urls_fall_back_to_original(self):
+        attachment = self.attach(self.news[0], content=b'\x89PNG image', name='photo.png', content_type='image/png')
+        data = AttachmentSerializer(attachment).data
+        self.assertEqual(data['thumbnail_url'], data['download_url'])
+
+        # Dérivé prêt : clé déterministe dérivée du contenu
+        path = os.path.join(self.media_root, derivative_name(attachment.blob_id, 'thumbnail'))
+        os.makedirs(os.path.dirname(path))
+        open(path, 'wb').close()
+        data = AttachmentSerializer(attachment).data
+        self.assertTrue(data['thumbnail_url'].endswith(f'{attachment.blob_id}-thumbnail-320x320.jpg'))
+        self.assertEqual(data['preview_url'], data['download_url'])
+
+
+    @skipUnless(importlib.util.find_spec('PIL'), "Pillow absent")
+    def test_image_derivatives_generated(self):
+        from PIL import Image
+
+        content = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(content, 'PNG')
+        attachment = self.attach(self.news[0], content=content.getvalue(), name='photo.png', content_type='image/png')
+        generated = generate_derivatives(self.media_root, attachment.file.name, attachment.blob_id, 'image/png')
+        self.assertEqual(len(generated), 2)
+        with Image.open(os.path.join(self.media_root, derivative_name(attachment.blob_id, 'thumbnail'))) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 160))
+        self.assertIn('preview-1280x1280', AttachmentSerializer(attachment).data['preview_url'])
+
+    @skipUnless(shutil.which('pdftoppm'), "poppler-utils (pdftoppm) absent")
+    def test_pdf_preview_generated(self):
+        pdf = (
+            b"%PDF-1.1\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+            b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+            b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 200 100]>>endobj\n"
+            b"trailer<</Root 1 0 R>>\n%%EOF\n"
+        )
+        attachment = self.attach(self.news[0], content=pdf)
+        generated = generate_derivatives(self.media_root, attachment.file.name, attachment.blob_id, 'application/pdf')
+        self.assertEqual(len(generated), 2)
+        self.assertIsNotNone(AttachmentSerializer(attachment).data['thumbnail_url'])
+
+    def test_missing_renderer_is_logged(self):
+        attachment = self.attach(self.news[0])
+        with mock.patch('core.derivatives.shutil.which', return_value=None), \
+                mock.patch('core.derivatives._missing_renderers_logged', set()), \
+                self.assertLogs('core.derivatives', 'WARNING') as logs, \
+                self.captureOnCommitCallbacks() as callbacks:
+            schedule_derivatives(attachment)
+            self.assertEqual(generate_derivatives(self.media_root, attachment.file.name, attachment.blob_id, 'application/pdf'), [])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('pdftoppm', logs.output[0])
+
+# POST /api/token/ hache le mot de passe : lent par construction, hors journal
+@override_settings(SLOW_REQUEST_THRESHOLD_MS=None)
+class CachedAuthenticationTests(TestCase):
+    """
+    Avec le cache chaud, une requête authentifiée par JWT ne fait aucune
+    requête d'authentification ; un changement de rôle est visible aussitôt.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='secret')
+        cls.student = Role.objects.create(name='Étudiant')
+        cls.moderator = Role.objects.create(name='Modérateur')
+        UserRole.objects.create(user=cls.user, role=cls.student)
+
+    def setUp(self):
+        # Le rollback des tests n'envoie pas de signaux : cache vidé à la main
+        user_cache.clear()
+        response = APIClient().post('/api/token/', {'username': 'etudiant', 'password': 'secret'})
+        self.access = response.data['access']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def test_token_carries_no_roles(self):
+        # Rôles lus dans le cache, à jour ; un claim serait figé jusqu'à l'expiration
+        token = AccessToken(self.access)
+        self.assertEqual(token['user_id'], str(self.user.pk))
+        self.assertNotIn('roles', token)
+
+    def test_cached_user_is_not_shared_between_requests(self):
+        authentication = CachedJWTAuthentication()
+        token = AccessToken(self.access)
+        first = authentication.get_user(token)
+        first.first_name = 'Modifié'
+        first.cached_roles.append(self.moderator)
+        first.cached_roles[0].name = 'Modifié'
+
+        second = authentication.get_user(token)
+        self.assertEqual(second.first_name, '')
+        self.assertEqual([role.name for role in second.cached_roles], ['Étudiant'])
+
+    def test_password_change_revokes_tokens(self):
+        # override_settings(SIMPLE_JWT=...) remplace api_settings sans mettre à
+        # jour les modules qui l'ont importé : on modifie l'objet partagé
+        with mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True):
+            response = APIClient().post('/api/token/', {'username': 'etudiant', 'password': 'secret'})
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+            self.assertEqual(self.client.get('/api/me/').status_code, 200)
+
+            self.user.set_password('nouveau')
+            self.user.save()
+            response = self.client.get('/api/me/')
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.data['code'], 'password_changed')
+
+    def test_current_user_without_auth_queries(self):
+        self.client.get('/api/me/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/me/')
+        self.assertEqual([role['name'] for role in response.data['roles']], ['Étudiant'])
+
+    def test_role_change_invalidates_cache(self):
+        self.client.get('/api/me/')
+        UserRole.objects.create(user=self.user, role=self.moderator)
+        response = self.client.get('/api/me/')
+        self.assertEqual(
+            sorted(role['name'] for role in response.data['roles']),
+            ['Modérateur', 'Étudiant'],
+        )
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+
+
+# Hachage de mots de passe : lent par nature, hors du journal des requêtes lentes
+@override_settings(PROVISIONING_WORKERS=1, SLOW_REQUEST_THRESHOLD_MS=None)
+class ProvisionUsersTests(TestCase):
+    """
+    Import en masse : comptes, rôle par défaut, préférences, abonnements
+    et états de lecture créés en bulk ; doublons écartés.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', is_staff=True)
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        author = User.objects.create_user(username='auteur', password='x')
+        News.objects.create(
+            program=cls.program, author=author, title_final="Rentrée",
+            moderator_approved=True, moderated_at=timezone.now(),
+        )
+
+    def import_file(self, name, content):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        upload = SimpleUploadedFile(name, content.encode(), content_type='text/plain')
+        return client.post('/api/users/import/', {'file': upload}, format='multipart')
+
+    def test_csv_import(self):
+        response = self.import_file('rentree.csv', (
+            "username,email,password,first_name,programs\n"
+            "alice,alice@example.com,motdepasse,Alice,INFO\n"
+            "bob,bob@example.com,,Bob,INFO;XXX\n"
+            "alice,autre@example.com,x,Doublon,\n"
+            "admin,,x,Existant,\n"
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['skipped'], 2)
+        self.assertEqual(len(response.data['warnings']), 1)
+
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('motdepasse'))
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertEqual(list(UserRole.objects.filter(user=alice).values_list('role__name', flat=True)), ['Étudiant'])
+        self.assertTrue(NotificationPref.objects.filter(user=alice).exists())
+        state = ReadState.objects.get(user=alice, program=self.program)
+        self.assertEqual(state.unread_count, 1)
+
+    def test_ndjson_import_requires_admin(self):
+        content = '{"username": "carla", "roles": ["Modérateur"]}\n'
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='auteur'))
+        upload = SimpleUploadedFile('rentree.ndjson', content.encode())
+        self.assertEqual(client.post('/api/users/import/', {'file': upload}, format='multipart').status_code, 403)
+
+        response = self.import_file('rentree.ndjson', content)
+        self.assertEqual(response.data['created'], 1)
+        # Rôle inconnu : ignoré et signalé, pas créé
+        self.assertFalse(UserRole.objects.filter(user__username='carla').exists())
+        self.assertEqual(len(response.data['warnings']), 1)
+
+    def test_unreadable_ndjson_rows_are_reported(self):
+        response = self.import_file('rentree.ndjson', (
+            '{"username": "carla"}\n'
+            '[1, 2]\n'
+            '42\n'
+            '"x"\n'
+            '{"username": "dan", "programs": 7}\n'
+            '{pas du json\n'
+            '{"username": ["eve"]}\n'
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][3]['username'], 'dan')
+        errors = [error['error'] for error in response.data['errors']]
+        self.assertRegex(errors.pop(4), r'^ligne 6 : JSON invalide')
+        self.assertEqual(errors, [
+            'ligne 2 : objet JSON attendu',
+            'ligne 3 : objet JSON attendu',
+            'ligne 4 : objet JSON attendu',
+            'programs doit être une liste de chaînes',
+            'username doit être une chaîne',
+        ])
+
+    def test_broken_shared_pool_is_replaced(self):
+        self.addCleanup(setattr, provisioning, '_shared_hash_pool', provisioning._shared_hash_pool)
+
+        def dead_worker(*args, **kwargs):
+            raise BrokenProcessPool('worker tué')
+            yield
+
+        broken = mock.Mock()
+        broken.map.side_effect = lambda *args, **kwargs: dead_worker()
+        provisioning._shared_hash_pool = broken
+        with ThreadPoolExecutor(1) as pool, mock.patch('core.provisioning.get_hash_pool', return_value=pool):
+            response = self.import_file('a.csv', "username\nalice\nbob\n")
+            self.assertIs(provisioning.get_shared_hash_pool(), pool)
+        self.assertEqual((response.data['created'], response.data['errors']), (2, []))
+        broken.shutdown.assert_called_once_with(wait=False)
+
+    def test_failed_chunk_is_reported_and_import_continues(self):
+        insert_chunk = provisioning.insert_chunk
+
+        def failing_insert(rows, *args):
+            if rows[0]['username'] == 'bob':
+                raise DatabaseError('base verrouillée')
+            return insert_chunk(rows, *args)
+
+        rows = [{'username': name, 'programs': [], 'roles': []} for name in ('alice', 'bob', 'carla')]
+        with ThreadPoolExecutor(1) as pool, mock.patch('core.provisioning.insert_chunk', side_effect=failing_insert):
+            report = provision_users(iter(rows), chunk_size=1, pool=pool)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['errors'], [{'username': 'bob', 'error': 'lot non importé : base verrouillée'}])
+        self.assertEqual(set(User.objects.filter(username__in=['alice', 'bob', 'carla']).values_list('username', flat=True)),
+                         {'alice', 'carla'})
+
+    def test_api_imports_share_one_capped_pool(self):
+        self.addCleanup(setattr, provisioning, '_shared_hash_pool', provisioning._shared_hash_pool)
+        provisioning._shared_hash_pool = None
+        with ThreadPoolExecutor(1) as pool, mock.patch('core.provisioning.get_hash_pool', return_value=pool) as factory:
+            self.import_file('a.csv', "username\nalice\n")
+            self.import_file('b.csv', "username\nbob\n")
+        factory.assert_called_once_with(provisioning.PROVISIONING_API_WORKERS)
+        self.assertEqual(User.objects.filter(username__in=['alice', 'bob']).count(), 2)
+
+
+class PublicationSchedulerTests(TestCase):
+    """
+    Une news validée avec une date de publication future n'est notifiée
+    qu'à cette date, une seule fois, par le planificateur.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user(username='moderateur', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+
+    def approve(self, publish_date_requested=None):
+        news = News.objects.create(
+            program=self.program, title_final="Conférence", publish_date_requested=publish_date_requested,
+        )
+        client = APIClient()
+        client.force_authenticate(self.moderator)
+        client.patch(f'/api/news/{news.pk}/update/', {'moderator_approved': True}, format='json')
+        news.refresh_from_db()
+        return news
+
+    def test_immediate_publication_without_requested_date(self):
+        news = self.approve()
+        self.assertEqual(news.publish_date_effective, timezone.localdate())
+        self.assertEqual(NotificationOutbox.objects.filter(news=news).count(), 1)
+
+    def test_deferred_publication(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        news = self.approve(publish_date_requested=tomorrow)
+        self.assertIsNone(news.publish_date_effective)
+        self.assertFalse(NotificationOutbox.objects.filter(news=news).exists())
+
+        scheduler = PublicationScheduler()
+        self.assertEqual(scheduler.run_pending(), 0)
+        self.assertEqual(len(scheduler.queue), 0)  # hors de l'horizon d'une heure
+
+        # Le lendemain (ou après un redémarrage) : publiée une seule fois
+        due = timezone.now() + timedelta(days=1)
+        self.assertEqual(scheduler.run_pending(now=due), 1)
+        self.assertEqual(PublicationScheduler().run_pending(now=due), 0)
+
+        news.refresh_from_db()
+        self.assertEqual(news.publish_date_effective, tomorrow)
+        self.assertEqual(NotificationOutbox.objects.filter(news=news).count(), 1)
+        self.assertTrue(PublicationLog.objects.filter(news=news, channel='scheduler').exists())
+
+    def test_deferred_news_stay_out_of_feeds_until_published(self):
+        student = User.objects.create_user(username='etudiant', password='x')
+        Subscription.objects.create(user=student, program=self.program)
+        reader = APIClient()
+        reader.force_authenticate(student)
+        in_feeds = lambda news: (
+            [item['id'] for item in reader.get('/api/news/unread/').data['results']] == [news.pk],
+            [item['id'] for item in reader.get('/api/news/approved/').data['results']] == [news.pk],
+            reader.get('/api/news/unread/count/').data['unread_count'],
+        )
+
+        news = self.approve(publish_date_requested=timezone.localdate() + timedelta(days=3))
+        self.assertIsNone(news.moderated_at)
+        self.assertEqual(in_feeds(news), (False, False, 0))
+
+        due = timezone.now() + timedelta(days=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(PublicationScheduler().run_pending(now=due), 1)
+        news.refresh_from_db()
+        self.assertEqual(news.moderated_at, due)
+        self.assertEqual(in_feeds(news), (True, True, 1))
+
+    def test_publication_invalidates_cached_responses(self):
+        cache.clear()
+        news = self.approve(publish_date_requested=timezone.localdate() + timedelta(days=1))
+        client = APIClient()
+        self.assertIsNone(client.get(f'/api/news/{news.pk}/').data['publish_date_effective'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(publish_news(news.pk, now=timezone.now() + timedelta(days=1)))
+        response = client.get(f'/api/news/{news.pk}/')
+        self.assertEqual(response.data['publish_date_effective'], str(news.publish_date_requested))
+
+
+class BulkModerationTests(TestCase):
+    """
+    POST /news/moderate/ : une transaction, une ligne Moderation par news
+    et un seul fan-out par programme.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user(username='moderateur', password='x')
+        cls.student = User.objects.create_user(username='etudiant', password='x')
+        cls.programs = [
+            Program.objects.create(name='Informatique', code='INFO'),
+            Program.objects.create(name='Droit', code='DROIT'),
+        ]
+        Subscription.objects.create(user=cls.student, program=cls.programs[0])
+        cls.news = [
+            News.objects.create(program=cls.programs[0], title_final=f"Info {i}") for i in range(3)
+        ] + [
+            News.objects.create(program=cls.programs[1], title_final="Droit"),
+            News.objects.create(
+                program=cls.programs[1], title_final="Plus tard",
+                publish_date_requested=timezone.localdate() + timedelta(days=7),
+            ),
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+    def moderate(self, news, approved):
+        return self.client.post(
+            '/api/news/moderate/', {'news_ids': [n.pk for n in news], 'approved': approved}, format='json'
+        )
+
+    def test_approve_groups_fan_out_by_program(self):
+        with self.assertNumQueries(11):
+            response = self.moderate(self.news, True)
+        self.assertEqual(response.data['newly_approved'], 5)
+        self.assertEqual(response.data['notifications'], 2)
+        self.assertEqual(Moderation.objects.filter(moderator=self.moderator, approved=True).count(), 5)
+        self.assertEqual(ReadState.objects.get(user=self.student).unread_count, 3)
+
+        entry = NotificationOutbox.objects.get(news__program=self.programs[0])
+        self.assertEqual(sorted(entry.news_ids), sorted(n.pk for n in self.news[:3]))
+        # La news programmée attend le planificateur
+        self.assertFalse(NotificationOutbox.objects.filter(news=self.news[4]).exists())
+
+        with mock.patch('core.outbox.send_news_group_notification', return_value=(1, 0)) as grouped, \
+                mock.patch('core.outbox.send_news_notification', return_value=(1, 0)) as single:
+            self.assertEqual(process_outbox(), (2, 0))
+        self.assertEqual(grouped.call_count, 1)
+        self.assertEqual(len(grouped.call_args.args[0]), 3)
+        self.assertEqual(single.call_count, 1)
+        self.assertEqual(PublicationLog.objects.filter(news__program=self.programs[0]).count(), 3)
+
+    def test_reject_rebuilds_unread_counts(self):
+        self.moderate(self.news[:3], True)
+        response = self.moderate(self.news[:2], False)
+        self.assertEqual(response.data['unapproved'], 2)
+        self.assertEqual(ReadState.objects.get(user=self.student).unread_count, 1)
+        self.assertEqual(self.moderate([], True).status_code, 400)
+
+
+class AudienceBatchingTests(TestCase):
+    """
+    Audience lue en flux par paquets et regroupée en batches : chaque
+    abonné reçoit la news une fois, quelles que soient les frontières de
+    paquets et de batches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        other = Program.objects.create(name='Chimie', code='CHIM')
+        cls.expected = {'immediate': [], 'daily': []}
+        for i in range(13):
+            user = User.objects.create_user(username=f"etudiant{i}")
+            frequency = 'daily' if i % 3 == 0 else 'immediate'
+            NotificationPref.objects.create(user=user, frequency=frequency, push_enabled=i != 12)
+            Subscription.objects.create(user=user, program=cls.program if i != 11 else other)
+            # Deux appareils pour le premier utilisateur
+            for device in range(2 if i == 0 else 1):
+                PushSubscription.objects.create(user=user, external_user_id=f"ext-{i:02d}-{device}")
+                if i < 11:
+                    cls.expected[frequency].append(f"ext-{i:02d}-{device}")
+        cls.news = News.objects.create(program=cls.program, title_final='Partiels')
+
+    def batches(self, progress=None):
+        counts = {}
+        with mock.patch('core.utils.ONESIGNAL_MAX_IDS_PER_REQUEST', 3):
+            batches = list(iter_notification_batches(iter_news_audience(self.news, chunk_size=2), counts, progress))
+        return batches, counts
+
+    def sent_by_frequency(self, batches):
+        sent = {}
+        for batch in batches:
+            self.assertLessEqual(len(batch.external_ids), 3)
+            sent.setdefault(batch.key, []).extend(batch.external_ids)
+        return sent
+
+    def test_every_subscriber_exactly_once(self):
+        batches, counts = self.batches()
+        self.assertEqual(self.sent_by_frequency(batches), self.expected)
+        self.assertEqual(counts, {frequency: len(ids) for frequency, ids in self.expected.items()})
+
+    def test_resume_sends_only_the_remaining_subscribers(self):
+        progress = BatchProgress()
+        first, second, *rest = self.batches()[0]
+        for batch in (first, rest[-1]):
+            progress.batch_done(batch, len(batch.external_ids), 0)
+        progress.batch_done(second, 0, len(second.external_ids))
+
+        resumed = self.sent_by_frequency(self.batches(progress)[0])
+        for frequency, expected in self.expected.items():
+            done = [
+                external_id for batch in (first, rest[-1]) if batch.key == frequency
+                for external_id in batch.external_ids
+            ]
+            self.assertEqual(sorted(resumed.get(frequency, []) + done), expected)
+            self.assertFalse(set(resumed.get(frequency, [])) & set(done))
+
+
+class OutboxTests(TestCase):
+    """
+    Worker d'outbox : reprise des seuls batches en échec, backoff,
+    expiration du verrou et news dé-validées avant l'envoi.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        for i in range(5):
+            user = User.objects.create_user(username=f"etudiant{i}")
+            NotificationPref.objects.create(user=user, frequency='immediate')
+            PushSubscription.objects.create(user=user, external_user_id=f"ext-{i}")
+            Subscription.objects.create(user=user, program=cls.program)
+        cls.news = News.objects.create(program=cls.program, title_final='Partiels', moderator_approved=True)
+        cls.entry = NotificationOutbox.objects.get(news=cls.news)
+
+    def process(self, fail=()):
+        """
+        process_outbox avec des batches de 2 ; les batches contenant un
+        external_user_id de `fail` échouent.
+        """
+        calls = []
+
+        def fake_send(external_ids, *args):
+            calls.append(list(external_ids))
+            if set(fail) & set(external_ids):
+                return 0, len(external_ids)
+            return len(external_ids), 0
+
+        with mock.patch('core.utils.ONESIGNAL_MAX_IDS_PER_REQUEST', 2), \
+                mock.patch('core.utils.send_notification_batch', side_effect=fake_send), \
+                mock.patch('builtins.print'):
+            result = process_outbox()
+        return result, calls
+
+    def test_retry_only_resends_failed_batches(self):
+        (processed, failed), calls = self.process(fail={'ext-2'})
+        self.assertEqual((processed, failed), (1, 1))
+        self.assertEqual(sorted(calls), [['ext-0', 'ext-1'], ['ext-2', 'ext-3'], ['ext-4']])
+        entry = NotificationOutbox.objects.get(pk=self.entry.pk)
+        self.assertEqual((entry.status, entry.attempts), ('pending', 1))
+        self.assertEqual(entry.sent_batches['immediate']['sent'], 3)
+
+        # Pas de nouvel essai avant la fin du backoff
+        self.assertEqual(self.process()[0], (0, 0))
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        (processed, failed), calls = self.process()
+        self.assertEqual((processed, failed), (1, 0))
+        self.assertEqual(calls, [['ext-2', 'ext-3']])
+        self.assertEqual(NotificationOutbox.objects.get(pk=self.entry.pk).status, 'done')
+        self.assertEqual(PublicationLog.objects.get(news=self.news).sent_count, 5)
+
+    def test_backoff_then_final_failure(self):
+        self.assertEqual(compute_backoff(1), timedelta(seconds=OUTBOX_BACKOFF_BASE))
+        self.assertEqual(compute_backoff(3), timedelta(seconds=OUTBOX_BACKOFF_BASE * 4))
+        self.assertEqual(compute_backoff(50), timedelta(seconds=OUTBOX_BACKOFF_MAX))
+
+        before = timezone.now()
+        self.process(fail={'ext-0'})
+        entry = NotificationOutbox.objects.get(pk=self.entry.pk)
+        self.assertGreaterEqual(entry.next_attempt_at, before + compute_backoff(1))
+        self.assertEqual(entry.last_error, '2 envois en échec')
+
+        NotificationOutbox.objects.update(attempts=OUTBOX_MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        self.assertEqual(self.process(fail={'ext-0'})[0], (1, 1))
+        self.assertEqual(NotificationOutbox.objects.get(pk=self.entry.pk).status, 'failed')
+        self.assertFalse(PublicationLog.objects.exists())
+
+    def test_expired_lease_is_claimed_again(self):
+        self.assertEqual([entry.pk for entry in claim_due_entries()], [self.entry.pk])
+        # Worker tué : l'entrée reste "processing" jusqu'à la fin du verrou
+        self.assertEqual(claim_due_entries(), [])
+        NotificationOutbox.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([entry.pk for entry in claim_due_entries()], [self.entry.pk])
+
+    def test_unapproved_news_is_not_sent(self):
+        News.objects.filter(pk=self.news.pk).update(moderator_approved=False)
+        (processed, failed), calls = self.process()
+        self.assertEqual((processed, failed, calls), (1, 0, []))
+        self.assertEqual(NotificationOutbox.objects.get(pk=self.entry.pk).status, 'done')
+        self.assertFalse(PublicationLog.objects.exists())
+
+
+class DigestTests(TestCase):
+    """
+    Digests daily/weekly : un message par tranche, entrées marquées
+    envoyées seulement après un envoi complet, reprise sans doublon.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.programs = [
+            Program.objects.create(name='Informatique', code='INFO'),
+            Program.objects.create(name='Droit', code='DROIT'),
+        ]
+        # ext-0..2 suivent Informatique, ext-3..4 les deux programmes
+        for i in range(5):
+            user = User.objects.create_user(username=f"etudiant{i}")
+            NotificationPref.objects.create(user=user, frequency='daily')
+            PushSubscription.objects.create(user=user, external_user_id=f"ext-{i}")
+            for program in cls.programs[:1 if i < 3 else 2]:
+                Subscription.objects.create(user=user, program=program)
+        window_end = timezone.now() - timedelta(minutes=1)
+        cls.news = []
+        for program in cls.programs:
+            news = News.objects.create(program=program, title_final=program.name, moderator_approved=True)
+            DigestItem.objects.create(news=news, program=program, frequency='daily', window_end=window_end)
+            cls.news.append(news)
+
+    def send(self, fail=()):
+        """
+        send_due_digests avec des batches de 2 ; les batches contenant un
+        external_user_id de `fail` échouent.
+        """
+        calls = []
+
+        def fake_send(external_ids, send_after, news, headers, batch_num, total_batches, session, content):
+            calls.append((list(external_ids), content['contents']['fr']))
+            if set(fail) & set(external_ids):
+                return 0, len(external_ids)
+            return len(external_ids), 0
+
+        with mock.patch('core.digest.ONESIGNAL_MAX_IDS_PER_REQUEST', 2), \
+                mock.patch('core.utils.send_notification_batch', side_effect=fake_send), \
+                mock.patch('builtins.print'):
+            send_due_digests(now=timezone.now() + timedelta(days=1))
+        return calls
+
+    def sent_counts(self):
+        return dict(PublicationLog.objects.values_list('news_id', 'sent_count'))
+
+    def test_one_message_per_slice(self):
+        calls = self.send()
+        recipients = sorted(external_id for ids, _ in calls for external_id in ids)
+        self.assertEqual(recipients, [f"ext-{i}" for i in range(5)])
+        contents = {external_id: text for ids, text in calls for external_id in ids}
+        self.assertEqual(contents['ext-0'], 'Informatique')
+        self.assertEqual(contents['ext-4'], '• Informatique\n• Droit')
+
+        self.assertFalse(DigestItem.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(self.sent_counts(), {self.news[0].pk: 5, self.news[1].pk: 2})
+        self.assertEqual(self.send(), [])
+
+    def test_failed_batches_are_retried_without_resending(self):
+        calls = self.send(fail={'ext-2'})
+        self.assertEqual(len(calls), 3)
+        item = DigestItem.objects.first()
+        self.assertIsNone(item.sent_at)
+        self.assertEqual(item.attempts, 1)
+        self.assertGreater(item.next_attempt_at, timezone.now())
+        self.assertFalse(PublicationLog.objects.exists())
+
+        # Seul le batch en échec repart
+        calls = self.send()
+        self.assertEqual([ids for ids, _ in calls], [['ext-2']])
+        self.assertFalse(DigestItem.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(self.sent_counts(), {self.news[0].pk: 5, self.news[1].pk: 2})
+
+    def test_gives_up_after_max_attempts(self):
+        DigestItem.objects.update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+        self.send(fail={'ext-0'})
+        item = DigestItem.objects.get(news=self.news[0])
+        self.assertIsNotNone(item.sent_at)
+        self.assertEqual(item.last_error, '2 envois en échec')
+        self.assertEqual(self.sent_counts(), {self.news[0].pk: 3, self.news[1].pk: 2})
+
+    def test_unapproved_news_are_dropped_without_log(self):
+        News.objects.filter(pk=self.news[1].pk).update(moderator_approved=False)
+        calls = self.send()
+        self.assertEqual({text for _, text in calls}, {'Informatique'})
+        self.assertEqual(self.sent_counts(), {self.news[0].pk: 5})
+        self.assertFalse(DigestItem.objects.filter(news=self.news[1]).exists())
+
+        # Tout le digest retiré : rien n'est envoyé ni journalisé
+        News.objects.filter(pk=self.news[0].pk).update(invalidated=True)
+        DigestItem.objects.create(
+            news=self.news[0], program=self.programs[0], frequency='weekly', window_end=timezone.now()
+        )
+        self.assertEqual(self.send(), [])
+        self.assertEqual(PublicationLog.objects.count(), 1)
+        self.assertFalse(DigestItem.objects.filter(frequency='weekly').exists())
+
+
+class NewsApprovalPathsTests(TestCase):
+    """
+    Une news validée par n'importe quel chemin (update_news, PATCH du
+    router, création déjà validée) entre dans le fil des non lues, le
+    badge et l'outbox (voir core.publication).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user(username='moderateur', password='x')
+        cls.student = User.objects.create_user(username='etudiant', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        Subscription.objects.create(user=cls.student, program=cls.program)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+    def unread(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        response = client.get('/api/news/unread/')
+        return [item['id'] for item in response.data['results']], response.data['unread_count']
+
+    def test_every_approval_path_reaches_the_unread_feed(self):
+        first, second = (News.objects.create(program=self.program, title_final=f"News {i}") for i in range(2))
+        self.client.patch(f'/api/news/{first.pk}/update/', {'moderator_approved': True}, format='json')
+        response = self.client.patch(f'/api/news/{second.pk}/', {'moderator_approved': True}, format='json')
+        self.assertIsNotNone(response.data['moderated_at'])
+        response = self.client.post('/api/news/', {
+            'program': self.program.pk, 'title_final': "Déjà validée", 'moderator_approved': True,
+        }, format='json')
+        created = response.data['id']
+
+        ids, count = self.unread()
+        self.assertEqual(sorted(ids), sorted([first.pk, second.pk, created]))
+        self.assertEqual(count, 3)
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+
+        # Resauvegarder une news déjà validée ne la compte pas deux fois
+        self.client.patch(f'/api/news/{second.pk}/', {'title_final': "Modifiée"}, format='json')
+        self.assertEqual(self.unread()[1], 3)
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+
+    def test_unapproval_through_router(self):
+        news = News.objects.create(program=self.program, title_final="News", moderator_approved=True)
+        self.assertEqual(self.unread()[1], 1)
+        self.client.patch(f'/api/news/{news.pk}/', {'moderator_approved': False}, format='json')
+        self.assertEqual(self.unread(), ([], 0))
+
+    def test_news_viewed_before_approval_is_not_unread(self):
+        pending, other = (News.objects.create(program=self.program, title_final=f"News {i}") for i in range(2))
+        store_news_view(self.student, pending)
+        self.client.patch(f'/api/news/{pending.pk}/', {'moderator_approved': True}, format='json')
+        self.assertEqual(self.unread(), ([], 0))
+
+        # Le badge reste juste par la suite : lire la suivante le remet à zéro
+        self.client.patch(f'/api/news/{other.pk}/', {'moderator_approved': True}, format='json')
+        self.assertEqual(self.unread(), ([other.pk], 1))
+        store_news_view(self.student, News.objects.get(pk=other.pk))
+        self.assertEqual(self.unread(), ([], 0))
+
+    def test_reapproved_news_stays_read(self):
+        news = News.objects.create(program=self.program, title_final="News", moderator_approved=True)
+        store_news_view(self.student, news)
+        self.client.patch(f'/api/news/{news.pk}/', {'moderator_approved': False}, format='json')
+        self.client.patch(f'/api/news/{news.pk}/', {'moderator_approved': True}, format='json')
+        self.assertEqual(self.unread(), ([], 0))
+
+    def test_every_approval_path_publishes_an_event(self):
+        routed, saved = (News.objects.create(program=self.program, title_final=f"News {i}") for i in range(2))
+        with mock.patch.object(get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/news/{routed.pk}/', {'moderator_approved': True}, format='json')
+            # Admin, shell : simple save() du modèle
+            saved.moderator_approved = True
+            with self.captureOnCommitCallbacks(execute=True):
+                saved.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/news/{routed.pk}/', {'moderator_approved': False}, format='json')
+
+        self.assertEqual(
+            [(args[1], args[2]['id']) for args, _ in publish.call_args_list],
+            [('news.approved', routed.pk), ('news.approved', saved.pk), ('news.unapproved', routed.pk)],
+        )
+        self.assertEqual({args[0] for args, _ in publish.call_args_list}, {f'program:{self.program.pk}'})
+
+
+class AsyncViewsTests(TestCase):
+    """
+    Les vues ASGI renvoient les mêmes données que les vues DRF.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        program = Program.objects.create(name='Informatique', code='INFO')
+        Subscription.objects.create(user=cls.user, program=program)
+        cls.news = [
+            News.objects.create(
+                program=program, title_final=f"News {i}",
+                moderator_approved=True, moderated_at=timezone.now(),
+            )
+            for i in range(3)
+        ]
+        ReadState.objects.filter(user=cls.user).update(unread_count=3)
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.auth = {'headers': {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}}
+
+    async def test_news_list_matches_sync_view(self):
+        response = await news_list_async(self.factory.get('/api/news/'))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+
+        await sync_to_async(cache.clear)()
+        expected = json.loads(json.dumps((await sync_to_async(APIClient().get)("/api/news/")).data))
+        self.assertEqual(data, expected)
+        self.assertIn('ETag', response)
+
+    async def test_unread_and_mark_viewed(self):
+        response = await unread_news_async(self.factory.get('/api/news/unread/', **self.auth))
+        data = json.loads(response.content)
+        self.assertEqual(data['unread_count'], 3)
+        self.assertEqual([item['id'] for item in data['results']], [n.pk for n in reversed(self.news)])
+
+        response = await mark_news_viewed_async(self.factory.post('/api/news/1/view/', **self.auth), self.news[0].pk)
+        self.assertEqual(json.loads(response.content), {'viewed': True, 'created': True})
+        response = await unread_news_async(self.factory.get('/api/news/unread/', **self.auth))
+        self.assertEqual(json.loads(response.content)['unread_count'], 2)
+
+    async def test_authentication(self):
+        response = await current_user_async(self.factory.get('/api/me/', **self.auth))
+        self.assertEqual(json.loads(response.content)['username'], 'etudiant')
+        self.assertEqual((await current_user_async(self.factory.get('/api/me/'))).status_code, 401)
+        bad_token = {'headers': {'Authorization': 'Bearer invalide'}}
+        self.assertEqual((await current_user_async(self.factory.get('/api/me/', **bad_token))).status_code, 401)
+
+
+class OneSignalRetryTests(TestCase):
+    """
+    429 de OneSignal : Retry-After honoré (secondes ou date HTTP) et
+    plafonné, backoff exponentiel sans en-tête, abandon après les retries.
+    """
+
+    def setUp(self):
+        self.news = News(title_final='Rentrée')
+        self.session = mock.Mock()
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    def response(self, status, retry_after=None):
+        headers = CaseInsensitiveDict({'Retry-After': retry_after} if retry_after is not None else {})
+        return mock.Mock(status_code=status, headers=headers, text='')
+
+    def send(self, *responses):
+        self.session.post.side_effect = responses
+        with mock.patch('core.utils.time.sleep') as sleep:
+            result = send_notification_batch(['a', 'b'], None, self.news, {}, 1, session=self.session)
+        return result, [call.args[0] for call in sleep.call_args_list]
+
+    def test_retry_after_is_honoured(self):
+        result, delays = self.send(self.response(429, '7'), self.response(200))
+        self.assertEqual((result, delays), ((2, 0), [7.0]))
+        self.assertEqual(self.session.post.call_count, 2)
+
+    def test_retry_after_http_date(self):
+        result, delays = self.send(self.response(429, http_date(time.time() + 30)), self.response(200))
+        self.assertEqual(result, (2, 0))
+        self.assertTrue(25 <= delays[0] <= 30, delays)
+
+    def test_retry_after_is_capped(self):
+        result, delays = self.send(self.response(429, '3600'), self.response(200))
+        self.assertEqual((result, delays), ((2, 0), [ONESIGNAL_MAX_RETRY_AFTER]))
+
+    def test_gives_up_after_max_retries(self):
+        result, delays = self.send(*[self.response(429)] * (ONESIGNAL_MAX_RETRIES + 1))
+        # Sans Retry-After : backoff exponentiel 1, 2, 4...
+        self.assertEqual(result, (0, 2))
+        self.assertEqual(delays, [float(2 ** attempt) for attempt in range(ONESIGNAL_MAX_RETRIES)])
+        self.assertEqual(self.session.post.call_count, ONESIGNAL_MAX_RETRIES + 1)
+
+    async def test_async_client_honours_and_caps_retry_after(self):
+        client = AsyncOneSignalClient(url='http://onesignal.invalid/notifications', headers={})
+        client.post = mock.AsyncMock(side_effect=[
+            self.response(429, '7'), self.response(429, '3600'), self.response(200),
+        ])
+        with mock.patch('core.onesignal_async.asyncio.sleep', new_callable=mock.AsyncMock) as sleep:
+            self.assertEqual(await client.send_batch(['a'], None, self.news, '1'), (1, 0))
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [7.0, ONESIGNAL_MAX_RETRY_AFTER])
+
+
+class AsyncOneSignalClientTests(TestCase):
+    """
+    Client asyncio : keep-alive, corps chunked et nouvel essai sur 429.
+    """
+
+    async def test_retry_after_and_keep_alive(self):
+        connections = []
+        requests_seen = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.CancelledError):
+                    return  # client fermé ou serveur arrêté
+                length = int(re.search(rb'Content-Length: (\d+)', head).group(1))
+                requests_seen.append(json.loads(await reader.readexactly(length)))
+                if len(requests_seen) == 1:
+                    writer.write(b'HTTP/1.1 429 Too Many Requests\r\nRetry-After: 0\r\nContent-Length: 0\r\n\r\n')
+                else:
+                    writer.write(
+                        b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                        b'b\r\n{"id": "x"}\r\n0\r\n\r\n'
+                    )
+                await writer.drain()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            async with AsyncOneSignalClient(url=f'http://127.0.0.1:{port}/notifications', headers={}) as client:
+                news = News(title_final='Rentrée')
+                self.assertEqual(await client.send_batch(['a', 'b'], None, news, '1'), (2, 0))
+                self.assertEqual(await client.send_batch(['c'], None, news, '2'), (1, 0))
+            for writer in connections:
+                writer.close()
+
+        self.assertEqual(len(requests_seen), 3)
+        self.assertEqual(len(connections), 1)
+        self.assertEqual(requests_seen[-1]['include_external_user_ids'], ['c'])
+
+
+class NewsStreamTests(TestCase):
+    """
+    Flux SSE : un événement par news validée dans les programmes suivis.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        cls.other = Program.objects.create(name='Chimie', code='CHIM')
+        Subscription.objects.create(user=cls.user, program=cls.program)
+
+    def setUp(self):
+        user_cache.clear()
+        self.auth = {'headers': {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}}
+
+    def approve(self, news):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch(f'/api/news/{news.pk}/update/', {'moderator_approved': True}, format='json')
+
+    async def test_stream_pushes_approved_news(self):
+        mine = await News.objects.acreate(program=self.program, title_final='Partiels')
+        theirs = await News.objects.acreate(program=self.other, title_final='TP annulé')
+
+        response = await news_stream_async(AsyncRequestFactory().get('/api/news/stream/', **self.auth))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        ready = (await anext(stream)).decode()
+        self.assertIn('event: ready', ready)
+        self.assertIn(f'"programs":[{self.program.pk}]', ready)
+
+        # Programme non suivi : aucun événement
+        await sync_to_async(self.approve)(theirs)
+        await sync_to_async(self.approve)(mine)
+        event = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertIn('event: news.approved', event)
+        data = json.loads(event.split('data: ')[1])
+        self.assertEqual((data['id'], data['title']), (mine.pk, 'Partiels'))
+        await stream.aclose()
+
+    async def test_eventsource_authenticates_with_a_stream_token(self):
+        response = await news_stream_token_async(AsyncRequestFactory().post('/api/news/stream/token/', **self.auth))
+        token = json.loads(response.content)['token']
+        cookie = response.cookies[STREAM_TOKEN_COOKIE]
+        self.assertEqual((cookie.value, cookie['path']), (token, '/api/news/stream/'))
+        self.assertTrue(cookie['httponly'])
+
+        factory = AsyncRequestFactory()
+        factory.cookies[STREAM_TOKEN_COOKIE] = token
+        for request in (AsyncRequestFactory().get('/api/news/stream/', {'token': token}),
+                        factory.get('/api/news/stream/')):
+            response = await news_stream_async(request)
+            self.assertEqual(response.status_code, 200)
+            stream = aiter(response.streaming_content)
+            self.assertIn('event: ready', (await anext(stream)).decode())
+            await stream.aclose()
+
+        # Un token d'accès n'est pas accepté dans l'URL
+        access = str(AccessToken.for_user(self.user))
+        response = await news_stream_async(AsyncRequestFactory().get('/api/news/stream/', {'token': access}))
+        self.assertEqual(response.status_code, 401)
+        response = await news_stream_async(AsyncRequestFactory().get('/api/news/stream/'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_unix_socket_backend_between_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Deux brokers = deux workers sur la même machine
+            publisher = EventBroker(UnixSocketBackend(directory, 'events-1.sock'))
+            listener = EventBroker(UnixSocketBackend(directory, 'events-2.sock'))
+            subscription = listener.subscribe(['program:7'])
+            publisher.publish('program:7', 'news.approved', {'id': 1})
+            publisher.publish('program:8', 'news.approved', {'id': 2})
+            event = await asyncio.wait_for(subscription.get(), 5)
+            self.assertEqual((event['type'], event['data']), ('news.approved', {'id': 1}))
+            self.assertTrue(subscription.queue.empty())
+            publisher.backend.stop()
+            listener.backend.stop()
+
+
+class BenchmarkTests(TestCase):
+    """
+    Jeu de données synthétique, charges et serveur OneSignal factice.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, ATTACHMENT_DERIVATIVES=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.dataset = generate_dataset(programs=3, users=20, subscriptions=2, news=30, attachments=3, views=50, seed=1)
+        self.workloads = {workload.name: workload for workload in build_workloads()}
+
+    def test_dataset_and_read_workloads(self):
+        self.assertEqual(Subscription.objects.count(), 40)
+        # Compteurs de non lues reconstruits après les bulk_create
+        user = User.objects.get(pk=self.dataset['user_ids'][0])
+        unread = sum(ReadState.objects.filter(user=user).values_list('unread_count', flat=True))
+        self.assertEqual(unread, unread_news_queryset(user).count())
+        self.assertEqual(NewsStats.objects.count(), 30)
+        for name in ('news-list', 'news-unread', 'attachment-download', 'programs-detail'):
+            result = run_workload(self.workloads[name], self.dataset, requests=5, warmup=1)
+            self.assertEqual((result['requests'], result['errors']), (5, 0), name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_fanout_against_stub(self):
+        news = News.objects.get(pk=self.dataset['fanout_news_id'])
+        audience = news_audience_queryset(news, frequencies=['immediate']).count()
+        with StubOneSignalServer() as stub:
+            workload = {workload.name: workload for workload in build_workloads(stub)}['fanout-sync']
+            result = run_workload(workload, self.dataset, requests=2, warmup=0)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(stub.recipients, 2 * audience)
+
+    def test_compare_results_flags_regressions(self):
+        baseline = {'results': {
+            'news-list': {'p95_ms': 10.0, 'throughput': 100.0},
+            'me': {'p95_ms': 2.0, 'throughput': 500.0},
+        }}
+        current = {'results': {
+            'news-list': {'p95_ms': 12.0, 'throughput': 95.0},
+            'me': {'p95_ms': 2.1, 'throughput': 480.0},
+            'signup': {'p95_ms': 400.0, 'throughput': 2.0},
+        }}
+        rows = {row['name']: row for row in compare_results(current, baseline, threshold=0.10)}
+        self.assertEqual(set(rows), {'news-list', 'me'})
+        self.assertTrue(rows['news-list']['regression'])
+        self.assertFalse(rows['me']['regression'])
+
+
+class AsyncFanoutTests(TestCase):
+    """
+    Fan-out asyncio : destinataires lus hors de la boucle d'événements.
+    """
+
+    async def test_send_news_notification_async(self):
+        news = await self._create_audience(3)
+
+        with StubOneSignalServer() as stub:
+            async with AsyncOneSignalClient(url=stub.url, headers={}) as client:
+                with mock.patch('builtins.print'):
+                    self.assertEqual(await send_news_notification_async(news, client), (3, 0))
+        self.assertEqual(stub.recipients, 3)
+
+    async def _create_audience(self, count):
+        program = await Program.objects.acreate(name='Informatique', code='INFO')
+        for i in range(count):
+            user = await User.objects.acreate(username=f"etudiant{i}")
+            await Subscription.objects.acreate(user=user, program=program)
+            await NotificationPref.objects.acreate(user=user, frequency='immediate')
+            await PushSubscription.objects.acreate(user=user, external_user_id=f"ext-{i}")
+        return await News.objects.acreate(program=program, title_final='Partiels', moderator_approved=True)
+
+    async def test_in_flight_batches_are_bounded(self):
+        news = await self._create_audience(6)
+        state = {'running': 0, 'peak': 0, 'sent': 0}
+
+        class SlowClient:
+            max_connections = 1
+
+            async def send_batch(self, external_ids, send_after, news, batch_label, content):
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+                await asyncio.sleep(0.01)
+                state['running'] -= 1
+                state['sent'] += len(external_ids)
+                return len(external_ids), 0
+
+        with mock.patch('core.onesignal_async.ONESIGNAL_MAX_IDS_PER_REQUEST', 1), \
+                mock.patch('builtins.print'):
+            self.assertEqual(await send_news_notification_async(news, SlowClient()), (6, 0))
+        self.assertEqual(state['sent'], 6)
+        self.assertLessEqual(state['peak'], 2)
+
+    async def test_pending_batches_are_cancelled_on_failure(self):
+        news = await self._create_audience(2)
+        started = []
+
+        class HangingClient:
+            max_connections = 4
+
+            async def send_batch(self, external_ids, send_after, news, batch_label, content):
+                started.append(asyncio.current_task())
+                await asyncio.sleep(60)
+
+        def broken_audience(news, frequencies):
+            yield 'ext-0', 'immediate'
+            raise DatabaseError('curseur perdu')
+
+        with mock.patch('core.onesignal_async.ONESIGNAL_MAX_IDS_PER_REQUEST', 1), \
+                mock.patch('core.onesignal_async.AUDIENCE_CHUNK_SIZE', 1), \
+                mock.patch('core.onesignal_async.iter_news_audience', broken_audience):
+            with self.assertRaises(DatabaseError):
+                await send_news_notification_async(news, HangingClient())
+        self.assertEqual(len(started), 1)
+        self.assertTrue(started[0].cancelled())
+
+
+class RequestMetricsTests(TestCase):
+    """
+    Server-Timing, agrégats /metrics et journal des requêtes lentes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        program = Program.objects.create(name='Informatique', code='INFO')
+        for i in range(3):
+            News.objects.create(program=program, title_final=f"News {i}", moderator_approved=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/news/')
+        timing = dict(
+            (part.split(';')[0].strip(), part) for part in response['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(timing), {'db', 'ser', 'http', 'total'})
+        queries = int(re.search(r'desc="(\d+) queries"', timing['db']).group(1))
+        self.assertGreater(queries, 0)
+        self.assertGreater(float(re.search(r'dur=([\d.]+)', timing['ser']).group(1)), 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/news/')
+        self.client.get('/api/news/999999/')
+        staff = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('ccc_http_requests_total{method="GET",route="api/news/<pk>/",status="404"}', body)
+        self.assertRegex(body, r'ccc_http_request_sql_queries_count\{method="GET",route="api/news/"\} \d+')
+        self.assertNotIn('route="metrics"', body)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(APIClient().get('/metrics').status_code, 401)
+            response = APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    def test_metrics_reserved_to_staff(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        bearer = lambda user: {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        self.assertEqual(APIClient().get('/metrics', **bearer(self.user)).status_code, 403)
+        staff = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.assertEqual(APIClient().get('/metrics', **bearer(staff)).status_code, 200)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_log_includes_sql(self):
+        before = registry.slow_requests.series[(('method', 'GET'), ('route', 'api/news/unread/'))]
+        with self.assertLogs('core.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/news/unread/')
+        self.assertIn('GET /api/news/unread/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+        after = registry.slow_requests.series[(('method', 'GET'), ('route', 'api/news/unread/'))]
+        self.assertEqual(after, before + 1)
+
+
+class FastNewsSerializationTests(TestCase):
+    """
+    Listes de news en lignes .values() (core.fastserializers) : sortie
+    identique à NewsSerializer, ?fields= pour n'en garder qu'une partie.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etudiant', password='x')
+        cls.program = Program.objects.create(name='Informatique', code='INFO')
+        Subscription.objects.create(user=cls.user, program=cls.program)
+        now = timezone.now()
+        for i in range(12):
+            news = News.objects.create(
+                program=cls.program,
+                author=cls.user,
+                moderator=cls.user if i % 2 else None,
+                title_draft=f"Brouillon {i}",
+                title_final=f"Inscription {i} \u2028 é",
+                content_final="Contenu",
+                importance='urgente' if i % 3 else 'faible',
+                moderator_approved=True,
+                moderated_at=now - timedelta(minutes=i),
+                publish_date_effective=now.date() if i % 4 else None,
+            )
+            for j in range(i % 3):
+                Attachment.objects.create(news=news, file=f"attachments/{news.pk}-{j}.png", mime='image/png')
+        invalidate_news_cache()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, response, context=True):
+        results = response.json()['results']
+        news = News.objects.in_bulk([item['id'] for item in results])
+        data = NewsSerializer(
+            [news[item['id']] for item in results], many=True,
+            context={'request': response.wsgi_request} if context else {},
+        ).data
+        return json.loads(JSONRenderer().render(data))
+
+    def test_lists_match_drf_serializer(self):
+        for url in ('/api/news/', '/api/news/?ordering=importance', '/api/news/approved/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), 10)
+            self.assertEqual(response.json()['results'], self.expected(response))
+
+        response = self.client.get('/api/news/unread/')
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertEqual(response.json()['results'], self.expected(response, context=False))
+
+        # ?search= : même sortie, plus l'extrait surligné
+        results = self.client.get('/api/news/', {'search': 'inscription'}).json()['results']
+        self.assertTrue(all('<mark>' in item.pop('search_snippet') for item in results))
+        self.assertEqual(results, self.expected(self.client.get('/api/news/')))
+
+    def test_sparse_fieldsets(self):
+        # génération du cache + news, sans les pièces jointes
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/news/', {'fields': 'id,title_final'})
+        first_page = response.json()
+        self.assertEqual([set(item) for item in first_page['results']], [{'id', 'title_final'}] * 10)
+
+        # Le curseur ne dépend pas des champs demandés
+        second_page = self.client.get(first_page['next']).json()
+        ids = [item['id'] for item in first_page['results'] + second_page['results']]
+        self.assertEqual(ids, list(News.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+        response = self.client.get('/api/news/unread/', {'fields': 'id,attachments'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'attachments'})
+
+        response = self.client.get('/api/news/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {
+            'date': timezone.now(),
+            'day': timezone.now().date(),
+            'prix': Decimal('1.50'),
+            1: ['é', '\u2028', None, True, 1.5],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
 
-# Create your tests here.
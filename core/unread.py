@@ -0,0 +1,157 @@
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .models import News, NewsView, ReadState
+
+# Valeur de read_until quand l'utilisateur n'a encore rien lu
+NOTHING_READ = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def unread_news_queryset(user):
+    """
+    News validées non lues des programmes suivis par `user`.
+    
+    Seules les news postérieures au read_until de chaque programme sont
+    examinées, et la lecture est vérifiée par un NOT EXISTS sur l'index
+    unique (user, news) de NewsView : le coût dépend du nombre de news
+    récentes, pas de l'historique de lecture.
+    """
+    read_until = ReadState.objects.filter(
+        user=user, program_id=OuterRef('program_id')
+    ).values('read_until')[:1]
+    seen = NewsView.objects.filter(user=user, news_id=OuterRef('pk'))
+
+    return (
+        News.objects.filter(program__read_states__user=user, moderator_approved=True)
+        .annotate(user_read_until=Coalesce(Subquery(read_until), Value(NOTHING_READ)))
+        .filter(moderated_at__gt=F('user_read_until'))
+        .exclude(Exists(seen))
+        .order_by('-created_at', '-id')
+    )
+
+
+def get_unread_count(user):
+    """
+    Nombre total de news non lues (badge) : somme des compteurs maintenus,
+    une ligne par programme suivi.
+    """
+    return ReadState.objects.filter(user=user).aggregate(
+        total=Coalesce(Sum('unread_count'), 0)
+    )['total']
+
+
+def record_news_approved(news):
+    """
+    Une news vient d'être validée (voir record_news_approved_many).
+    """
+    record_news_approved_many([news])
+
+
+def record_news_approved_many(news_list):
+    """
+    Plusieurs news viennent d'être validées : une requête UPDATE par
+    programme (+n non lues) au lieu d'une par news.
+
+    Les news déjà lues par un abonné (ouvertes en attente de validation,
+    ou avant une dé-validation) ne comptent pas pour lui : le fil des non
+    lues les exclut, le badge aussi.
+    """
+    approved_by_program = defaultdict(list)
+    for news in news_list:
+        if news.program_id:
+            approved_by_program[news.program_id].append(news.pk)
+    for program_id, news_ids in approved_by_program.items():
+        already_viewed = (
+            NewsView.objects.filter(user_id=OuterRef('user_id'), news_id__in=news_ids)
+            .values('user_id')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        ReadState.objects.filter(program_id=program_id).update(
+            unread_count=F('unread_count') + len(news_ids) - Coalesce(Subquery(already_viewed), 0)
+        )
+
+
+def record_news_viewed(user, news):
+    """
+    `user` vient de lire `news` pour la première fois (voir record_news_viewed_many).
+    """
+    record_news_viewed_many(user, [news])
+
+
+def record_news_viewed_many(user, news_list):
+    """
+    `user` vient de lire ces news pour la première fois (voir record_news_viewed_by_user).
+    """
+    record_news_viewed_by_user({getattr(user, 'pk', user): news_list})
+
+
+def record_news_viewed_by_user(news_by_user):
+    """
+    Premières lectures de plusieurs utilisateurs ({user_id: [news, ...]}) :
+    chaque news comptée comme non lue (validée, après le read_until)
+    décrémente le compteur de son programme. Quand tout est lu, read_until
+    avance à maintenant, ce qui vide l'ensemble des exceptions à examiner.
+    
+    Les ReadState sont lus en une requête, puis une UPDATE par décrément
+    distinct (flush_view_buffer ingère de nombreux utilisateurs à la fois).
+    """
+    moderated = defaultdict(list)
+    for user_id, news_list in news_by_user.items():
+        for news in news_list:
+            if news.program_id and news.moderator_approved and news.moderated_at:
+                moderated[(user_id, news.program_id)].append(news.moderated_at)
+    if not moderated:
+        return
+
+    states = ReadState.objects.filter(
+        user_id__in={user_id for user_id, _ in moderated},
+        program_id__in={program_id for _, program_id in moderated},
+    )
+    state_ids = []
+    decrements = defaultdict(list)
+    for state in states.only('id', 'user_id', 'program_id', 'read_until'):
+        dates = moderated.get((state.user_id, state.program_id))
+        if dates is None:
+            continue
+        state_ids.append(state.pk)
+        counted = sum(1 for moderated_at in dates if state.read_until is None or moderated_at > state.read_until)
+        if counted:
+            decrements[counted].append(state.pk)
+    for counted, ids in decrements.items():
+        ReadState.objects.filter(pk__in=ids).update(unread_count=Greatest(F('unread_count') - counted, 0))
+    ReadState.objects.filter(pk__in=state_ids, unread_count=0).update(read_until=timezone.now())
+
+
+def rebuild_read_states(**filters):
+    """
+    Recalcule unread_count (en une requête UPDATE) pour les ReadState
+    filtrés, ex. après la suppression ou la dé-validation d'une news.
+    """
+    unread = (
+        News.objects.filter(
+            program_id=OuterRef('program_id'),
+            moderator_approved=True,
+            moderated_at__gt=Coalesce(OuterRef('read_until'), Value(NOTHING_READ)),
+        )
+        .exclude(Exists(NewsView.objects.filter(user_id=OuterRef(OuterRef('user_id')), news_id=OuterRef('pk'))))
+        .values('program_id')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return ReadState.objects.filter(**filters).update(
+        unread_count=Coalesce(Subquery(unread), 0)
+    )
+
+
+def create_read_state(user_id, program_id):
+    """
+    État de lecture d'un nouvel abonnement : toutes les news déjà
+    validées du programme sont non lues.
+    """
+    state, created = ReadState.objects.get_or_create(user_id=user_id, program_id=program_id)
+    if created:
+        rebuild_read_states(pk=state.pk)
+    return state
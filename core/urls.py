@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import *
@@ -21,7 +22,9 @@ router.register('news_views', NewsViewViewSet)
 urlpatterns = [
     # Routes news spécifiques (doivent être avant le router)
     path('news/unread/', unread_news, name='unread_news'),
+    path('news/unread/count/', unread_news_count, name='unread_news_count'),
     path('news/<int:news_id>/view/', mark_news_viewed, name='mark_news_viewed'),
+    path('news/view/', mark_news_viewed_bulk, name='mark_news_viewed_bulk'),
     path('news/<int:pk>/update/', update_news, name='update_news'),
     path('news/views/', news_views_count, name='all_news_views_count'),
     path('news/<int:news_id>/views/', news_views_count, name='single_news_views_count'),
@@ -32,3 +35,19 @@ urlpatterns = [
     # Router URLs (doit être en dernier)
     path('', include(router.urls)),
 ]
+
+# Serveur ASGI : versions asynchrones des lectures fréquentes, placées avant
+# les routes synchrones équivalentes (voir core.async_views)
+if settings.ASYNC_HOT_PATHS:
+    from . import async_views
+
+    urlpatterns = [
+        path('news/', async_views.news_list_async),
+        path('news/<int:pk>/', async_views.news_detail_async),
+        path('news/unread/', async_views.unread_news_async, name='unread_news'),
+        path('news/<int:news_id>/view/', async_views.mark_news_viewed_async, name='mark_news_viewed'),
+        path('me/', async_views.current_user_async),
+        # Flux SSE : uniquement sous ASGI (WSGI bufferiserait la réponse entière)
+        path('news/stream/', async_views.news_stream_async, name='news_stream'),
+        path('news/stream/token/', async_views.news_stream_token_async, name='news_stream_token'),
+    ] + urlpatterns
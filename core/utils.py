@@ -1,11 +1,80 @@
+import contextvars
 import json
+import threading
+import time
 import requests
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 from django.utils import timezone
-from .models import Subscription, PushSubscription, NotificationPref
+from .metrics import timed_http
+from .models import PushSubscription, DigestItem
 
 # Limite OneSignal : 2000 external_user_ids par appel
 ONESIGNAL_MAX_IDS_PER_REQUEST = 2000
+# Configurable pour viser un serveur factice (voir core.benchmark)
+ONESIGNAL_API_URL = getattr(settings, 'ONESIGNAL_API_URL', "https://api.onesignal.com/notifications")
+ONESIGNAL_HEADERS = {
+    "Authorization": "Key os_v2_app_ylnvbv6dnff6taprfh2ekxbg7ngb3ihhyf7ubv5fly6xkadme4errldtej2kd7otllb4h7qm2essieff5c3fd3xieznxi2eir2adlzy",  
+    "Content-Type": "application/json",
+}
+# Fréquences regroupées en digest au lieu d'un envoi par news
+DIGEST_FREQUENCIES = ('daily', 'weekly')
+# Taille des paquets lus en base lors de la résolution des destinataires
+AUDIENCE_CHUNK_SIZE = 2000
+# Nombre de titres listés dans une notification groupée (digest, modération en masse)
+DIGEST_MAX_TITLES = 5
+
+# Nombre de batches envoyés en parallèle (= taille du pool de connexions)
+ONESIGNAL_MAX_CONCURRENCY = getattr(settings, 'ONESIGNAL_MAX_CONCURRENCY', 8)
+# Nombre de nouvelles tentatives après un 429 (rate limit)
+ONESIGNAL_MAX_RETRIES = getattr(settings, 'ONESIGNAL_MAX_RETRIES', 3)
+# Attente maximale (secondes) honorée pour un Retry-After
+ONESIGNAL_MAX_RETRY_AFTER = 60
+
+_onesignal_session = None
+_onesignal_session_lock = threading.Lock()
+
+
+def get_onesignal_session():
+    """
+    Retourne la session HTTP partagée (keep-alive) utilisée pour OneSignal.
+    Le pool de connexions est dimensionné sur ONESIGNAL_MAX_CONCURRENCY.
+    """
+    global _onesignal_session
+    with _onesignal_session_lock:
+        if _onesignal_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=ONESIGNAL_MAX_CONCURRENCY,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _onesignal_session = session
+        return _onesignal_session
+
+
+def parse_retry_after(value, default=1.0):
+    """
+    Convertit un en-tête Retry-After (secondes ou date HTTP) en secondes d'attente.
+    """
+    if not value:
+        return default
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return default
+        delay = (retry_at - timezone.now()).total_seconds()
+    return min(max(delay, 0.0), ONESIGNAL_MAX_RETRY_AFTER)
+
 
 def calculate_send_after_time(frequency):
     """
@@ -17,7 +86,16 @@ def calculate_send_after_time(frequency):
     Returns:
         str: Date ISO 8601 pour send_after, ou None si immediate
     """
-    now = timezone.now()
+    send_time = calculate_send_after_datetime(frequency)
+    return send_time.isoformat() if send_time else None
+
+
+def calculate_send_after_datetime(frequency, now=None):
+    """
+    Même calcul que calculate_send_after_time, mais retourne un datetime
+    (utilisé comme fin de fenêtre pour les digests).
+    """
+    now = now or timezone.now()
     
     if frequency == 'immediate':
         return None  # Envoi immédiat
@@ -25,8 +103,7 @@ def calculate_send_after_time(frequency):
     elif frequency == 'daily':
         # Demain à 12h00 (toujours le jour suivant, peu importe l'heure)
         tomorrow = now + timedelta(days=1)
-        send_time = tomorrow.replace(hour=12, minute=0, second=0, microsecond=0)
-        return send_time.isoformat()
+        return tomorrow.replace(hour=12, minute=0, second=0, microsecond=0)
     
     elif frequency == 'weekly':
         # Prochain samedi à 12h00
@@ -46,27 +123,17 @@ def calculate_send_after_time(frequency):
             send_time = now + timedelta(days=days_until_saturday)
             send_time = send_time.replace(hour=12, minute=0, second=0, microsecond=0)
         
-        return send_time.isoformat()
+        return send_time
     
     return None
 
 
-def send_notification_batch(external_ids, send_after, news, headers, batch_num, total_batches):
+def build_news_content(news):
     """
-    Envoie un batch de notifications à OneSignal.
-    
-    Returns:
-        tuple: (success_count, error_count)
+    Titre et texte bilingues (requis par OneSignal) pour une news validée.
     """
-    if not external_ids:
-        return 0, 0
-    
-    # Préparer le contenu bilingue (requis par OneSignal)
     news_title = news.title_final or news.title_draft or "Nouvelle actualité"
-    
-    payload = {
-        "app_id": "c2db50d7-c369-4be9-81f1-29f4455c26fb",  
-        "include_external_user_ids": external_ids,
+    return {
         "headings": {
             "en": "New validated news",
             "fr": "Nouvelle actualité validée"
@@ -76,124 +143,379 @@ def send_notification_batch(external_ids, send_after, news, headers, batch_num,
             "fr": news_title
         },
     }
+
+
+def build_digest_content(news_list):
+    """
+    Contenu bilingue regroupant plusieurs news (digests, modération en masse).
+    Une seule news : même contenu qu'une notification immédiate.
+    """
+    if len(news_list) == 1:
+        return build_news_content(news_list[0])
+
+    titles = [
+        news.title_final or news.title_draft or "Nouvelle actualité"
+        for news in news_list[:DIGEST_MAX_TITLES]
+    ]
+    lines = "\n".join(f"• {title}" for title in titles)
+    remaining = len(news_list) - len(titles)
+
+    return {
+        "headings": {
+            "en": f"{len(news_list)} new validated news",
+            "fr": f"{len(news_list)} nouvelles actualités validées"
+        },
+        "contents": {
+            "en": lines + (f"\n… and {remaining} more" if remaining else ""),
+            "fr": lines + (f"\n… et {remaining} autres" if remaining else ""),
+        },
+    }
+
+
+def build_notification_payload(external_ids, send_after, news, content=None):
+    """
+    Corps JSON d'un appel OneSignal (client synchrone et client asyncio).
+    """
+    payload = {
+        "app_id": "c2db50d7-c369-4be9-81f1-29f4455c26fb",  
+        "include_external_user_ids": external_ids,
+        **(content or build_news_content(news)),
+    }
     
     # Ajouter send_after si programmé
     if send_after:
         payload["send_after"] = send_after
+    return payload
+
+
+class NotificationBatch(NamedTuple):
+    """
+    Un appel OneSignal de dispatch_notification_batches.
+
+    `content` remplace le contenu commun du dispatch (digests : une tranche
+    par contenu) ; `key` est la clé de reprise du batch (voir BatchProgress).
+    """
+    external_ids: list
+    send_after: str = None
+    batch_num: object = None
+    total_batches: int = None
+    content: dict = None
+    key: str = None
+
+
+class BatchProgress:
+    """
+    Batches d'un fan-out déjà acceptés par OneSignal, pour qu'une reprise
+    (outbox, digest) n'envoie que les autres.
+
+    L'audience est lue triée par external_user_id : un batch couvre une
+    plage [premier, dernier] des destinataires de sa clé (fréquence,
+    tranche de digest). L'état, stocké tel quel dans un JSONField, est
+    {clé: {"ranges": [[premier, dernier], ...], "sent": nombre envoyé}} ;
+    `on_record(state)` l'enregistre après chaque batch réussi.
+    """
+
+    def __init__(self, state=None, on_record=None):
+        self.on_record = on_record
+        self.state = {
+            key: {'ranges': [list(bounds) for bounds in value['ranges']], 'sent': value['sent']}
+            for key, value in (state or {}).items()
+        }
+        self._firsts = {key: [first for first, _ in value['ranges']] for key, value in self.state.items()}
+
+    def is_sent(self, key, external_id):
+        firsts = self._firsts.get(key)
+        if not firsts:
+            return False
+        index = bisect_right(firsts, external_id) - 1
+        return index >= 0 and external_id <= self.state[key]['ranges'][index][1]
+
+    def record(self, key, external_ids):
+        """
+        Enregistre un batch envoyé ; les plages qui se recouvrent sont fusionnées.
+        """
+        value = self.state.setdefault(key, {'ranges': [], 'sent': 0})
+        merged = []
+        for first, last in sorted(value['ranges'] + [[min(external_ids), max(external_ids)]]):
+            if merged and first <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        value['ranges'] = merged
+        value['sent'] += len(external_ids)
+        self._firsts[key] = [first for first, _ in merged]
+
+    def batch_done(self, batch, success, errors):
+        """
+        on_batch_done de dispatch_notification_batches.
+        """
+        if success and not errors:
+            self.record(batch.key, batch.external_ids)
+            if self.on_record:
+                self.on_record(self.state)
+
+    def sent(self, key=None):
+        if key is not None:
+            return self.state.get(key, {}).get('sent', 0)
+        return sum(value['sent'] for value in self.state.values())
+
+
+def send_notification_batch(external_ids, send_after, news, headers, batch_num, total_batches=None, session=None, content=None):
+    """
+    Envoie un batch de notifications à OneSignal.
+    
+    `content` (headings/contents) remplace le contenu construit à partir
+    de `news` ; utilisé pour les digests qui regroupent plusieurs news.
+    
+    `total_batches` peut être None quand les batches sont produits en flux
+    (le nombre total n'est alors pas connu à l'avance).
+    
+    En cas de 429, attend le délai indiqué par Retry-After (ou un backoff
+    exponentiel) puis réessaie, jusqu'à ONESIGNAL_MAX_RETRIES fois.
+    
+    Returns:
+        tuple: (success_count, error_count)
+    """
+    if not external_ids:
+        return 0, 0
+    
+    batch_label = f"{batch_num}/{total_batches}" if total_batches else f"{batch_num}"
+    
+    session = session or get_onesignal_session()
+    body = json.dumps(build_notification_payload(external_ids, send_after, news, content))
     
     try:
-        response = requests.post(
-            "https://api.onesignal.com/notifications",
-            data=json.dumps(payload),
-            headers=headers,
-            timeout=30
-        )
+        for attempt in range(ONESIGNAL_MAX_RETRIES + 1):
+            with timed_http():
+                response = session.post(
+                    ONESIGNAL_API_URL,
+                    data=body,
+                    headers=headers,
+                    timeout=30
+                )
+            if response.status_code != 429 or attempt == ONESIGNAL_MAX_RETRIES:
+                break
+            delay = parse_retry_after(response.headers.get("Retry-After"), default=2 ** attempt)
+            print(f"🐢 Batch {batch_label} limité (429), nouvel essai dans {delay:.1f}s")
+            time.sleep(delay)
         
         if response.status_code == 200:
             timing_info = f"programmé pour {send_after}" if send_after else "immédiat"
-            print(f"✅ Batch {batch_num}/{total_batches} envoyé ({len(external_ids)} utilisateurs, {timing_info})")
+            print(f"✅ Batch {batch_label} envoyé ({len(external_ids)} utilisateurs, {timing_info})")
             return len(external_ids), 0
         else:
-            print(f"❌ Erreur batch {batch_num}/{total_batches} ({response.status_code}): {response.text[:200]}")
+            print(f"❌ Erreur batch {batch_label} ({response.status_code}): {response.text[:200]}")
             return 0, len(external_ids)
             
     except requests.exceptions.Timeout:
-        print(f"⏱️ Timeout batch {batch_num}/{total_batches} ({len(external_ids)} utilisateurs)")
+        print(f"⏱️ Timeout batch {batch_label} ({len(external_ids)} utilisateurs)")
         return 0, len(external_ids)
     except Exception as e:
-        print(f"⚠️ Erreur batch {batch_num}/{total_batches}: {e}")
+        print(f"⚠️ Erreur batch {batch_label}: {e}")
         return 0, len(external_ids)
 
 
-def send_news_notification(news):
+def dispatch_notification_batches(jobs, news, headers, max_workers=None, content=None, on_batch_done=None):
     """
-    Envoie une notification OneSignal à tous les utilisateurs abonnés
-    au programme de la news validée, en respectant leurs préférences.
+    Envoie plusieurs batches en parallèle sur la session partagée.
     
-    - Immediate : envoi immédiat
-    - Daily : envoi programmé pour demain à 12h00
-    - Weekly : envoi programmé pour le prochain samedi à 12h00
-    - push_enabled=False : pas d'envoi
-    """
-    # Récupérer les utilisateurs abonnés au programme
-    user_ids = Subscription.objects.filter(program=news.program).values_list('user_id', flat=True)
+    `jobs` peut être un générateur : au plus 2 × max_workers batches sont
+    en mémoire à la fois, les suivants ne sont consommés qu'à mesure que
+    les envois se terminent.
     
-    if not user_ids:
-        print("ℹ️ Aucun utilisateur abonné à ce programme")
-        return
+    Args:
+        jobs: itérable de NotificationBatch ou de tuples
+            (external_ids, send_after, batch_num, total_batches)
+        max_workers: limite de concurrence (ONESIGNAL_MAX_CONCURRENCY par défaut)
+        content: contenu commun à tous les batches (voir send_notification_batch)
+        on_batch_done: appelé dans le thread appelant avec
+            (NotificationBatch, success_count, error_count) à la fin de chaque batch
     
-    # Récupérer les préférences de notification et push subscriptions
-    prefs = NotificationPref.objects.filter(
-        user_id__in=user_ids,
-        push_enabled=True  # Seulement ceux qui ont activé les notifications push
-    ).select_related('user')
-    
-    # Récupérer les external_user_ids pour ces utilisateurs
-    push_subscriptions = PushSubscription.objects.filter(
-        user_id__in=[pref.user_id for pref in prefs]
-    ).select_related('user')
-    
-    # Créer un mapping user_id -> external_user_id
-    user_to_external = {
-        sub.user_id: sub.external_user_id 
-        for sub in push_subscriptions
-    }
+    Returns:
+        tuple: (success_count, error_count) cumulés
+    """
+    session = get_onesignal_session()
+    workers = max_workers or ONESIGNAL_MAX_CONCURRENCY
+    total_success = 0
+    total_errors = 0
+    in_flight = {}
     
-    # Créer un mapping user_id -> frequency
-    user_to_frequency = {
-        pref.user_id: pref.frequency 
-        for pref in prefs
-    }
+    def collect(futures):
+        nonlocal total_success, total_errors
+        for future in futures:
+            batch = in_flight.pop(future)
+            success, errors = future.result()
+            total_success += success
+            total_errors += errors
+            if on_batch_done:
+                on_batch_done(batch, success, errors)
     
-    # Grouper les external_ids par fréquence
-    grouped_by_frequency = {
-        'immediate': [],
-        'daily': [],
-        'weekly': []
-    }
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for job in jobs:
+            batch = NotificationBatch(*job)
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            # copy_context : les mesures de la requête en cours suivent l'envoi (core.metrics)
+            in_flight[executor.submit(
+                contextvars.copy_context().run,
+                send_notification_batch,
+                batch.external_ids, batch.send_after, news, headers,
+                batch.batch_num, batch.total_batches, session, batch.content or content
+            )] = batch
+        collect(list(in_flight))
+    
+    return total_success, total_errors
+
+
+def news_audience_queryset(news, frequencies=None):
+    """
+    Destinataires push d'une news, en une seule requête (JOIN
+    PushSubscription → Subscription → NotificationPref) :
+    lignes (external_user_id, frequency), triées par external_user_id
+    pour qu'une reprise saute les batches déjà envoyés (BatchProgress).
+    """
+    queryset = PushSubscription.objects.filter(
+        user__subscription__program_id=news.program_id,
+        user__notificationpref__push_enabled=True,  # Seulement ceux qui ont activé les notifications push
+    )
+    if frequencies:
+        queryset = queryset.filter(user__notificationpref__frequency__in=frequencies)
+    return queryset.order_by('external_user_id').values_list('external_user_id', 'user__notificationpref__frequency')
+
+
+def iter_news_audience(news, frequencies=None, chunk_size=AUDIENCE_CHUNK_SIZE):
+    """
+    news_audience_queryset lu par paquets de `chunk_size` via un curseur :
+    la mémoire reste constante quelle que soit la taille du programme.
+    """
+    return news_audience_queryset(news, frequencies).iterator(chunk_size=chunk_size)
+
+
+def iter_notification_batches(rows, counts, progress=None):
+    """
+    Regroupe un flux (external_user_id, frequency) en batches OneSignal.
     
-    for user_id, frequency in user_to_frequency.items():
-        external_id = user_to_external.get(user_id)
-        if external_id:
-            grouped_by_frequency[frequency].append(external_id)
+    Chaque fréquence a son propre tampon, vidé dès qu'il atteint
+    ONESIGNAL_MAX_IDS_PER_REQUEST. `counts` est rempli au passage avec
+    le nombre de destinataires par fréquence. Les destinataires déjà
+    servis par une tentative précédente (`progress`) sont sautés.
     
-    headers = {
-        "Authorization": "Key os_v2_app_ylnvbv6dnff6taprfh2ekxbg7ngb3ihhyf7ubv5fly6xkadme4errldtej2kd7otllb4h7qm2essieff5c3fd3xieznxi2eir2adlzy",  
-        "Content-Type": "application/json",
-    }
+    Yields:
+        NotificationBatch: clé = fréquence
+    """
+    buffers = {}
+    batch_nums = {}
+    send_after_by_frequency = {}
     
-    total_success = 0
-    total_errors = 0
+    def flush(frequency):
+        batch_nums[frequency] = batch_nums.get(frequency, 0) + 1
+        batch = buffers.pop(frequency)
+        return NotificationBatch(
+            batch, send_after_by_frequency[frequency], f"{frequency} #{batch_nums[frequency]}", key=frequency
+        )
     
-    # Traiter chaque groupe de fréquence
-    for frequency, external_ids in grouped_by_frequency.items():
-        if not external_ids:
+    for external_id, frequency in rows:
+        counts[frequency] = counts.get(frequency, 0) + 1
+        if progress and progress.is_sent(frequency, external_id):
             continue
-        
-        send_after = calculate_send_after_time(frequency)
-        timing_desc = "immédiat" if not send_after else f"programmé pour {send_after}"
-        
-        print(f"📬 Envoi {frequency}: {len(external_ids)} utilisateurs ({timing_desc})...")
-        
-        # Diviser en batches si nécessaire
-        batches = [
-            external_ids[i:i + ONESIGNAL_MAX_IDS_PER_REQUEST]
-            for i in range(0, len(external_ids), ONESIGNAL_MAX_IDS_PER_REQUEST)
-        ]
-        
-        for batch_num, batch_ids in enumerate(batches, 1):
-            success, errors = send_notification_batch(
-                batch_ids, send_after, news, headers, 
-                batch_num, len(batches)
-            )
-            total_success += success
-            total_errors += errors
+        if frequency not in buffers:
+            buffers[frequency] = []
+            if frequency not in send_after_by_frequency:
+                send_after_by_frequency[frequency] = calculate_send_after_time(frequency)
+        buffers[frequency].append(external_id)
+        if len(buffers[frequency]) >= ONESIGNAL_MAX_IDS_PER_REQUEST:
+            yield flush(frequency)
+    
+    for frequency in list(buffers):
+        yield flush(frequency)
+
+
+def add_news_to_digests(news):
+    """
+    Ajoute la news aux digests 'daily' et 'weekly' de la fenêtre en cours.
+    
+    Idempotent : une news n'entre qu'une fois dans chaque digest (le worker
+    d'outbox peut rejouer un envoi).
+    """
+    if not news.program_id:
+        return
+    for frequency in DIGEST_FREQUENCIES:
+        DigestItem.objects.get_or_create(
+            news=news,
+            frequency=frequency,
+            defaults={
+                'program_id': news.program_id,
+                'window_end': calculate_send_after_datetime(frequency),
+            },
+        )
+
+
+def send_news_notification(news, progress=None):
+    """
+    Envoie une notification OneSignal à tous les utilisateurs abonnés
+    au programme de la news validée, en respectant leurs préférences.
+    
+    - Immediate : envoi immédiat
+    - Daily : ajout au digest envoyé demain à 12h00
+    - Weekly : ajout au digest envoyé le prochain samedi à 12h00
+    - push_enabled=False : pas d'envoi
     
-    # Compter ceux qui ont désactivé les notifications
-    disabled_count = len(user_ids) - len(user_to_frequency)
+    Les digests sont envoyés par la commande `send_digests` (voir core.digest).
+    
+    Les destinataires sont lus en flux et envoyés par batches au fil de
+    la lecture (voir iter_news_audience). Avec `progress` (BatchProgress,
+    reprise par l'outbox), les batches déjà envoyés sont sautés et chaque
+    batch réussi y est enregistré.
+    
+    Returns:
+        tuple: (success_count, error_count)
+    """
+    add_news_to_digests(news)
+    
+    counts = {}
+    audience = iter_news_audience(news, frequencies=['immediate'])
+    batches = iter_notification_batches(audience, counts, progress)
+    total_success, total_errors = dispatch_notification_batches(
+        batches, news, ONESIGNAL_HEADERS, on_batch_done=progress and progress.batch_done
+    )
+    
+    if not counts:
+        print("ℹ️ Aucun destinataire push immédiat pour ce programme")
+        return 0, 0
     
     print(f"📊 Résumé final:")
-    print(f"   ✅ {total_success} notifications envoyées/programmées")
+    print(f"   ✅ {total_success} notifications envoyées")
     print(f"   ❌ {total_errors} échecs")
-    print(f"   🚫 {disabled_count} utilisateurs avec push désactivé")
-    print(f"   📈 Total: {len(user_ids)} utilisateurs abonnés")
+    print(f"   📈 Total: {sum(counts.values())} destinataires immédiats")
+    
+    return total_success, total_errors
+
+
+def send_news_group_notification(news_list, progress=None):
+    """
+    Une seule notification pour plusieurs news validées d'un même programme
+    (modération en masse) : l'audience est résolue une fois et chaque
+    destinataire immédiat reçoit un message listant les titres.
+    
+    Les abonnés daily/weekly les reçoivent dans leur digest, comme pour
+    send_news_notification ; `progress` aussi.
+    
+    Returns:
+        tuple: (success_count, error_count)
+    """
+    if len(news_list) == 1:
+        return send_news_notification(news_list[0], progress)
+
+    for news in news_list:
+        add_news_to_digests(news)
+
+    counts = {}
+    audience = iter_news_audience(news_list[0], frequencies=['immediate'])
+    batches = iter_notification_batches(audience, counts, progress)
+    total_success, total_errors = dispatch_notification_batches(
+        batches, news_list[0], ONESIGNAL_HEADERS, content=build_digest_content(news_list),
+        on_batch_done=progress and progress.batch_done,
+    )
+    print(f"📊 {len(news_list)} news groupées : {total_success} envoyées, {total_errors} échecs")
+    return total_success, total_errors
@@ -0,0 +1,294 @@
+import fcntl
+import os
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from .models import News, NewsView
+from .stats import increment_many_news_views
+from .unread import (
+    get_unread_count,
+    record_news_viewed,
+    record_news_viewed_by_user,
+    record_news_viewed_many,
+    unread_news_queryset,
+)
+
+# Ingestion différée des vues (NEWS_VIEW_WRITE_BEHIND) : chaque processus
+# ajoute ses événements à un segment "views-<pid>.log" de VIEW_BUFFER_DIR ;
+# la commande flush_view_buffer les insère par lots. Réglages lus à l'appel.
+
+NEWS_VIEW_FIELDS = ('id', 'program_id', 'moderator_approved', 'moderated_at')
+# Utilisateurs dont les vues déjà en base sont lues en une requête (ingestion)
+INGEST_USERS_CHUNK_SIZE = 500
+
+
+def write_behind_enabled():
+    return getattr(settings, 'NEWS_VIEW_WRITE_BEHIND', False)
+
+
+def view_buffer_dir():
+    return Path(getattr(settings, 'VIEW_BUFFER_DIR', settings.BASE_DIR / 'var' / 'view_buffer'))
+
+
+def open_locked(path, flags, lock=fcntl.LOCK_EX):
+    """
+    Ouvre `path` verrouillé par flock.
+    
+    Le fichier a pu être renommé ou supprimé entre l'ouverture et le
+    verrou (flusher) : on recommence alors sur le fichier courant.
+    
+    Returns:
+        int | None: descripteur verrouillé, None si le fichier n'existe pas
+        (sans O_CREAT)
+    """
+    while True:
+        try:
+            fd = os.open(path, flags, 0o644)
+        except FileNotFoundError:
+            return None
+        fcntl.flock(fd, lock)
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and current.st_ino == os.fstat(fd).st_ino:
+            return fd
+        os.close(fd)
+
+
+def store_news_views(user, news_list):
+    """
+    Insère les NewsView manquantes de `user` en une fois et met à jour
+    les compteurs (bulk_create n'envoie pas de signaux).
+    
+    `news_list` : news chargées avec au moins NEWS_VIEW_FIELDS.
+    
+    Returns:
+        list: les news réellement nouvelles pour cet utilisateur
+    """
+    with transaction.atomic():
+        already_seen = set(
+            NewsView.objects.filter(user=user, news_id__in=[news.id for news in news_list])
+            .values_list('news_id', flat=True)
+        )
+        new_news = [news for news in news_list if news.id not in already_seen]
+        NewsView.objects.bulk_create(
+            [NewsView(user_id=getattr(user, 'pk', user), news_id=news.id) for news in new_news],
+            ignore_conflicts=True,
+        )
+        increment_many_news_views({news.id: 1 for news in new_news})
+        record_news_viewed_many(user, new_news)
+    return new_news
+
+
+def store_news_view(user, news):
+    """
+    Enregistre la lecture d'une news (mark_news_viewed, synchrone et asynchrone).
+    
+    Avec NEWS_VIEW_WRITE_BEHIND, l'événement part dans le buffer
+    (flush_view_buffer) : pas de transaction d'écriture ici.
+    
+    Returns:
+        bool: True si c'est la première lecture de cette news par `user`
+    """
+    if write_behind_enabled():
+        created = (
+            news.id not in get_pending_view_ids(user)
+            and not NewsView.objects.filter(user=user, news=news).exists()
+        )
+        if created:
+            append_view_event(user.id, news.id)
+        return created
+
+    view, created = NewsView.objects.get_or_create(user=user, news=news)
+    if created:
+        record_news_viewed(user, news)
+    return created
+
+
+# --- Vues en attente (lues par les endpoints) ---
+# Un fichier par utilisateur dans VIEW_BUFFER_DIR/pending : partagé par tous
+# les processus comme les segments, mis à jour sous flock.
+def pending_views_path(user_id):
+    return view_buffer_dir() / 'pending' / str(user_id)
+
+
+def get_pending_view_ids(user):
+    """
+    Ids des news vues par `user` mais pas encore insérées en base.
+    """
+    if not write_behind_enabled():
+        return set()
+    fd = open_locked(pending_views_path(user.pk), os.O_RDONLY, fcntl.LOCK_SH)
+    if fd is None:
+        return set()
+    with os.fdopen(fd, 'rb') as pending:
+        return {int(line) for line in pending if line.strip()}
+
+
+def unread_news_with_pending(user):
+    """
+    unread_news_queryset sans les news que `user` vient de lire (buffer).
+    """
+    pending = get_pending_view_ids(user)
+    queryset = unread_news_queryset(user)
+    return queryset.exclude(id__in=pending) if pending else queryset
+
+
+def get_unread_count_with_pending(user):
+    """
+    get_unread_count moins les lectures encore dans le buffer.
+    """
+    count = get_unread_count(user)
+    pending = get_pending_view_ids(user)
+    if pending:
+        count -= unread_news_queryset(user).filter(id__in=pending).count()
+    return max(count, 0)
+
+
+def add_pending_view(user_id, news_id):
+    path = pending_views_path(user_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = open_locked(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(fd, f"{news_id}\n".encode())
+    finally:
+        os.close(fd)
+
+
+def remove_pending_views(user_id, news_ids):
+    """
+    Retire les news insérées ; le fichier est supprimé quand il est vide.
+    """
+    path = pending_views_path(user_id)
+    fd = open_locked(path, os.O_RDWR)
+    if fd is None:
+        return
+    with os.fdopen(fd, 'r+b') as pending:
+        remaining = [line for line in pending if line.strip() and int(line) not in news_ids]
+        if remaining:
+            pending.seek(0)
+            pending.truncate()
+            pending.writelines(remaining)
+        else:
+            # Supprimé sous le verrou : un add_pending_view en attente rouvre un nouveau fichier
+            path.unlink()
+
+
+# --- Segments append-only ---
+def segment_path():
+    return view_buffer_dir() / f'views-{os.getpid()}.log'
+
+
+def append_view_event(user_id, news_id):
+    """
+    Ajoute un événement "user_id,news_id,timestamp" au segment du processus.
+    
+    Le fichier est rouvert à chaque événement : quand le flusher renomme
+    le segment, les écritures suivantes repartent dans un nouveau fichier.
+    Le verrou flock garantit que le flusher ne lit pas une ligne à moitié
+    écrite (voir open_locked).
+    """
+    view_buffer_dir().mkdir(parents=True, exist_ok=True)
+    line = f"{user_id},{news_id},{time.time():.3f}\n".encode()
+    fd = open_locked(segment_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(fd, line)
+        # Fsync de chaque événement : durable même en cas de coupure, plus lent
+        if getattr(settings, 'VIEW_BUFFER_FSYNC', False):
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    add_pending_view(user_id, news_id)
+
+
+def read_segment(path):
+    """
+    Lit les événements d'un segment déjà renommé (attend les écritures en cours).
+    """
+    events = []
+    with open(path, 'rb') as segment:
+        fcntl.flock(segment.fileno(), fcntl.LOCK_EX)
+        for line in segment:
+            try:
+                user_id, news_id, _ = line.decode().strip().split(',')
+                events.append((int(user_id), int(news_id)))
+            except ValueError:
+                continue  # ligne tronquée (coupure pendant l'écriture)
+    return events
+
+
+def ingest_events(events):
+    """
+    Insère un lot d'événements (user_id, news_id) en une transaction :
+    vues déjà en base lues par paquets d'utilisateurs, NewsView insérées
+    en un bulk_create, compteurs mis à jour une fois pour tout le lot.
+    Idempotent : rejouer un segment ne crée pas de doublon.
+    """
+    news_by_id = News.objects.only(*NEWS_VIEW_FIELDS).in_bulk({news_id for _, news_id in events})
+    news_ids_by_user = defaultdict(set)
+    for user_id, news_id in events:
+        if news_id in news_by_id:
+            news_ids_by_user[user_id].add(news_id)
+
+    user_ids = sorted(news_ids_by_user)
+    with transaction.atomic():
+        seen = set()
+        for i in range(0, len(user_ids), INGEST_USERS_CHUNK_SIZE):
+            chunk = user_ids[i:i + INGEST_USERS_CHUNK_SIZE]
+            seen.update(
+                NewsView.objects.filter(
+                    user_id__in=chunk, news_id__in=set().union(*(news_ids_by_user[user_id] for user_id in chunk))
+                ).values_list('user_id', 'news_id')
+            )
+        new_news_by_user = {
+            user_id: [news_by_id[news_id] for news_id in sorted(news_ids) if (user_id, news_id) not in seen]
+            for user_id, news_ids in news_ids_by_user.items()
+        }
+        new_views = [
+            NewsView(user_id=user_id, news_id=news.id)
+            for user_id, news_list in new_news_by_user.items() for news in news_list
+        ]
+        NewsView.objects.bulk_create(new_views, ignore_conflicts=True)
+        increment_many_news_views(Counter(view.news_id for view in new_views))
+        record_news_viewed_by_user(new_news_by_user)
+
+    for user_id, news_ids in news_ids_by_user.items():
+        remove_pending_views(user_id, news_ids)
+    return len(new_views)
+
+
+def flush_view_buffer(max_bytes=0):
+    """
+    Insère en base les segments du buffer.
+    
+    Les segments actifs (*.log) sont renommés en *.flushing avant lecture ;
+    un *.flushing laissé par un flusher interrompu est repris tel quel.
+    Avec `max_bytes`, seuls les segments actifs d'au moins cette taille
+    sont pris.
+    
+    Returns:
+        tuple: (events_count, created_count)
+    """
+    buffer_dir = view_buffer_dir()
+    if not buffer_dir.exists():
+        return 0, 0
+
+    to_flush = sorted(buffer_dir.glob('*.flushing'))
+    for active in sorted(buffer_dir.glob('*.log')):
+        if active.stat().st_size < max(max_bytes, 1):
+            continue
+        target = active.with_name(f'{active.stem}-{time.time_ns()}.flushing')
+        os.rename(active, target)
+        to_flush.append(target)
+
+    total_events = 0
+    total_created = 0
+    for path in to_flush:
+        events = read_segment(path)
+        total_created += ingest_events(events)
+        total_events += len(events)
+        path.unlink()
+    return total_events, total_created
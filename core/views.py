@@ -6,7 +6,7 @@ from .serializers import *
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from .models import Role, NotificationPref
 from rest_framework import status
 from django.contrib.auth.models import User
@@ -14,12 +14,39 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from .models import UserRole
 from .serializers import RoleSerializer
 from .serializers import UserRoleSerializer
-from rest_framework import filters
+from rest_framework import filters, renderers
 from rest_framework.decorators import action
 from .models import PushSubscription, NewsView
 from .serializers import PushSubscriptionSerializer, NewsViewSerializer
-import requests, json
-from .utils import send_news_notification
+import io, requests, json
+from django.utils.dateparse import parse_datetime
+from .authentication import get_user_roles
+from .caching import cached_news_response
+from .fastserializers import NewsRowSerializer, get_sparse_fields
+from .filters import NewsSearchFilter, filter_news_queryset
+from .moderation import BULK_MODERATE_MAX_IDS, moderate_news_bulk
+from .pagination import KeysetPagination, LeaderboardPagination, ViewerPagination
+from .provisioning import (
+    PROVISIONING_CHUNK_SIZE,
+    detect_format,
+    get_shared_hash_pool,
+    parse_user_rows,
+    provision_users,
+)
+from .publication import published_news
+from .stats import LEADERBOARD_DEFAULT_SIZE, LEADERBOARD_MAX_SIZE, leaderboard_queryset
+from .storage import serve_attachment
+from .viewbuffer import (
+    NEWS_VIEW_FIELDS,
+    get_unread_count_with_pending,
+    store_news_view,
+    store_news_views,
+    unread_news_with_pending,
+)
+
+
+# Nombre maximal d'ids acceptés par mark_news_viewed_bulk
+BULK_VIEW_MAX_IDS = 500
 
 
 @api_view(['POST'])
@@ -76,6 +103,40 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser])
+    def import_users(self, request):
+        """
+        Import en masse (admin) : fichier CSV/NDJSON dans `file`, options
+        `programs` (codes séparés par des ';') et `chunk_size`.
+
+        Les mots de passe sont hachés dans le pool partagé du processus
+        (PROVISIONING_API_WORKERS) ; pour une rentrée complète, préférer la
+        commande provision_users.
+        """
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "Fichier requis (champ 'file')."}, status=400)
+        fmt = detect_format(upload.name, upload.content_type)
+        if not fmt:
+            return Response({"error": "Format non reconnu : .csv ou .ndjson attendu."}, status=400)
+
+        try:
+            chunk_size = int(request.data.get('chunk_size', PROVISIONING_CHUNK_SIZE))
+        except (TypeError, ValueError):
+            return Response({"error": "chunk_size doit être un entier."}, status=400)
+        programs = [code.strip() for code in request.data.get('programs', '').split(';') if code.strip()]
+
+        try:
+            report = provision_users(
+                parse_user_rows(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''), fmt),
+                chunk_size=max(chunk_size, 1),
+                default_programs=programs,
+                pool=get_shared_hash_pool(),
+            )
+        except (ValueError, KeyError) as e:
+            return Response({"error": f"Fichier invalide : {e}"}, status=400)
+        return Response(report, status=status.HTTP_201_CREATED)
+
 class RoleViewSet(viewsets.ModelViewSet):
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
@@ -89,58 +150,104 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
     serializer_class = SubscriptionSerializer
 
 class NewsViewSet(viewsets.ModelViewSet):
-    queryset = News.objects.all().order_by('-created_at')
+    # select_related/prefetch_related : nombre de requêtes fixe quel que soit la taille de la page
+    queryset = (
+        News.objects.select_related('program', 'author')
+        .prefetch_related('attachments')
+        .order_by('-created_at')
+    )
     serializer_class = NewsSerializer
+    pagination_class = KeysetPagination
     # 🔍 Activer la recherche et le tri
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # Recherche plein texte FTS5 (appliquée après le tri pour garder le classement par pertinence)
+    filter_backends = [filters.OrderingFilter, NewsSearchFilter]
     search_fields = ['title_draft', 'title_final', 'content_draft', 'content_final', 'program__name']
     ordering_fields = ['created_at', 'publish_date_effective', 'importance']
     ordering = ['-created_at']
+
+    @cached_news_response
+    def list(self, request, *args, **kwargs):
+        return self.paginated_response(self.get_queryset())
+
+    @cached_news_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def paginated_response(self, queryset):
+        # Listes en lignes .values() + ?fields= (voir core.fastserializers)
+        queryset = self.filter_queryset(queryset)
+        serializer = NewsRowSerializer(get_sparse_fields(self.request), self.get_serializer_context())
+        page = self.paginate_queryset(serializer.values(queryset, *KeysetPagination.keyset_fields))
+        return self.get_paginated_response(serializer.serialize(page))
+
     #  Route personnalisée pour les news non modérées
     @action(detail=False, methods=['get'], url_path='pending')
     def pending_news(self, request):
-        pending = News.objects.filter(moderator_approved=False)
-        serializer = self.get_serializer(pending, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.paginated_response(self.get_queryset().filter(moderator_approved=False))
         
      #  Route : news approuvées
     @action(detail=False, methods=['get'], url_path='approved')
+    @cached_news_response
     def approved_news(self, request):
-        approved = News.objects.filter(moderator_approved=True)
-        serializer = self.get_serializer(approved, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Les news programmées n'y entrent qu'à leur publication
+        return self.paginated_response(published_news(self.get_queryset()))
+
+    #  Route : validation / refus en masse
+    @action(detail=False, methods=['post'], url_path='moderate', permission_classes=[IsAuthenticated])
+    def moderate(self, request):
+        """
+        Corps : {"news_ids": [1, 2, 3], "approved": true, "comment": "..."}
+        
+        Une transaction pour tout le lot, et une seule notification par
+        programme pour les news nouvellement validées (voir core.moderation).
+        """
+        news_ids = request.data.get('news_ids')
+        approved = request.data.get('approved')
+        if not isinstance(news_ids, list) or not news_ids or len(news_ids) > BULK_MODERATE_MAX_IDS:
+            return Response({'error': f'news_ids doit être une liste de 1 à {BULK_MODERATE_MAX_IDS} ids'}, status=400)
+        if not isinstance(approved, bool):
+            return Response({'error': 'approved doit être true ou false'}, status=400)
+        try:
+            news_ids = {int(news_id) for news_id in news_ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'news_ids doit contenir des entiers'}, status=400)
+
+        result = moderate_news_bulk(news_ids, approved, request.user, request.data.get('comment') or '')
+        return Response(result)
 
     #  Route : news refusées ou invalidées
     @action(detail=False, methods=['get'], url_path='rejected')
     def rejected_news(self, request):
-        rejected = News.objects.filter(moderator_approved=False)
-        serializer = self.get_serializer(rejected, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.paginated_response(self.get_queryset().filter(moderator_approved=False))
 
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        program_id = self.request.query_params.get('program_id')
-        author_id = self.request.query_params.get('author_id')
-        importance = self.request.query_params.get('importance')
-
-        if program_id:
-            queryset = queryset.filter(program_id=program_id)
-        if author_id:
-            queryset = queryset.filter(author_id=author_id)
-        if importance:
-            queryset = queryset.filter(importance=importance)
-
-        return queryset
+        return filter_news_queryset(super().get_queryset(), self.request.query_params)
 
 class ModerationViewSet(viewsets.ModelViewSet):
     queryset = Moderation.objects.all()
     serializer_class = ModerationSerializer
 
+class PassthroughRenderer(renderers.BaseRenderer):
+    """
+    Accepte n'importe quel Accept : la réponse binaire est construite à la main.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
 class AttachmentViewSet(viewsets.ModelViewSet):
     queryset = Attachment.objects.all()
     serializer_class = AttachmentSerializer
 
+    @action(detail=True, methods=['get'], url_path='download', renderer_classes=[PassthroughRenderer])
+    def download(self, request, pk=None):
+        # Flux par morceaux avec Range / If-None-Match, ou délégué au serveur web
+        return serve_attachment(request, self.get_object())
+
 class PublicationLogViewSet(viewsets.ModelViewSet):
     queryset = PublicationLog.objects.all()
     serializer_class = PublicationLogSerializer
@@ -173,9 +280,8 @@ class NewsViewViewSet(viewsets.ModelViewSet):
 @permission_classes([IsAuthenticated])
 def current_user(request):
     user = request.user
-    # Récupérer les rôles associés à ce user
-    user_roles = UserRole.objects.filter(user=user).select_related('role')
-    roles_data = [RoleSerializer(ur.role).data for ur in user_roles]
+    # Rôles associés à ce user (cache d'authentification, sans requête si chaud)
+    roles_data = RoleSerializer(get_user_roles(user), many=True).data
 
     return Response({
         "id": user.id,
@@ -219,27 +325,80 @@ def mark_news_viewed(request, news_id):
     except News.DoesNotExist:
         return Response({'error': 'News not found'}, status=404)
 
-    view, created = NewsView.objects.get_or_create(user=user, news=news)
-    return Response({'viewed': True, 'created': created})
+    return Response({'viewed': True, 'created': store_news_view(user, news)})
 
 
-# ✅ Lister les news non encore vues selon abonnements
+# ✅ Marquer plusieurs news comme vues en une requête
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_news_viewed_bulk(request):
+    """
+    Corps accepté (un seul des trois) :
+    - {"news_ids": [1, 2, 3]} : ces news (au plus BULK_VIEW_MAX_IDS)
+    - {"up_to_news_id": 42} : toutes les non lues jusqu'à cette news incluse
+      (ordre du fil : created_at décroissant)
+    - {"up_to": "2025-11-05T12:00:00Z"} : toutes les non lues créées avant cette date
+    
+    Retourne le nombre de vues créées et le nouveau nombre de non lues.
+    """
+    user = request.user
+    news_ids = request.data.get('news_ids')
+    up_to_news_id = request.data.get('up_to_news_id')
+    up_to = request.data.get('up_to')
+
+    fields = NEWS_VIEW_FIELDS
+    if news_ids is not None:
+        if not isinstance(news_ids, list) or len(news_ids) > BULK_VIEW_MAX_IDS:
+            return Response({'error': f'news_ids doit être une liste de {BULK_VIEW_MAX_IDS} ids au plus'}, status=400)
+        try:
+            news_ids = {int(news_id) for news_id in news_ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'news_ids doit contenir des entiers'}, status=400)
+        news_list = News.objects.filter(id__in=news_ids).only(*fields)
+    elif up_to_news_id is not None or up_to is not None:
+        if up_to_news_id is not None:
+            try:
+                up_to_news_id = int(up_to_news_id)
+            except (TypeError, ValueError):
+                return Response({'error': 'up_to_news_id doit être un entier'}, status=400)
+            up_to = News.objects.filter(id=up_to_news_id).values_list('created_at', flat=True).first()
+            if up_to is None:
+                return Response({'error': 'News introuvable'}, status=404)
+        else:
+            try:
+                up_to = parse_datetime(str(up_to))
+            except ValueError:  # format ISO mais date impossible (mois 13...)
+                up_to = None
+            if up_to is None:
+                return Response({'error': 'up_to doit être une date ISO 8601'}, status=400)
+        news_list = unread_news_with_pending(user).filter(created_at__lte=up_to).only(*fields)
+    else:
+        return Response({'error': 'news_ids, up_to_news_id ou up_to requis'}, status=400)
+
+    new_news = store_news_views(user, list(news_list))
+    return Response({'viewed': True, 'created': len(new_news), 'unread_count': get_unread_count_with_pending(user)})
+
+
+# ✅ Lister les news non encore vues selon abonnements (paginé par curseur)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def unread_news(request):
     user = request.user
-    from .models import News, Subscription
+    paginator = KeysetPagination()
+    serializer = NewsRowSerializer(get_sparse_fields(request))
+    unread = serializer.values(unread_news_with_pending(user), *paginator.keyset_fields)
+    page = paginator.paginate_queryset(unread, request)
 
-    subscribed_programs = Subscription.objects.filter(user=user).values_list('program_id', flat=True)
-    seen_news = NewsView.objects.filter(user=user).values_list('news_id', flat=True)
+    response = paginator.get_paginated_response(serializer.serialize(page))
+    response.data['unread_count'] = get_unread_count_with_pending(user)
+    return response
 
-    unread = News.objects.filter(
-        program_id__in=subscribed_programs,
-        moderator_approved=True
-    ).exclude(id__in=seen_news)
 
-    serializer = NewsSerializer(unread, many=True)
-    return Response(serializer.data)
+# ✅ Nombre de news non lues (badge)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_news_count(request):
+    return Response({'unread_count': get_unread_count_with_pending(request.user)})
 
 
 @api_view(['PATCH', 'PUT'])
@@ -247,24 +406,24 @@ def unread_news(request):
 def update_news(request, pk):
     """
     Permet de mettre à jour une news (modérateurs/admins),
-    et déclenche une notification push OneSignal si la news
+    et programme une notification push OneSignal si la news
     vient d'être validée (moderator_approved=True).
+    
+    L'envoi est fait par le worker `process_outbox` : l'entrée d'outbox
+    est écrite dans la même transaction que la validation (News.save, voir
+    core.publication), comme pour PATCH /news/<pk>/ ou l'admin. Si une date
+    de publication future est demandée, c'est `run_scheduler` qui publiera.
     """
     try:
         news = News.objects.get(pk=pk)
     except News.DoesNotExist:
         return Response({'error': 'News introuvable'}, status=404)
 
-    old_state = news.moderator_approved  # on garde l'ancien état
     serializer = NewsSerializer(news, data=request.data, partial=True)
 
     if serializer.is_valid():
+        # (Dé-)validation : non lues, outbox et flux temps réel dans News.save()
         serializer.save()
-
-        # Si la news vient d'être validée, envoyer la notification
-        if not old_state and serializer.data.get('moderator_approved'):
-            send_news_notification(news)
-
         return Response(serializer.data)
     else:
         return Response(serializer.errors, status=400)
@@ -274,19 +433,24 @@ def update_news(request, pk):
 @permission_classes([IsAuthenticated])
 def news_views_count(request, news_id=None):
     """
-    - Si news_id est fourni : retourne le nombre de vues pour cette news.
-    - Sinon : retourne la liste des news avec leur nombre total de vues.
+    - Si news_id est fourni : retourne le nombre de vues pour cette news
+      et la liste paginée (curseur) de ses lecteurs.
+    - Sinon : retourne le classement des news les plus vues (?limit= news
+      par page, 50 par défaut ; page suivante dans l'en-tête Link).
+    
+    Les compteurs sont maintenus à l'écriture (NewsStats) : aucun COUNT.
     """
-    from .models import News, NewsView
-
     if news_id:
         try:
-            news = News.objects.get(id=news_id)
+            news = News.objects.select_related('stats').get(id=news_id)
         except News.DoesNotExist:
             return Response({'error': 'News introuvable'}, status=404)
 
-        count = NewsView.objects.filter(news=news).count()
-        viewers = NewsView.objects.filter(news=news).select_related('user')
+        stats = getattr(news, 'stats', None)
+        paginator = ViewerPagination()
+        viewers = paginator.paginate_queryset(
+            NewsView.objects.filter(news=news).select_related('user'), request
+        )
         viewers_list = [
             {
                 'id': v.user.id,
@@ -299,16 +463,25 @@ def news_views_count(request, news_id=None):
         return Response({
             'news_id': news.id,
             'title_final': news.title_final or news.title_draft,
-            'views_count': count,
-            'viewers': viewers_list
+            'views_count': stats.views_count if stats else 0,
+            'viewers': viewers_list,
+            'next': paginator.get_next_link(),
         })
 
     else:
-        # Récupère toutes les news avec leur nombre total de vues
-        from django.db.models import Count
-        stats = (
-            News.objects.annotate(views_count=Count('views'))
-            .values('id', 'title_final', 'views_count')
-            .order_by('-views_count')
-        )
-        return Response(list(stats))
+        try:
+            limit = int(request.query_params.get('limit', LEADERBOARD_DEFAULT_SIZE))
+        except ValueError:
+            return Response({'error': 'limit doit être un entier'}, status=400)
+
+        paginator = LeaderboardPagination()
+        paginator.page_size = max(1, min(limit, LEADERBOARD_MAX_SIZE))
+        stats = [
+            {
+                'id': row['news_id'],
+                'title_final': row['news__title_final'],
+                'views_count': row['views_count'],
+            }
+            for row in paginator.paginate_queryset(leaderboard_queryset(), request)
+        ]
+        return paginator.get_paginated_response(stats)